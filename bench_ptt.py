@@ -0,0 +1,441 @@
+"""Micro-benchmarks for the Magic Push-to-Talk detection hot path.
+
+Runs headless: pyaudio is replaced by a stub before anything imports it and
+key presses go to the in-memory recording backend, so no sound card, Windows
+or pynput is needed.
+Each case is timed on deterministic synthetic audio (silence, pink noise,
+speech-like bursts and clicks) at several sample rates and reports the time
+and the peak memory allocated per buffer.
+
+    python bench_ptt.py                  # run and compare with bench_baseline.json
+    python bench_ptt.py --save-baseline  # record the current numbers as the baseline
+    python bench_ptt.py --stability [session.wav ...]  # median vs adaptive noise floor
+
+The exit status is 1 when any case is slower than its baseline by more than
+--tolerance, or allocates more than it used to, and with --require-baseline
+also when there is no baseline. Times are compared relative
+to a fixed reference workload timed in the same run, so a machine that is
+uniformly faster or slower than the one that saved the baseline (or a
+throttled CPU) doesn't show up as a regression.
+
+--stability replays a long synthetic session (talking with few pauses, then
+a fan turning on and off) or the given recordings through both noise floor
+modes and compares how far the threshold wanders and how much speech it
+gates out.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+import numpy as np
+
+
+def install_stubs():
+    """Register a stand-in for the PortAudio module the capture path imports."""
+    pyaudio = types.ModuleType('pyaudio')
+    pyaudio.paInt16 = 8
+    pyaudio.paContinue = 0
+    pyaudio.PyAudio = None
+    sys.modules.setdefault('pyaudio', pyaudio)
+
+
+install_stubs()
+
+from capture_engine import CaptureEngine  # noqa: E402
+from detection_engine import DetectionEngine, LevelMeter, read_wav  # noqa: E402
+
+
+REFERENCE = '_reference'
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+RATES = (16000, 44100, 48000)
+CHUNK = 1024
+SIGNAL_SECONDS = 4
+
+
+# Synthetic corpus
+
+def silence(rate, rng):
+    return np.zeros(rate * SIGNAL_SECONDS, dtype=np.int16)
+
+
+def pink_noise(rate, rng, level=300):
+    n = rate * SIGNAL_SECONDS
+    spectrum = np.fft.rfft(rng.standard_normal(n))
+    freqs = np.fft.rfftfreq(n)
+    freqs[0] = freqs[1]
+    noise = np.fft.irfft(spectrum / np.sqrt(freqs), n)
+    noise *= level / noise.std()
+    return noise.astype(np.int16)
+
+
+def speech_bursts(rate, rng):
+    # Harmonic "syllables" with a wobbling pitch, 4 per second, over pink noise
+    n = rate * SIGNAL_SECONDS
+    t = np.arange(n) / rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 2 * t), 0, None) ** 2
+    signal = voice * envelope * 4000 + pink_noise(rate, rng)
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def clicks(rate, rng):
+    # Keyboard-like transients: 2 ms decaying noise bursts every ~150 ms
+    signal = pink_noise(rate, rng).astype(float)
+    length = int(rate * 0.002)
+    decay = np.exp(-np.arange(length) / (length / 4))
+    for start in range(0, len(signal) - length, int(rate * 0.15)):
+        signal[start:start + length] += rng.standard_normal(length) * 12000 * decay
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+SIGNALS = {
+    'silence': silence,
+    'pink': pink_noise,
+    'speech': speech_bursts,
+    'clicks': clicks,
+}
+
+
+def make_corpus(rate, seed=1234):
+    rng = np.random.default_rng(seed)
+    corpus = {}
+    for name, generate in SIGNALS.items():
+        signal = generate(rate, rng)
+        buffers = len(signal) // CHUNK
+        corpus[name] = [signal[i * CHUNK:(i + 1) * CHUNK] for i in range(buffers)]
+    return corpus
+
+
+# Cases: each builds a callable that processes one buffer
+
+def calibrated_engine(rate, buffers, **kwargs):
+    engine = DetectionEngine(rate, CHUNK, **kwargs)
+    engine.reset(threshold=-40.0)
+    for data in buffers:
+        engine.process(data)
+    return engine
+
+
+def case_get_audio_level(rate, buffers):
+    engine = DetectionEngine(rate, CHUNK)
+    return engine.get_audio_level
+
+
+def case_level_meter(rate, buffers):
+    return LevelMeter(CHUNK, CHUNK * 4).measure
+
+
+def case_noise_floor(rate, buffers):
+    engine = calibrated_engine(rate, buffers)
+    levels = [engine.get_audio_level(data) for data in buffers]
+    state = {'i': 0}
+
+    def step(data):
+        i = state['i'] = (state['i'] + 1) % len(levels)
+        engine.noise_floor.append(levels[i])
+        return engine.update_threshold()
+    return step
+
+
+def case_noise_floor_adaptive(rate, buffers):
+    # NoiseFloorTracker instead of the rolling median; compare with `noise_floor`
+    engine = calibrated_engine(rate, buffers)
+    engine.noise_tracking = 'adaptive'
+    levels = [engine.get_audio_level(data) for data in buffers]
+    state = {'i': 0}
+
+    def step(data):
+        i = state['i'] = (state['i'] + 1) % len(levels)
+        engine.noise_floor.append(levels[i])
+        return engine.update_threshold()
+    return step
+
+
+def case_decision_adaptive(rate, buffers):
+    engine = calibrated_engine(rate, buffers)
+    engine.noise_tracking = 'adaptive'
+    return engine.process
+
+
+def case_calibration(rate, buffers):
+    engine = DetectionEngine(rate, CHUNK, calibration_total=10 ** 9)
+    engine.reset()
+    return engine.process
+
+
+def case_decision(rate, buffers):
+    return calibrated_engine(rate, buffers).process
+
+
+def case_decision_hop128(rate, buffers):
+    return calibrated_engine(rate, buffers, hop_size=128).process
+
+
+def case_decision_vad(rate, buffers):
+    engine = calibrated_engine(rate, buffers, hop_size=256)
+    engine.vad_enabled = True
+    return engine.process
+
+
+def case_decision_vad_16k(rate, buffers):
+    # Spectral VAD on hops decimated to ~16 kHz; compare with `decision_vad`
+    engine = calibrated_engine(rate, buffers, hop_size=256, analysis_rate=16000)
+    engine.vad_enabled = True
+    return engine.process
+
+
+def case_decision_4ch(rate, buffers):
+    # Same signal on four channels, delayed per channel; compare with 4x `decision`
+    engine = DetectionEngine(rate, CHUNK, channels=4)
+    engine.reset(threshold=-40.0)
+    interleaved = [np.stack([np.roll(data, 37 * c) for c in range(4)], axis=1).ravel() for data in buffers]
+    for data in interleaved:
+        engine.process(data)
+    state = {'i': 0}
+
+    def step(data):
+        i = state['i'] = (state['i'] + 1) % len(interleaved)
+        return engine.process(interleaved[i])
+    return step
+
+
+def case_capture(rate, buffers, show_history=False):
+    capture = CaptureEngine(None, None, 8, 1, rate, CHUNK, 5, 100, key_backend='recording')
+    capture.show_history = show_history
+    capture.detector.reset(threshold=-40.0)
+    capture.injector.start()
+    clock = {'t': 0.0}
+
+    def step(data):
+        clock['t'] += CHUNK / rate
+        capture.process(data, clock['t'], clock['t'], 0.0)
+    return step
+
+
+def case_capture_history(rate, buffers):
+    # Also draws every hop into the level history; compare with `capture`
+    return case_capture(rate, buffers, show_history=True)
+
+
+CASES = {
+    'get_audio_level': case_get_audio_level,
+    'level_meter': case_level_meter,
+    'noise_floor': case_noise_floor,
+    'noise_floor_adaptive': case_noise_floor_adaptive,
+    'calibration': case_calibration,
+    'decision': case_decision,
+    'decision_adaptive': case_decision_adaptive,
+    'decision_hop128': case_decision_hop128,
+    'decision_vad': case_decision_vad,
+    'decision_vad_16k': case_decision_vad_16k,
+    'decision_4ch': case_decision_4ch,
+    'capture': case_capture,
+    'capture_history': case_capture_history,
+}
+
+
+def measure(step, buffers, min_time):
+    """Return (ns per buffer, peak bytes allocated per buffer) for `step`."""
+    for data in buffers:  # warm up scratch buffers and caches
+        step(data)
+
+    best = float('inf')
+    calls = 0
+    spent = 0.0
+    while spent < min_time or calls < 3:
+        started = time.perf_counter_ns()
+        for data in buffers:
+            step(data)
+        elapsed = time.perf_counter_ns() - started
+        best = min(best, elapsed / len(buffers))
+        spent += elapsed / 1e9
+        calls += 1
+
+    tracemalloc.start()
+    peak = 0
+    for data in buffers:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        step(data)
+        peak += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return best, peak / len(buffers)
+
+
+def reference_workload(data):
+    # Fixed mix of interpreter and small-array numpy work, like the hot path
+    total = 0.0
+    for value in data[:64].tolist():
+        total += value * 0.5
+    return total + float(np.sort(data).sum())
+
+
+def run(cases, rates, signals, min_time):
+    rng = np.random.default_rng(0)
+    reference = [rng.standard_normal(CHUNK) for _ in range(64)]
+    results = {REFERENCE: {'ns_per_buffer': measure(reference_workload, reference, min_time)[0],
+                           'bytes_per_buffer': 0.0}}
+    for rate in rates:
+        corpus = make_corpus(rate)
+        for signal in signals:
+            buffers = corpus[signal]
+            for name in cases:
+                ns, allocated = measure(CASES[name](rate, buffers), buffers, min_time)
+                results[f"{name}/{signal}/{rate}"] = {'ns_per_buffer': ns, 'bytes_per_buffer': allocated}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    speed = 1.0
+    if REFERENCE in baseline:
+        speed = results[REFERENCE]['ns_per_buffer'] / baseline[REFERENCE]['ns_per_buffer']
+        print(f"Reference workload runs {speed:.2f}x the baseline time; ratios are scaled by it.")
+    print(f"{'case':<36}{'ns/buffer':>12}{'B/buffer':>10}{'baseline':>12}{'ratio':>8}")
+    for key, result in results.items():
+        if key == REFERENCE:
+            continue
+        ns = result['ns_per_buffer']
+        allocated = result['bytes_per_buffer']
+        line = f"{key:<36}{ns:>12,.0f}{allocated:>10,.0f}"
+        previous = baseline.get(key)
+        if previous:
+            ratio = ns / previous['ns_per_buffer'] / speed
+            line += f"{previous['ns_per_buffer']:>12,.0f}{ratio:>8.2f}"
+            if ratio > tolerance:
+                regressions.append(f"{key}: {ns:,.0f} ns/buffer vs baseline {previous['ns_per_buffer']:,.0f}")
+            # Allow some slack for interpreter bookkeeping
+            if allocated > previous['bytes_per_buffer'] * tolerance + 256:
+                regressions.append(f"{key}: {allocated:,.0f} B/buffer vs baseline {previous['bytes_per_buffer']:,.0f}")
+        print(line)
+    return regressions
+
+
+# Threshold stability: median vs adaptive noise floor over long sessions
+
+def long_session(rate, rng):
+    """150 s: noise, a minute of talking with short pauses, noise, 30 s of a 12 dB louder fan, noise.
+
+    Returns the int16 signal and a per-frame speech mask.
+    """
+    n = rate * 150
+    t = np.arange(n) / rate
+    noise = pink_noise(rate, rng)
+    noise = np.resize(noise, n)  # pink_noise() is SIGNAL_SECONDS long; repeat it
+    noise[(t >= 100) & (t < 130)] *= 4
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    voice = sum(np.sin(k * 2 * np.pi * np.cumsum(pitch) / rate) / k for k in range(1, 12))
+    # Syllables with a 100 ms pause every 0.8 s, the way running speech leaves gaps between words
+    speech = (t >= 20) & (t < 80) & (t % 0.8 >= 0.1)
+    voice *= (0.6 + 0.4 * np.abs(np.sin(2 * np.pi * 3 * t))) * speech * 4000
+    return np.clip(voice + noise, -32768, 32767).astype(np.int16), speech
+
+
+def threshold_stability(data, rate, tracking, speech=None):
+    """Replay `data` with one noise floor mode; return threshold percentiles, held/clipped shares and cost."""
+    chunk = int(rate * 0.02)
+    engine = DetectionEngine(rate, chunk)
+    engine.timeout_duration = 0.0
+    engine.hysteresis = 3.0
+    engine.noise_tracking = tracking
+    engine.reset()
+    buffers = len(data) // chunk
+    thresholds = np.full(buffers, np.nan)
+    held = np.zeros(buffers, dtype=bool)
+    started = time.perf_counter()
+    for i in range(buffers):
+        engine.process(data[i * chunk:(i + 1) * chunk])
+        if engine.threshold is not None and not engine.is_calibrating:
+            thresholds[i] = engine.threshold
+        held[i] = engine.gate_open
+    elapsed = time.perf_counter() - started
+    valid = thresholds[~np.isnan(thresholds)]
+    result = {'p5': np.percentile(valid, 5), 'p50': np.percentile(valid, 50), 'p95': np.percentile(valid, 95),
+              'held': held.mean() * 100, 'us': elapsed / buffers * 1e6, 'clipped': None, 'false': None}
+    if speech is not None:
+        talking = speech[:buffers * chunk].reshape(buffers, chunk).mean(axis=1) > 0.5
+        quiet = ~speech[:buffers * chunk].reshape(buffers, chunk).any(axis=1)
+        result['clipped'] = (talking & ~held).sum() / max(talking.sum(), 1) * 100
+        result['false'] = (quiet & held).sum() / max(quiet.sum(), 1) * 100
+    return result
+
+
+def stability(paths):
+    if paths:
+        sessions = []
+        for path in paths:
+            data, rate = read_wav(path)
+            sessions.append((path, data, rate, None))
+    else:
+        rate = 16000
+        data, speech = long_session(rate, np.random.default_rng(1234))
+        sessions = [('synthetic 150 s', data, rate, speech)]
+    print(f"{'session':<24}{'mode':<10}{'thr p5':>8}{'p50':>8}{'p95':>8}{'spread':>8}"
+          f"{'held %':>8}{'clipped %':>10}{'false %':>9}{'us/buf':>8}")
+    for name, data, rate, speech in sessions:
+        for tracking in DetectionEngine.NOISE_TRACKING:
+            r = threshold_stability(data, rate, tracking, speech)
+            clipped = '' if r['clipped'] is None else f"{r['clipped']:.1f}"
+            false = '' if r['false'] is None else f"{r['false']:.1f}"
+            print(f"{name[-23:]:<24}{tracking:<10}{r['p5']:>8.1f}{r['p50']:>8.1f}{r['p95']:>8.1f}"
+                  f"{r['p95'] - r['p5']:>8.1f}{r['held']:>8.1f}{clipped:>10}{false:>9}{r['us']:>8.1f}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Magic PTT detection hot path.")
+    parser.add_argument('--case', action='append', choices=sorted(CASES), help="only run these cases")
+    parser.add_argument('--signal', action='append', choices=sorted(SIGNALS), help="only use these signals")
+    parser.add_argument('--rate', action='append', type=int, help="only use these sample rates")
+    parser.add_argument('--min-time', type=float, default=0.2, help="seconds to time each case for (default: 0.2)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="baseline file (default: bench_baseline.json)")
+    parser.add_argument('--save-baseline', action='store_true', help="write the results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=1.25,
+                        help="allowed slowdown against the baseline (default: 1.25)")
+    parser.add_argument('--require-baseline', action='store_true',
+                        help="exit with status 1 when there is no baseline to compare with (for CI)")
+    parser.add_argument('--stability', nargs='*', metavar='WAV',
+                        help="compare the median and adaptive noise floors on these recordings "
+                             "(default: a synthetic 150 s session) instead of timing the cases")
+    args = parser.parse_args(argv)
+
+    if args.stability is not None:
+        return stability(args.stability)
+
+    results = run(args.case or list(CASES), args.rate or RATES, args.signal or list(SIGNALS), args.min_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    elif not baseline:
+        print("No baseline found; run with --save-baseline to record one.")
+        if args.require_baseline:
+            return 1
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
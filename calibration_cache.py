@@ -0,0 +1,133 @@
+"""Per-device calibration cache for Magic Push-to-Talk.
+
+Keeps a compact histogram of the noise floor window of every microphone,
+keyed by device name, host API and sample rate, so monitoring starts with a
+valid threshold instead of calibrating for several seconds. The adaptive
+noise floor keeps its own entries (`... | 48000 | adaptive`), as it stores a
+single estimate rather than a window of levels:
+
+    [Microphone (USB Audio) | Windows WASAPI | 48000]
+    updated = 1760000000
+    channel_0 = -64.5:3,12,40,22,5,0*12,2
+
+A histogram is the level of its first bin in dB followed by the counts
+of consecutive RESOLUTION dB bins, with `0*n` standing for n empty bins. Entries not updated for `max_age_days`
+are dropped, as are the oldest ones beyond `max_entries`. store() updates a
+single entry and replaces the file through a temporary copy, so a crash
+never leaves it half written.
+"""
+import configparser
+import os
+import time
+
+import numpy as np
+
+
+class CalibrationCache:
+    RESOLUTION = 0.5  # dB per histogram bin
+
+    def __init__(self, path, max_age_days=30, max_entries=32):
+        self.path = path
+        self.max_age = max_age_days * 24 * 3600
+        self.max_entries = max_entries
+
+    @staticmethod
+    def device_key(name, host_api, rate, noise_tracking='median'):
+        key = f"{name} | {host_api} | {int(rate)}"
+        return key if noise_tracking == 'median' else f"{key} | {noise_tracking}"
+
+    def read(self):
+        config = configparser.ConfigParser(interpolation=None)
+        if os.path.exists(self.path):
+            try:
+                config.read(self.path, encoding='utf-8')
+            except configparser.Error as e:
+                print(f"Error reading calibration cache: {str(e)}. Starting a new one.")
+                config = configparser.ConfigParser(interpolation=None)
+        return config
+
+    def load(self, key, channels=1):
+        """Return noise levels for DetectionEngine.seed_noise_floor(), or None without a usable entry."""
+        config = self.read()
+        if not config.has_section(key):
+            return None
+        section = config[key]
+        try:
+            if time.time() - float(section.get('updated', '0')) > self.max_age:
+                return None
+            levels = [self.expand(section[f'channel_{channel}']) for channel in range(channels)]
+        except KeyError:
+            return None  # calibrated with fewer channels
+        except ValueError as e:
+            print(f"Invalid calibration for '{key}': {str(e)}. Will calibrate on start.")
+            return None
+        if not len(levels[0]) or any(len(channel) != len(levels[0]) for channel in levels):
+            return None
+
+        levels = np.stack(levels, axis=1)
+        # Shuffle, so whatever the noise window rolls out first is a fair sample of the rest
+        levels = levels[np.random.default_rng(0).permutation(len(levels))]
+        return levels[:, 0] if channels == 1 else levels
+
+    def store(self, key, levels):
+        """Save the noise levels of one device (as returned by DetectionEngine.noise_levels())."""
+        levels = np.asarray(levels, dtype=float)
+        levels = levels.reshape(len(levels), -1)
+        config = self.read()
+        config[key] = {'updated': str(int(time.time()))}
+        for channel in range(levels.shape[1]):
+            config[key][f'channel_{channel}'] = self.compress(levels[:, channel])
+        self.evict(config)
+
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                config.write(f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Error saving calibration cache: {str(e)}")
+
+    def evict(self, config):
+        now = time.time()
+        entries = []
+        for key in config.sections():
+            try:
+                updated = float(config[key].get('updated', '0'))
+            except ValueError:
+                updated = 0.0
+            if now - updated > self.max_age:
+                config.remove_section(key)
+            else:
+                entries.append((updated, key))
+        for _, key in sorted(entries, reverse=True)[self.max_entries:]:
+            config.remove_section(key)
+
+    def compress(self, levels):
+        bins = np.rint(levels / self.RESOLUTION).astype(int)
+        first = int(bins.min())
+        counts = np.bincount(bins - first).tolist()
+        tokens = []
+        empty = 0
+        for count in counts + [None]:
+            if count == 0:
+                empty += 1
+                continue
+            if empty:
+                tokens.extend(['0'] * empty if empty < 3 else [f"0*{empty}"])
+                empty = 0
+            if count is not None:
+                tokens.append(str(count))
+        return f"{first * self.RESOLUTION:g}:" + ','.join(tokens)
+
+    def expand(self, text):
+        start, _, tokens = text.partition(':')
+        start = float(start)
+        counts = []
+        for token in tokens.split(','):
+            if token.startswith('0*'):
+                counts.extend([0] * int(token[2:]))
+            else:
+                counts.append(int(token))
+        if any(count < 0 for count in counts):
+            raise ValueError("negative histogram count")
+        return np.repeat(start + np.arange(len(counts)) * self.RESOLUTION, counts)
@@ -0,0 +1,382 @@
+"""Real-time capture for Magic Push-to-Talk.
+
+CaptureEngine owns the PortAudio input streams. Detection runs on the
+streams' callback threads, away from the Qt event loop, and key presses are
+handed to a KeyInjector thread so the callback never waits on the OS.
+
+Several microphones can drive one key: each device gets its own stream and
+detector (which in turn gates every channel against its own noise floor),
+and the per-device gates are combined with the same any/all/weighted rule
+the detectors use for their channels.
+
+In the default 'callback' mode PortAudio hands over one buffer at a time.
+The 'blocking' mode runs a reader thread per stream instead. Each pass
+drains everything queued (get_read_available) into one batch, skips queued
+audio older than the latency budget, and survives input overflows. Both
+modes count overruns and dropped frames.
+
+With session_log set to a directory, every hop and key event is also
+recorded by a SessionRecorder (session_log.py) while monitoring. The primary
+device's hops are drawn into `history`, a LevelHistory (level_history.py)
+the window shows, unless configure() turned show_history off.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+import pyaudio
+
+from detection_engine import DetectionEngine
+from key_injection import KeyInjector, create_backend
+from level_history import LevelHistory
+from latency_trace import LatencyTracer, KIND_PRESS, KIND_RELEASE
+
+
+class CaptureEngine:
+    """Feeds PortAudio callback buffers into a DetectionEngine and drives the push-to-talk key.
+
+    The GUI never touches the stream; it pushes settings in with configure()
+    and pulls throttled state snapshots out with get_snapshot(). DSPWorkerClient
+    (dsp_worker.py) offers the same interface for a CaptureEngine running in
+    another process.
+    """
+
+    def __init__(self, p, device_index, fmt, channels, rate, chunk, window_duration, calibration_total,
+                 noise_percentile=50, hop_size=None, key_backend=None, extra_devices=(), capture_mode='callback',
+                 latency_budget=0.1, analysis_rate=None, session_log=None):
+        self.p = p
+        self.device_index = device_index
+        self.FORMAT = fmt
+        self.CHANNELS = channels
+        self.RATE = rate
+        self.CHUNK = chunk
+
+        # (device index, channel count) per input; the first one is the primary device
+        self.sources = [(device_index, channels)] + list(extra_devices)
+        self.detectors = [DetectionEngine(rate, chunk, window_duration, calibration_total, noise_percentile,
+                                          hop_size, source_channels, analysis_rate)
+                          for _, source_channels in self.sources]
+        self.detector = self.detectors[0]
+        self.streams = []
+        self.capture_mode = capture_mode
+        self.latency_budget = latency_budget  # s of queued audio kept in blocking mode; older audio is dropped
+        self.readers = []
+        self.running = False
+        self.overruns = 0  # input overflows reported by PortAudio
+        self.dropped_frames = 0  # frames lost to overflows or skipped as stale
+        self.backlog_frames = 0  # frames queued before the last blocking read
+        self.lock = threading.Lock()
+        self.gate_lock = threading.Lock()  # serializes the key decision across device callbacks
+
+        # Settings, written by the GUI thread and read by the callback
+        self.ptt_key = 0x56
+        self.test_mode = False
+        self.show_history = True
+
+        self.ptt_active = False
+        self.pressed_key = None
+        self.tracer = LatencyTracer()
+        self.injector = KeyInjector(create_backend(key_backend), on_injected=self._on_injected)
+        self.publish = None  # called with every new snapshot, on the audio thread
+        self.session_log = session_log  # directory for session logs, None = off
+        self.recorder = None
+        self.history = LevelHistory(rate, self.detector.HOP)  # replaced by a shared one in the DSP worker
+        self.snapshot = {'seq': 0, 'level': None, 'threshold': None, 'state': 'idle', 'calibration_progress': 0,
+                         'dsp_cost': (0.0, 0.0), 'channel_levels': [], 'channel_thresholds': []}
+
+    @property
+    def stream(self):
+        return self.streams[0] if self.streams else None
+
+    def configure(self, threshold_offset=10, timeout_duration=0.5, manual_threshold=None, vad_enabled=False,
+                  attack_hops=1, hysteresis=0.0, combine_rule='any', channel_weights=(), ptt_key=0x56,
+                  test_mode=False, noise_tracking='median', show_history=True):
+        """Apply the GUI settings to every detector; a manual_threshold of None means automatic."""
+        for detector in self.detectors:
+            detector.threshold_offset = threshold_offset
+            detector.timeout_duration = timeout_duration
+            detector.manual_threshold = manual_threshold
+            detector.vad_enabled = vad_enabled
+            detector.attack_hops = attack_hops
+            detector.hysteresis = hysteresis
+            detector.noise_tracking = noise_tracking
+        self.set_combine_rule(combine_rule, channel_weights)
+        self.ptt_key = ptt_key
+        self.test_mode = test_mode
+        self.show_history = show_history
+
+    def noise_levels(self):
+        """Noise floor window of every device, see DetectionEngine.noise_levels()."""
+        return [detector.noise_levels() for detector in self.detectors]
+
+    def latency_summary(self):
+        return self.tracer.summary()
+
+    def queue_latency(self):
+        return self.injector.queue_latency()
+
+    def export_trace(self, path, metadata=None):
+        self.tracer.export(path, metadata)
+
+    def set_combine_rule(self, rule, weights=()):
+        """Set the any/all/weighted rule; `weights` are per channel, in device order (missing ones weigh 1)."""
+        weights = list(weights)
+        for detector in self.detectors:
+            detector.combine_rule = rule
+            own, weights = weights[:detector.CHANNELS], weights[detector.CHANNELS:]
+            detector.set_channel_weights(own or [1.0])
+
+    def start(self, threshold=None, noise_levels=None):
+        """Open the streams; `noise_levels` optionally holds cached noise levels per device to skip calibration."""
+        for source, detector in enumerate(self.detectors):
+            detector.reset(threshold)
+            if noise_levels is not None and noise_levels[source] is not None:
+                detector.seed_noise_floor(noise_levels[source])
+        self.tracer.clear()
+        self.history.reset()
+        self.overruns = 0
+        self.dropped_frames = 0
+        self.backlog_frames = 0
+        try:
+            self.injector.start()
+            if self.session_log:
+                self.start_recorder()
+            self.running = True
+            blocking = self.capture_mode == 'blocking'
+            for source, (device_index, channels) in enumerate(self.sources):
+                stream = self.p.open(format=self.FORMAT,
+                                     channels=channels,
+                                     rate=self.RATE,
+                                     input=True,
+                                     input_device_index=device_index,
+                                     frames_per_buffer=self.CHUNK,
+                                     stream_callback=None if blocking else self._make_callback(source))
+                self.streams.append(stream)
+            for source, stream in enumerate(self.streams):
+                stream.start_stream()
+                if blocking:
+                    reader = threading.Thread(target=self._read_loop, args=(source, stream),
+                                              name=f'AudioReader-{source}', daemon=True)
+                    reader.start()
+                    self.readers.append(reader)
+        except Exception:
+            # A later device failed to open: don't leave the earlier streams and the injector running
+            self.stop()
+            raise
+
+    def stop(self):
+        self.running = False
+        for reader in self.readers:
+            reader.join(timeout=1.0)
+        self.readers = []
+        for stream in self.streams:
+            stream.stop_stream()
+            stream.close()
+        self.streams = []
+        self.release()
+        self.injector.stop()  # releases anything still held
+        if self.recorder is not None:
+            for detector in self.detectors:
+                detector.hop_log = None
+            self.recorder.stop()
+            self.recorder = None
+
+    def start_recorder(self):
+        from session_log import SessionRecorder
+
+        recorder = SessionRecorder(self.session_log, {
+            'rate': self.RATE,
+            'hops': [detector.HOP for detector in self.detectors],
+            'devices': [device_index for device_index, _ in self.sources],
+        })
+        try:
+            recorder.start()
+        except OSError as e:
+            print(f"Error starting session log: {str(e)}")
+            return
+        self.recorder = recorder
+        for source, detector in enumerate(self.detectors):
+            detector.hop_log = recorder.channel(source)
+
+    def get_snapshot(self):
+        with self.lock:
+            return dict(self.snapshot)
+
+    def _make_callback(self, source):
+        def callback(in_data, frame_count, time_info, status):
+            # Everything is timed on PortAudio's stream clock; some host APIs
+            # report zeros, in which case perf_counter stands in for it.
+            started = time.perf_counter()
+            if status & pyaudio.paInputOverflow:
+                with self.lock:
+                    self.overruns += 1
+            callback_time = time_info.get('current_time') or started
+            adc_time = time_info.get('input_buffer_adc_time') or callback_time - frame_count / self.RATE
+            self.process(np.frombuffer(in_data, dtype=np.int16), adc_time, callback_time, callback_time - started,
+                         source)
+            return (None, pyaudio.paContinue)
+        return callback
+
+    def _read_loop(self, source, stream):
+        channels = self.sources[source][1]
+        budget = max(int(self.latency_budget * self.RATE), self.CHUNK)
+        try:
+            while self.running:
+                available = stream.get_read_available()
+                self.backlog_frames = available
+                if available > budget:
+                    # Too far behind: skip the oldest audio so decisions are made on fresh frames
+                    stale = available - budget
+                    if self._read(stream, stale) is not None:
+                        with self.lock:
+                            self.dropped_frames += stale
+                    available = budget
+                frames = max(available, self.CHUNK)  # blocks until at least one CHUNK is queued
+                in_data = self._read(stream, frames)
+                if in_data is None:
+                    continue
+                started = time.perf_counter()
+                callback_time = stream.get_time() or started
+                adc_time = callback_time - frames / self.RATE - stream.get_input_latency()
+                data = np.frombuffer(in_data, dtype=np.int16)[:frames * channels]
+                self.process(data, adc_time, callback_time, callback_time - started, source)
+        except OSError as e:
+            print(f"Error reading audio: {str(e)}")
+
+    def _read(self, stream, frames):
+        """Read `frames` frames; on an input overflow count it and return None."""
+        try:
+            return stream.read(frames, exception_on_overflow=True)
+        except OSError as e:
+            if e.errno != pyaudio.paInputOverflowed:
+                raise
+            with self.lock:
+                self.overruns += 1
+                self.dropped_frames += frames
+            return None
+
+    def gate_open(self):
+        """Combined gate of all devices, using the primary detector's combine rule."""
+        if len(self.detectors) == 1:
+            return self.detector.gate_open
+        gates = np.array([[detector.gate_open for detector in self.detectors]])
+        rule = self.detector.combine_rule
+        if rule == 'weighted':
+            # Devices count equally; each device already weighted its own channels
+            return bool(gates.mean() >= self.detector.weight_quorum)
+        return bool(gates.all() if rule == 'all' else gates.any())
+
+    def process(self, data, adc_time, callback_time, clock_offset, source=0):
+        detector = self.detectors[source]
+        end_time = adc_time + len(data) // detector.CHANNELS / self.RATE
+        events = detector.process(data, end_time)
+        decision_time = time.perf_counter() + clock_offset
+
+        with self.gate_lock:
+            gate_open = self.gate_open()
+            if gate_open != self.ptt_active and not (self.test_mode and gate_open):
+                onset = math.nan
+                for event in events:
+                    if (event.kind == 'press') == gate_open:
+                        onset = event.time - detector.HOP / self.RATE  # start of the deciding hop
+                kind = KIND_PRESS if gate_open else KIND_RELEASE
+                seq = self.tracer.record(adc_time, callback_time, decision_time, kind, onset)
+                if gate_open:
+                    self.press((seq, clock_offset))
+                else:
+                    self.release((seq, clock_offset))
+            else:
+                self.tracer.record(adc_time, callback_time, decision_time)
+
+        if len(self.detectors) == 1:
+            snapshot = {
+                'seq': detector.buffers_processed,
+                'level': detector.level,
+                'threshold': detector.threshold,
+                'state': detector.state,
+                'calibration_progress': detector.calibration_progress,
+                'dsp_cost': detector.cost_per_buffer(),
+                'channel_levels': [] if detector.channel_levels is None else detector.channel_levels.tolist(),
+                'channel_thresholds': ([] if detector.channel_thresholds is None
+                                       else detector.channel_thresholds.tolist()),
+            }
+        else:
+            snapshot = self.combined_snapshot(gate_open)
+        with self.lock:
+            self.snapshot = snapshot
+        if self.publish is not None:
+            self.publish(snapshot)
+        if source == 0 and self.show_history:
+            self.write_history(detector, snapshot['state'], events, end_time)
+
+    def write_history(self, detector, state, events, end_time):
+        rows = detector.meter.rows
+        levels = detector.meter.levels
+        # Mark each event on the hop that caused it; the last measured hop ends
+        # the frames still pending in the meter before the end of the buffer
+        hops = len(levels)
+        last_hop_time = end_time - detector.meter.pending / self.RATE
+        marks = []
+        for event in events:
+            back = int(round((last_hop_time - event.time) * self.RATE / detector.HOP))
+            marks.append((min(max(hops - 1 - back, 0), hops - 1), event.kind))
+        if detector.CHANNELS > 1:
+            rows = rows[:, :, 0]  # the spectrum of the first channel, the level of the loudest
+            levels = levels.max(axis=1)
+        self.history.write(rows, levels, detector.threshold, state, marks)
+
+    def combined_snapshot(self, gate_open):
+        # The meter follows the device that is loudest above its own threshold
+        detectors = [d for d in self.detectors if d.level is not None]
+        loudest = max(detectors, key=lambda d: d.level - (d.threshold if d.threshold is not None else 0),
+                      default=self.detector)
+        channel_levels = []
+        channel_thresholds = []
+        for d in self.detectors:
+            if d.channel_levels is not None:
+                channel_levels += d.channel_levels.tolist()
+            elif d.level is not None:
+                channel_levels.append(d.level)
+            if d.channel_thresholds is not None:
+                channel_thresholds += d.channel_thresholds.tolist()
+            elif d.threshold is not None:
+                channel_thresholds.append(d.threshold)
+        states = [d.state for d in self.detectors]
+        if 'calibrating' in states:
+            state = 'calibrating'
+        elif gate_open:
+            state = 'voice' if 'voice' in states else 'hold'
+        else:
+            state = 'idle'
+        costs = [d.cost_per_buffer() for d in self.detectors]
+        return {
+            'seq': sum(d.buffers_processed for d in self.detectors),
+            'level': loudest.level,
+            'threshold': loudest.threshold,
+            'state': state,
+            'calibration_progress': min(d.calibration_progress for d in self.detectors),
+            'dsp_cost': (sum(c[0] for c in costs), sum(c[1] for c in costs)),
+            'channel_levels': channel_levels,
+            'channel_thresholds': channel_thresholds,
+        }
+
+    def press(self, token=None):
+        if not self.test_mode and not self.ptt_active:
+            self.pressed_key = self.ptt_key
+            self.injector.press(self.pressed_key, token)
+            self.ptt_active = True
+
+    def release(self, token=None):
+        # Also runs in test mode, so a key held before switching is let go
+        if self.ptt_active:
+            self.injector.release(self.pressed_key, token)
+            self.ptt_active = False
+
+    def _on_injected(self, token, kind, injected):
+        # Called on the injector thread
+        if token is not None:
+            seq, clock_offset = token
+            self.tracer.set_inject(seq, injected + clock_offset)
+            if self.recorder is not None:
+                self.recorder.add_key(injected + clock_offset, kind == KIND_PRESS)
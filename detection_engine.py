@@ -0,0 +1,1020 @@
+"""Headless voice detection for Magic Push-to-Talk.
+
+The engine takes int16 frames and decides when the push-to-talk key should be
+held. It has no GUI, PortAudio or Win32 dependency, so it can be replayed
+against WAV files and profiled on any machine:
+
+    python detection_engine.py session.wav [more.wav ...]
+"""
+import argparse
+import sys
+import time
+import wave
+from collections import namedtuple
+
+import numpy as np
+
+
+DetectionEvent = namedtuple('DetectionEvent', ['kind', 'time', 'level', 'threshold'])
+
+
+class RollingPercentile:
+    """Percentile of the last `maxlen` dB levels, updated incrementally.
+
+    Levels are quantized into `resolution` dB bins of a histogram kept in a
+    Fenwick tree, so both append() and value() cost O(log bins) regardless of
+    the window length. The result matches np.percentile over the same window
+    to within half a bin.
+    """
+
+    def __init__(self, maxlen, percentile=50, floor=-200.0, ceiling=0.0, resolution=0.1):
+        self.maxlen = max(int(maxlen), 1)
+        self.percentile = percentile
+        self.floor = floor
+        self.resolution = resolution
+        self.nbins = int(round((ceiling - floor) / resolution)) + 1
+        self.top = 1 << (self.nbins.bit_length() - 1)
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.tree = [0] * (self.nbins + 1)
+        self.ring = [0] * self.maxlen
+        self.head = 0
+        self.count = 0
+
+    def _add(self, index, delta):
+        tree = self.tree
+        index += 1
+        while index <= self.nbins:
+            tree[index] += delta
+            index += index & -index
+
+    def _find(self, rank):
+        # Smallest bin whose cumulative count exceeds `rank` (0-based)
+        tree = self.tree
+        pos = 0
+        remaining = rank + 1
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt <= self.nbins and tree[nxt] < remaining:
+                pos = nxt
+                remaining -= tree[nxt]
+            step >>= 1
+        return pos
+
+    def append(self, level):
+        index = int(round((level - self.floor) / self.resolution))
+        index = min(max(index, 0), self.nbins - 1)
+        if self.count == self.maxlen:
+            self._add(self.ring[self.head], -1)
+        else:
+            self.count += 1
+        self.ring[self.head] = index
+        self._add(index, 1)
+        self.head = (self.head + 1) % self.maxlen
+
+    def value(self, percentile=None):
+        if self.count == 0:
+            return None
+        if percentile is None:
+            percentile = self.percentile
+        rank = percentile / 100 * (self.count - 1)
+        lower = int(rank)
+        low = self._find(lower)
+        high = self._find(lower + 1) if lower + 1 < self.count else low
+        index = low + (high - low) * (rank - lower)
+        return self.floor + index * self.resolution
+
+    def levels(self):
+        """The (quantized) levels in the window, in no particular order."""
+        return [self.floor + index * self.resolution for index in self.ring[:self.count]]
+
+
+class MultiChannelPercentile:
+    """RollingPercentile for several channels at once, vectorized across channels.
+
+    The histograms of all channels live in one flat array, channel after
+    channel, with a second array of per-block totals on top. extend() takes a
+    whole (n, channels) block of levels and value() finds every channel's
+    percentile by scanning the block totals and then one block per channel,
+    so each call is a fixed handful of numpy operations whatever the channel
+    count.
+    """
+    BLOCK = 64  # histogram bins per block
+
+    def __init__(self, maxlen, channels, percentile=50, floor=-200.0, ceiling=0.0, resolution=0.1):
+        self.maxlen = max(int(maxlen), 1)
+        self.channels = channels
+        self.percentile = percentile
+        self.floor = floor
+        self.resolution = resolution
+        self.nbins = int(round((ceiling - floor) / resolution)) + 1
+        self.nblocks = -(-self.nbins // self.BLOCK)
+        self.offsets = np.arange(channels, dtype=np.int32) * (self.nblocks * self.BLOCK)
+        self.channel_index = np.arange(channels)[:, None]
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.counts = np.zeros(self.channels * self.nblocks * self.BLOCK, dtype=np.int32)
+        self.block_counts = np.zeros(self.channels * self.nblocks, dtype=np.int32)
+        self.ring = np.zeros((self.maxlen, self.channels), dtype=np.int32)  # flat bin indices
+        self.head = 0
+        self.count = 0
+
+    def extend(self, levels):
+        levels = levels[-self.maxlen:]
+        n = len(levels)
+        if not n:
+            return
+        bins = np.rint((levels - self.floor) / self.resolution).astype(np.int32)
+        np.clip(bins, 0, self.nbins - 1, out=bins)
+        bins += self.offsets
+        if self.head + n <= self.maxlen:
+            positions = slice(self.head, self.head + n)
+        else:
+            positions = (self.head + np.arange(n)) % self.maxlen
+        if self.count + n > self.maxlen:
+            # Slots about to be overwritten; before the first wrap only the start of the ring is in use
+            old = self.ring[positions] if self.count == self.maxlen else self.ring[:self.count + n - self.maxlen]
+            old = old.ravel()
+            np.subtract.at(self.counts, old, 1)
+            np.subtract.at(self.block_counts, old // self.BLOCK, 1)
+        flat = bins.ravel()
+        np.add.at(self.counts, flat, 1)
+        np.add.at(self.block_counts, flat // self.BLOCK, 1)
+        self.ring[positions] = bins
+        self.head = (self.head + n) % self.maxlen
+        self.count = min(self.count + n, self.maxlen)
+
+    def value(self, percentile=None):
+        """Return the percentile of every channel as an array, or None while empty."""
+        if self.count == 0:
+            return None
+        if percentile is None:
+            percentile = self.percentile
+        rank = percentile / 100 * (self.count - 1)
+        lower = int(rank)
+        ranks = np.array([lower, min(lower + 1, self.count - 1)])  # interpolate between these two
+        blocks = self.block_counts.reshape(self.channels, self.nblocks)
+        cumulative = np.cumsum(blocks, axis=1)
+        block = np.argmax(cumulative[:, None, :] > ranks[:, None], axis=2)
+        before = np.take_along_axis(cumulative - blocks, block, axis=1)
+        within = self.counts.reshape(self.channels, self.nblocks, self.BLOCK)[self.channel_index, block]
+        offset = np.argmax(np.cumsum(within, axis=2) > (ranks - before)[:, :, None], axis=2)
+        bins = block * self.BLOCK + offset
+        low = bins[:, 0]
+        return self.floor + (low + (bins[:, 1] - low) * (rank - lower)) * self.resolution
+
+    def levels(self):
+        """The (quantized) levels in the window as a (count, channels) array, in no particular order."""
+        return self.floor + (self.ring[:self.count] - self.offsets) * self.resolution
+
+
+class ChannelPercentiles:
+    """One RollingPercentile per channel, with MultiChannelPercentile's interface.
+
+    Each numpy call in MultiChannelPercentile costs about as much as a whole
+    Fenwick tree update, so for a few channels looping over plain
+    RollingPercentiles is several times cheaper; DetectionEngine switches to
+    the vectorized histogram above MAX_CHANNELS channels.
+    """
+    MAX_CHANNELS = 4
+
+    def __init__(self, maxlen, channels, percentile=50, floor=-200.0, ceiling=0.0, resolution=0.1):
+        self.channels = channels
+        self.trackers = [RollingPercentile(maxlen, percentile, floor, ceiling, resolution) for _ in range(channels)]
+        self.maxlen = self.trackers[0].maxlen
+
+    def __len__(self):
+        return len(self.trackers[0])
+
+    def clear(self):
+        for tracker in self.trackers:
+            tracker.clear()
+
+    def extend(self, levels):
+        columns = np.asarray(levels, dtype=float)[-self.maxlen:].T.tolist()
+        for tracker, column in zip(self.trackers, columns):
+            for level in column:
+                tracker.append(level)
+
+    def value(self, percentile=None):
+        """Return the percentile of every channel as an array, or None while empty."""
+        if not len(self):
+            return None
+        return np.array([tracker.value(percentile) for tracker in self.trackers])
+
+    def levels(self):
+        """The (quantized) levels in the window as a (count, channels) array, in no particular order."""
+        # extend() may be running on the capture thread, a level ahead on the first trackers
+        columns = [tracker.levels() for tracker in self.trackers]
+        count = min(len(column) for column in columns)
+        return np.array([column[:count] for column in columns]).T.reshape(-1, self.channels)
+
+
+class NoiseFloorTracker:
+    """Noise floor that follows quiet levels and ignores speech, at O(1) per hop.
+
+    An asymmetric exponential average in dB: it falls toward quieter levels
+    with a `fall_time` time constant and rises toward louder ones with the
+    much slower `rise_time`, so it stays near the quiet end of the noise.
+    Hops appended with gated=True (the key is held) may only lower it; in
+    case the noise itself got louder, the quietest gated hop is kept and the
+    floor is raised to it after every `rise_time` / 2 seconds of gated hops
+    (as long as a rolling median takes to follow a step), the way
+    minimum-statistics trackers take the minimum over a window. Speech has
+    pauses, so that minimum stays at the noise floor while someone talks.
+
+    Takes the same calls as RollingPercentile (one channel, append()) and
+    MultiChannelPercentile (extend() with (hops, channels) blocks); the
+    multichannel update works in place on preallocated arrays.
+    """
+
+    def __init__(self, hop_seconds, channels=1, fall_time=1.0, rise_time=5.0):
+        self.channels = channels
+        self.fall = 1 - np.exp(-hop_seconds / fall_time)
+        self.rise = 1 - np.exp(-hop_seconds / rise_time)
+        self.gated_window = max(int(round(rise_time / 2 / hop_seconds)), 1)
+        if channels > 1:
+            self.estimate = np.zeros(channels)
+            self.gated_min = np.zeros(channels)
+            self._step = np.zeros(channels)
+            self._rates = np.zeros(channels)
+            self._falling = np.zeros(channels, dtype=bool)
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+        self.gated_hops = 0
+        if self.channels > 1:
+            self.gated_min.fill(np.inf)
+        else:
+            self.estimate = None
+            self.gated_min = float('inf')
+
+    def append(self, level, gated=False):
+        self.count += 1
+        estimate = self.estimate
+        if estimate is None:
+            self.estimate = level
+            return
+        if level < estimate:
+            self.estimate = estimate + self.fall * (level - estimate)
+        elif not gated:
+            self.estimate = estimate + self.rise * (level - estimate)
+        if gated:
+            self.gated_min = min(self.gated_min, level)
+            self.gated_hops += 1
+            if self.gated_hops >= self.gated_window:
+                self.estimate = max(self.estimate, self.gated_min)
+                self.gated_min = float('inf')
+                self.gated_hops = 0
+
+    def extend(self, levels, gated=False):
+        estimate, step, rates, falling = self.estimate, self._step, self._rates, self._falling
+        for row in levels:
+            if self.count == 0:
+                estimate[:] = row
+                self.count = 1
+                continue
+            self.count += 1
+            np.subtract(row, estimate, out=step)
+            np.less(step, 0, out=falling)
+            rates.fill(0.0 if gated else self.rise)
+            np.copyto(rates, self.fall, where=falling)
+            step *= rates
+            estimate += step
+            if gated:
+                np.minimum(self.gated_min, row, out=self.gated_min)
+                self.gated_hops += 1
+                if self.gated_hops >= self.gated_window:
+                    np.maximum(estimate, self.gated_min, out=estimate)
+                    self.gated_min.fill(np.inf)
+                    self.gated_hops = 0
+
+    def value(self):
+        """The floor in dB (an array with several channels, not to be modified), or None while empty."""
+        if self.count == 0:
+            return None
+        return self.estimate
+
+    def levels(self):
+        """The floor as a one-level window, for the calibration cache."""
+        if self.count == 0:
+            return []
+        return [self.estimate] if self.channels == 1 else self.estimate[None, :].copy()
+
+
+class LevelMeter:
+    """RMS level in dB full scale for every `hop` frames of a stream.
+
+    All hops of a buffer are measured in one vectorized pass: the int16 frames
+    are copied into a preallocated float32 scratch array, viewed as
+    (hops, hop) and reduced with a row-wise dot product. Frames that don't
+    fill a whole hop are carried over to the next buffer, so no allocation
+    happens per buffer once the scratch is large enough. The measured hops
+    stay available as `rows` and their levels as `levels` until the next
+    call, for later stages.
+
+    With channels > 1 the input is interleaved, the scratch is viewed as
+    (hops, hop, channels) and measure() returns a (hops, channels) array;
+    all channels still go through the same single reduction.
+    """
+
+    FULL_SCALE_POWER = 32768.0 ** 2
+    MIN_POWER = 1e-20  # -200 dB, the same floor as max(rms, 1e-10)
+
+    def __init__(self, hop, max_frames=4096, channels=1):
+        self.hop = hop
+        self.channels = channels
+        self._allocate(max_frames)
+
+    def _allocate(self, max_frames):
+        max_hops = max_frames // self.hop + 1
+        self._scratch = np.zeros((max_hops * self.hop, self.channels), dtype=np.float32)
+        self._levels = np.zeros((max_hops, self.channels), dtype=np.float32)
+        self._carry = np.zeros((self.hop, self.channels), dtype=np.float32)
+        self.rows = self._shape_rows(self._scratch[:0].reshape(0, self.hop, self.channels))
+        self.levels = self._levels[:0, 0] if self.channels == 1 else self._levels[:0]
+        self.pending = 0
+
+    def _shape_rows(self, rows):
+        return rows[:, :, 0] if self.channels == 1 else rows
+
+    def reset(self):
+        self.pending = 0
+
+    def measure(self, data):
+        """Return the dB level of every hop completed by `data` (a view into scratch)."""
+        hop = self.hop
+        frames = data.reshape(-1, self.channels)
+        total = self.pending + len(frames)
+        if total > len(self._scratch):
+            pending = self.pending
+            carry = self._carry[:pending].copy()
+            self._allocate(total)
+            self._carry[:pending] = carry
+            self.pending = pending
+        scratch = self._scratch
+        scratch[:self.pending] = self._carry[:self.pending]
+        np.copyto(scratch[self.pending:total], frames, casting='unsafe')
+
+        hops = total // hop
+        levels = self._levels[:hops]
+        rows = scratch[:hops * hop].reshape(hops, hop, self.channels)
+        self.rows = self._shape_rows(rows)
+        if hops:
+            np.einsum('ijk,ijk->ik', rows, rows, out=levels)
+            levels *= 1.0 / (hop * self.FULL_SCALE_POWER)
+            np.maximum(levels, self.MIN_POWER, out=levels)
+            np.log10(levels, out=levels)
+            levels *= 10.0
+
+        self.pending = total - hops * hop
+        self._carry[:self.pending] = scratch[hops * hop:total]
+        self.levels = levels[:, 0] if self.channels == 1 else levels
+        return self.levels
+
+
+def lowpass_taps(decimation, taps_per_phase):
+    """Blackman-windowed sinc low-pass cut off at the Nyquist frequency of rate / decimation, unity gain at DC."""
+    length = decimation * taps_per_phase
+    n = np.arange(length) - (length - 1) / 2
+    taps = np.sinc(n / decimation) * np.blackman(length)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class SpectralVAD:
+    """Per-hop speech/non-speech decision from the shape of the spectrum.
+
+    A loud hop only counts as voice when most of its energy falls in the
+    speech band, its spectrum is not flat (hiss, fans, keyboard clicks) and
+    its zero-crossing rate is speech-like. All hops of a buffer go through a
+    single batched rfft; the other intermediates live in preallocated arrays.
+    Hops of 256 frames or more give the band split enough frequency resolution.
+
+    With decimation > 1 the end of every hop is first low-passed at the new
+    Nyquist frequency and downsampled to rate / decimation, so the FFT and
+    the per-frame features only see a voice-band signal at 8-16 kHz. The
+    filter is a Blackman-windowed sinc of TAPS_PER_PHASE * decimation taps
+    (flat to 4 kHz, below -75 dB where clicks would fold into the speech
+    band), applied to whole hops with no state between them: each output
+    frame is a filter's length of input, so the decimated hop is a little
+    shorter than hop / decimation. It runs in polyphase form, one matmul of
+    the blocks of `decimation` frames with the taps of every phase and one
+    sum along the diagonals of the result.
+    """
+
+    EPSILON = 1e-12
+    TAPS_PER_PHASE = 12
+
+    def __init__(self, rate, hop, band=(150, 4000), min_band_ratio=0.4, max_flatness=0.3, max_zcr_hz=4000,
+                 max_hops=64, decimation=1):
+        self.decimation = max(min(decimation, hop // 2), 1)
+        self.first_frame = 0  # where the analyzed end of a hop starts
+        if self.decimation > 1:
+            # Shorter filters for short hops, so at least half of the decimated frames remain
+            self.phases = min(self.TAPS_PER_PHASE, max(hop // self.decimation // 2, 1))
+            blocks = hop // self.decimation
+            self.hop = blocks - self.phases + 1
+            self.first_frame = hop - blocks * self.decimation
+            # phase_taps[r, j] weighs frame r of a block for the output frame j blocks back
+            taps = lowpass_taps(self.decimation, self.phases)
+            self.phase_taps = np.ascontiguousarray(taps.reshape(self.phases, self.decimation).T)
+        else:
+            self.hop = hop
+        self.rate = rate / self.decimation
+        rate = self.rate
+        hop = self.hop
+        self.min_band_ratio = min_band_ratio
+        self.max_flatness = max_flatness
+        self.max_zcr_hz = max_zcr_hz
+
+        freqs = np.fft.rfftfreq(hop, 1 / rate)
+        self.band_start = int(np.searchsorted(freqs, band[0]))
+        self.band_stop = max(int(np.searchsorted(freqs, band[1], side='right')), self.band_start + 1)
+        self.window = np.hanning(hop).astype(np.float32)
+        self._allocate(max_hops)
+
+    def _allocate(self, max_hops):
+        bins = self.hop // 2 + 1
+        self._decimated = np.zeros((max_hops, self.hop), dtype=np.float32)
+        if self.decimation > 1:
+            self._phased = np.zeros((max_hops, self.hop + self.phases - 1, self.phases), dtype=np.float32)
+        self._windowed = np.zeros((max_hops, self.hop), dtype=np.float32)
+        self._power = np.zeros((max_hops, bins), dtype=np.float64)
+        self._signs = np.zeros((max_hops, self.hop), dtype=bool)
+        self._crossings = np.zeros((max_hops, self.hop - 1), dtype=bool)
+        self.band_ratio = np.zeros(max_hops)
+        self.flatness = np.zeros(max_hops)
+        self.zcr_hz = np.zeros(max_hops)
+        self._total = np.zeros(max_hops)
+        self._speech = np.zeros(max_hops, dtype=bool)
+        self._scratch = np.zeros(max_hops, dtype=bool)
+
+    def analyze(self, rows):
+        """Return a bool per row of `rows` (hops x hop frames) telling whether it looks like speech."""
+        hops = len(rows)
+        if hops > len(self._speech):
+            self._allocate(hops)
+        windowed = self._windowed[:hops]
+        power = self._power[:hops]
+        total = self._total[:hops]
+        band_ratio = self.band_ratio[:hops]
+        flatness = self.flatness[:hops]
+        zcr_hz = self.zcr_hz[:hops]
+        speech = self._speech[:hops]
+        scratch = self._scratch[:hops]
+
+        if self.decimation > 1:
+            blocks = rows[:, self.first_frame:].reshape(hops, -1, self.decimation)
+            phased = np.matmul(blocks, self.phase_taps, out=self._phased[:hops])
+            # Output frame m sums phased[m + j, j] over the phases j
+            size = phased.itemsize
+            diagonals = np.lib.stride_tricks.as_strided(
+                phased, (hops, self.hop, self.phases),
+                (phased.strides[0], self.phases * size, (self.phases + 1) * size))
+            rows = np.sum(diagonals, axis=2, out=self._decimated[:hops])
+
+        np.multiply(rows, self.window, out=windowed)
+        spectrum = np.fft.rfft(windowed, axis=1)
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+        power += self.EPSILON
+
+        # Share of the energy inside the speech band
+        np.sum(power, axis=1, out=total)
+        np.sum(power[:, self.band_start:self.band_stop], axis=1, out=band_ratio)
+        band_ratio /= total
+
+        # Spectral flatness: geometric mean over arithmetic mean, ~1 for white noise
+        total /= power.shape[1]
+        np.log(power, out=power)
+        np.mean(power, axis=1, out=flatness)
+        np.exp(flatness, out=flatness)
+        flatness /= total
+
+        # Zero-crossing rate expressed as the frequency of an equivalent sine
+        signs = self._signs[:hops]
+        crossings = self._crossings[:hops]
+        np.signbit(rows, out=signs)
+        np.not_equal(signs[:, 1:], signs[:, :-1], out=crossings)
+        np.sum(crossings, axis=1, out=zcr_hz)
+        zcr_hz *= self.rate / (2 * (self.hop - 1))
+
+        np.greater_equal(band_ratio, self.min_band_ratio, out=speech)
+        np.less_equal(flatness, self.max_flatness, out=scratch)
+        speech &= scratch
+        np.less_equal(zcr_hz, self.max_zcr_hz, out=scratch)
+        speech &= scratch
+        return speech
+
+
+class GateStateMachine:
+    """Push-to-talk gate timed by counting audio frames.
+
+        idle   --loud--------------------------> attack
+        attack --attack_hops loud hops in a row--> voice   (press)
+        attack --not loud----------------------> idle
+        voice  --below the close threshold-----> hold
+        hold   --above the close threshold-----> voice
+        hold   --hold_frames without a loud hop-> idle    (release)
+
+    "Loud" means above the open threshold while closed and above the close
+    threshold (a few dB lower, for hysteresis) while open, so a level hovering
+    around the threshold doesn't chatter. Time only advances with the hops
+    fed in, so the same levels always give the same key timing, whatever the
+    buffer size or how late the audio callback runs.
+    """
+
+    def __init__(self, hop, attack_hops=1, hold_frames=0):
+        self.hop = hop
+        self.attack_hops = attack_hops
+        self.hold_frames = hold_frames
+        self.reset()
+
+    def reset(self):
+        self.state = 'idle'
+        self.loud_hops = 0
+        self.quiet_frames = 0
+
+    @property
+    def open(self):
+        return self.state == 'voice' or self.state == 'hold'
+
+    def step(self, above_open, above_close):
+        """Advance by one hop; return 'press', 'release' or None."""
+        state = self.state
+        if state == 'voice' or state == 'hold':
+            if above_close:
+                self.state = 'voice'
+                self.quiet_frames = 0
+                return None
+            self.state = 'hold'
+            self.quiet_frames += self.hop
+            if self.quiet_frames >= self.hold_frames:
+                self.reset()
+                return 'release'
+            return None
+        if not above_open:
+            self.state = 'idle'
+            self.loud_hops = 0
+            return None
+        self.loud_hops += 1
+        if self.loud_hops >= self.attack_hops:
+            self.state = 'voice'
+            self.loud_hops = 0
+            self.quiet_frames = 0
+            return 'press'
+        self.state = 'attack'
+        return None
+
+    def feed(self, levels, open_threshold, close_threshold=None):
+        """Run a whole array of hop levels through the gate; return [(hop index, 'press'/'release')]."""
+        if close_threshold is None:
+            close_threshold = open_threshold
+        levels = np.asarray(levels)
+        above_open = (levels > open_threshold).tolist()
+        above_close = (levels > close_threshold).tolist()
+        events = []
+        for i in range(len(levels)):
+            kind = self.step(above_open[i], above_close[i])
+            if kind is not None:
+                events.append((i, kind))
+        return events
+
+
+class DetectionEngine:
+    COMBINE_RULES = ('any', 'all', 'weighted')
+    NOISE_TRACKING = ('median', 'adaptive')
+
+    def __init__(self, rate=44100, chunk=1024, window_duration=5, calibration_total=100, noise_percentile=50,
+                 hop_size=None, channels=1, analysis_rate=None):
+        self.RATE = rate
+        self.CHUNK = chunk
+        self.CHANNELS = channels
+        # Levels are measured every hop_size frames; the default is one level per buffer
+        self.HOP = hop_size or chunk
+        self.calibration_total = calibration_total  # in buffers of CHUNK frames
+        self.calibration_frames = calibration_total * chunk
+
+        # Settings
+        self.gate = GateStateMachine(self.HOP)
+        self.threshold_offset = 10
+        self.timeout_duration = 0.5  # seconds
+        self.hysteresis = 0.0  # dB the close threshold sits below the open one
+        self.manual_threshold = None
+
+        self.meter = LevelMeter(self.HOP, max(chunk, self.HOP) * 4, channels)
+        # The spectral VAD can run on audio decimated by a whole factor to about
+        # analysis_rate (None keeps the full rate, which its thresholds are tuned for)
+        decimation = max(int(round(rate / analysis_rate)), 1) if analysis_rate else 1
+        self.vad = SpectralVAD(rate, self.HOP, max_hops=len(self.meter._levels) * channels, decimation=decimation)
+        self.vad_enabled = False
+        self.window_duration = window_duration
+        self.noise_percentile = noise_percentile
+        self._noise_tracking = 'median'
+        self.noise_floor = self.make_noise_floor('median')
+        self.combine_rule = 'any'
+        self.channel_weights = np.full(channels, 1 / channels)
+        self.weight_quorum = 0.5
+        self.channel_levels = None
+        self.channel_thresholds = None
+        self.threshold = None
+        self.is_calibrating = False
+        self.calibration_samples = 0
+        self.frames_processed = 0
+
+        self.level = None
+        self.is_speech = True
+        self.hop_log = None  # called as hop_log(time, level, threshold, state, event) after every hop
+
+        # Running DSP cost, see cost_per_buffer()
+        self.buffers_processed = 0
+        self.meter_time = 0.0
+        self.vad_time = 0.0
+
+    def reset(self, threshold=None):
+        self.meter.reset()
+        self.noise_floor.clear()
+        self.channel_levels = None
+        self.channel_thresholds = None
+        self.threshold = threshold
+        self.is_calibrating = self.manual_threshold is None and threshold is None
+        self.calibration_samples = 0
+        self.frames_processed = 0
+        self.gate.reset()
+        self.level = None
+        self.is_speech = True
+        self.buffers_processed = 0
+        self.meter_time = 0.0
+        self.vad_time = 0.0
+
+    def noise_levels(self):
+        """Levels in the noise floor window, or None until it holds at least a calibration's worth.
+
+        The array is (levels,) for one channel and (levels, channels) otherwise;
+        seed_noise_floor() takes the same shape back.
+        """
+        if len(self.noise_floor) * self.HOP < self.calibration_frames:
+            return None
+        return np.array(self.noise_floor.levels())
+
+    def seed_noise_floor(self, levels):
+        """Prefill the noise floor window (e.g. from a calibration cache) and skip calibration.
+
+        Call after reset(). The threshold is valid from the first buffer and the
+        live levels replace the seeded ones as the window rolls.
+        """
+        if self.CHANNELS == 1:
+            for level in np.asarray(levels, dtype=float).tolist():
+                self.noise_floor.append(level)
+            self.threshold = self.noise_floor.value() + self.threshold_offset
+        else:
+            self.noise_floor.extend(np.asarray(levels, dtype=float))
+            self.channel_thresholds = self.noise_floor.value() + self.threshold_offset
+            self.threshold = float(self.channel_thresholds.min())
+        self.is_calibrating = False
+
+    def make_noise_floor(self, tracking):
+        if tracking == 'adaptive':
+            return NoiseFloorTracker(self.HOP / self.RATE, self.CHANNELS, rise_time=self.window_duration)
+        if self.CHANNELS == 1:
+            return RollingPercentile(self.window_duration * self.RATE / self.HOP, self.noise_percentile)
+        # Independent noise floor per channel, combined into one gate decision
+        if self.CHANNELS <= ChannelPercentiles.MAX_CHANNELS:
+            return ChannelPercentiles(self.window_duration * self.RATE / self.HOP, self.CHANNELS,
+                                      self.noise_percentile)
+        return MultiChannelPercentile(self.window_duration * self.RATE / self.HOP, self.CHANNELS,
+                                      self.noise_percentile)
+
+    @property
+    def noise_tracking(self):
+        """'median': a percentile of the last window_duration seconds of levels, speech included.
+        'adaptive': a NoiseFloorTracker that leaves out hops while the key is held."""
+        return self._noise_tracking
+
+    @noise_tracking.setter
+    def noise_tracking(self, tracking):
+        if tracking not in self.NOISE_TRACKING:
+            raise ValueError(f"unknown noise tracking {tracking!r}")
+        if tracking == self._noise_tracking:
+            return
+        # Carry the current floor over, so switching doesn't need a new calibration
+        noise_floor = self.make_noise_floor(tracking)
+        current = self.noise_floor.value()
+        if current is not None:
+            if self.CHANNELS == 1:
+                noise_floor.append(current)
+            else:
+                noise_floor.extend(np.array(current, dtype=float)[None, :])
+        self.noise_floor = noise_floor
+        self._noise_tracking = tracking
+
+    @property
+    def timeout_duration(self):
+        """Release delay in seconds; the gate counts it in frames."""
+        return self.gate.hold_frames / self.RATE
+
+    @timeout_duration.setter
+    def timeout_duration(self, seconds):
+        self.gate.hold_frames = int(round(seconds * self.RATE))
+
+    @property
+    def attack_hops(self):
+        """Hops in a row that must be loud before the key is pressed."""
+        return self.gate.attack_hops
+
+    @attack_hops.setter
+    def attack_hops(self, hops):
+        self.gate.attack_hops = max(int(hops), 1)
+
+    @property
+    def gate_open(self):
+        return self.gate.open
+
+    @property
+    def state(self):
+        state = self.gate.state
+        if self.is_calibrating and not self.gate.open:
+            return 'calibrating'
+        return state
+
+    def set_channel_weights(self, weights):
+        """Weights for the 'weighted' rule; the gate opens when the loud channels' share reaches weight_quorum.
+
+        Channels without a weight of their own get 1.
+        """
+        given = np.asarray(weights, dtype=float)[:self.CHANNELS]
+        weights = np.ones(self.CHANNELS)
+        weights[:len(given)] = given
+        self.channel_weights = weights / weights.sum() if weights.sum() > 0 else np.full(self.CHANNELS, 1 / self.CHANNELS)
+
+    def combine(self, above):
+        """Reduce a (hops, channels) bool array of loud channels to one decision per hop."""
+        if self.combine_rule == 'all':
+            return above.all(axis=1)
+        if self.combine_rule == 'weighted':
+            return above @ self.channel_weights >= self.weight_quorum
+        return above.any(axis=1)
+
+    @property
+    def calibration_progress(self):
+        return int((self.calibration_samples / self.calibration_frames) * 100)
+
+    def cost_per_buffer(self):
+        """Average metering and spectral VAD time per buffer, in microseconds."""
+        buffers = max(self.buffers_processed, 1)
+        return self.meter_time / buffers * 1e6, self.vad_time / buffers * 1e6
+
+    def get_audio_level(self, data):
+        """RMS level of a whole buffer in dB full scale."""
+        power = np.einsum('i,i->', data, data, dtype=np.float64) / (len(data) * LevelMeter.FULL_SCALE_POWER)
+        return 10 * np.log10(max(power, LevelMeter.MIN_POWER))
+
+    def update_threshold(self):
+        if self.threshold is None:
+            return None
+        return self.noise_floor.value() + self.threshold_offset
+
+    def process(self, data, now=None):
+        """Feed one buffer of int16 frames and return the events it caused.
+
+        The gate is evaluated on every hop, so a press fires on the first hop
+        that crosses the threshold (and, with vad_enabled, looks like speech)
+        rather than at the end of the buffer. With several channels `data` is
+        interleaved and each channel is gated against its own noise floor.
+        `now` is the time at the end of the buffer; it defaults to the audio
+        clock (frames processed so far divided by the sample rate).
+        """
+        hop_frame = self.frames_processed - self.meter.pending  # end of the last measured hop
+        self.frames_processed += len(data) // self.CHANNELS
+        if now is None:
+            now = self.frames_processed / self.RATE
+        started = time.perf_counter()
+        levels = self.meter.measure(data)
+        measured = time.perf_counter()
+        self.meter_time += measured - started
+        if self.vad_enabled and len(levels):
+            if self.CHANNELS == 1:
+                speech = self.vad.analyze(self.meter.rows).tolist()
+            else:
+                rows = np.ascontiguousarray(self.meter.rows.transpose(0, 2, 1)).reshape(-1, self.HOP)
+                speech = self.vad.analyze(rows).reshape(len(levels), self.CHANNELS)
+            self.vad_time += time.perf_counter() - measured
+        else:
+            speech = None
+        self.buffers_processed += 1
+
+        if self.CHANNELS > 1:
+            return self.process_channels(levels, speech, now, hop_frame)
+
+        events = []
+        for i, db_level in enumerate(levels.tolist()):
+            hop_frame += self.HOP
+            event = self.process_level(db_level, now - (self.frames_processed - hop_frame) / self.RATE,
+                                       speech[i] if speech is not None else True)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def process_level(self, db_level, now, is_speech=True):
+        self.level = db_level
+        self.is_speech = is_speech
+        if self._noise_tracking == 'adaptive':
+            self.noise_floor.append(db_level, self.gate.open)
+        else:
+            self.noise_floor.append(db_level)
+
+        if self.manual_threshold is not None:
+            self.threshold = self.manual_threshold
+        elif self.is_calibrating:
+            self.calibration_samples += self.HOP
+            if self.calibration_samples >= self.calibration_frames:
+                self.threshold = self.noise_floor.value() + self.threshold_offset
+                self.is_calibrating = False
+        else:
+            self.threshold = self.update_threshold()
+
+        if self.threshold is None or not is_speech:
+            return self.update_gate(False, False, db_level, now)
+        return self.update_gate(db_level > self.threshold, db_level > self.threshold - self.hysteresis,
+                                db_level, now)
+
+    def process_channels(self, levels, speech, now, hop_frame):
+        hops = len(levels)
+        if not hops:
+            return []
+        if self._noise_tracking == 'adaptive':
+            self.noise_floor.extend(levels, self.gate.open)
+        else:
+            self.noise_floor.extend(levels)
+
+        if self.manual_threshold is not None:
+            thresholds = np.full(self.CHANNELS, float(self.manual_threshold))
+        elif self.is_calibrating:
+            self.calibration_samples += hops * self.HOP
+            thresholds = None
+            if self.calibration_samples >= self.calibration_frames:
+                thresholds = self.noise_floor.value() + self.threshold_offset
+                self.is_calibrating = False
+        elif self.threshold is not None:
+            thresholds = self.noise_floor.value() + self.threshold_offset
+        else:
+            thresholds = None
+        self.channel_levels = levels[-1].copy()
+        self.channel_thresholds = thresholds
+
+        loudest = levels.argmax(axis=1)
+        hop_levels = levels.max(axis=1).tolist()
+        if thresholds is None:
+            above_open = above_close = [False] * hops
+            hop_thresholds = [None] * hops
+        else:
+            above = levels > thresholds
+            if speech is not None:
+                above &= speech
+            above_open = self.combine(above).tolist()
+            if self.hysteresis:
+                above_hysteresis = levels > thresholds - self.hysteresis
+                if speech is not None:
+                    above_hysteresis &= speech
+                above_close = self.combine(above_hysteresis).tolist()
+            else:
+                above_close = above_open
+            hop_thresholds = thresholds[loudest].tolist()
+        self.threshold = hop_thresholds[-1]
+
+        events = []
+        for i in range(hops):
+            hop_frame += self.HOP
+            self.level = hop_levels[i]
+            event = self.update_gate(above_open[i], above_close[i], hop_levels[i],
+                                     now - (self.frames_processed - hop_frame) / self.RATE, hop_thresholds[i])
+            if event is not None:
+                events.append(event)
+        return events
+
+    def update_gate(self, above_open, above_close, db_level, now, threshold=None):
+        if threshold is None:
+            threshold = self.threshold
+        kind = self.gate.step(above_open, above_close)
+        if self.hop_log is not None:
+            self.hop_log(now, db_level, threshold, self.state, kind)
+        if kind is None:
+            return None
+        return DetectionEvent(kind, now, db_level, threshold)
+
+
+def read_wav(path, all_channels=False):
+    """Return the first channel of a 16-bit WAV file as int16 frames, plus its sample rate.
+
+    With all_channels the frames come back as a (frames, channels) array.
+    """
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        data = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+    if all_channels:
+        data = data[:len(data) // channels * channels].reshape(-1, channels)
+    elif channels > 1:
+        data = data[::channels]
+    return data.astype(np.int16, copy=False), rate
+
+
+def replay(engine, data, quiet=False, label=''):
+    """Push a whole recording through the engine one CHUNK at a time."""
+    events = []
+    chunk = engine.CHUNK
+    for start in range(0, len(data) - chunk + 1, chunk):
+        for event in engine.process(data[start:start + chunk].reshape(-1)):
+            events.append(event)
+            if not quiet:
+                print(f"{label}{event.time:9.3f}s  {event.kind:<7}  level {event.level:7.2f} dB  "
+                      f"threshold {event.threshold:7.2f} dB")
+    return events
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay WAV files through the Magic PTT detection engine.")
+    parser.add_argument('wav', nargs='+', help="16-bit PCM WAV recordings")
+    parser.add_argument('--chunk', type=int, default=1024, help="frames per buffer (default: 1024)")
+    parser.add_argument('--hop', type=int, help="frames per level measurement (default: one per chunk)")
+    parser.add_argument('--offset', type=int, default=10, help="threshold offset in dB (default: 10)")
+    parser.add_argument('--release-delay', type=int, default=500, help="release delay in ms (default: 500)")
+    parser.add_argument('--attack', type=int, default=1, help="loud hops in a row before the key is pressed (default: 1)")
+    parser.add_argument('--hysteresis', type=float, default=3,
+                        help="dB below the threshold the level must fall before releasing (default: 3)")
+    parser.add_argument('--threshold', type=float, help="manual threshold in dB (default: auto)")
+    parser.add_argument('--window', type=float, default=5, help="noise floor window in seconds (default: 5)")
+    parser.add_argument('--percentile', type=float, default=50,
+                        help="noise floor percentile of the window (default: 50, the median)")
+    parser.add_argument('--noise-floor', choices=DetectionEngine.NOISE_TRACKING, default='median',
+                        help="median of the window, or adaptive tracking that ignores speech (default: median)")
+    parser.add_argument('--vad', action='store_true', help="only open the gate on speech-like spectra")
+    parser.add_argument('--analysis-rate', type=int, default=0,
+                        help="run --vad on audio decimated to about this rate, 0 for the full rate (default: 0)")
+    parser.add_argument('--all-channels', action='store_true',
+                        help="gate every channel of the file against its own noise floor (default: first channel)")
+    parser.add_argument('--combine', choices=DetectionEngine.COMBINE_RULES, default='any',
+                        help="how loud channels open the gate with --all-channels (default: any)")
+    parser.add_argument('--quiet', action='store_true', help="only print the throughput summary")
+    args = parser.parse_args(argv)
+
+    total_frames = 0
+    total_elapsed = 0.0
+    for path in args.wav:
+        try:
+            data, rate = read_wav(path, args.all_channels)
+        except (OSError, EOFError, wave.Error, ValueError) as e:
+            print(f"Error reading {path}: {e}", file=sys.stderr)
+            return 1
+
+        engine = DetectionEngine(rate=rate, chunk=args.chunk, window_duration=args.window,
+                                 noise_percentile=args.percentile, hop_size=args.hop,
+                                 channels=data.shape[1] if data.ndim > 1 else 1,
+                                 analysis_rate=args.analysis_rate or None)
+        engine.combine_rule = args.combine
+        engine.noise_tracking = args.noise_floor
+        engine.threshold_offset = args.offset
+        engine.timeout_duration = args.release_delay / 1000
+        engine.attack_hops = args.attack
+        engine.hysteresis = args.hysteresis
+        engine.manual_threshold = args.threshold
+        engine.vad_enabled = args.vad
+        engine.reset()
+
+        label = f"{path}  " if len(args.wav) > 1 else ''
+        start = time.perf_counter()
+        events = replay(engine, data, quiet=args.quiet, label=label)
+        elapsed = time.perf_counter() - start
+
+        frames = engine.frames_processed
+        total_frames += frames
+        total_elapsed += elapsed
+        duration = frames / rate
+        print(f"{path}: {len(events)} events, {duration:.1f} s of audio in {elapsed * 1000:.1f} ms "
+              f"({frames / max(elapsed, 1e-9):,.0f} frames/s, {duration / max(elapsed, 1e-9):,.0f}x real time)")
+        meter_us, vad_us = engine.cost_per_buffer()
+        print(f"  per buffer: metering {meter_us:.1f} us" + (f", spectral VAD {vad_us:.1f} us" if args.vad else ''))
+
+    if len(args.wav) > 1:
+        print(f"Total: {total_frames} frames in {total_elapsed * 1000:.1f} ms "
+              f"({total_frames / max(total_elapsed, 1e-9):,.0f} frames/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,371 @@
+"""Capture, detection and key injection in a separate process.
+
+    GUI process                                   worker process
+    DSPWorkerClient ----- Pipe: commands ------>  worker_main -> CaptureEngine
+          ^                                              |
+          +-------- LevelRing (shared memory) <----------+  every processed buffer
+          +-------- LevelHistory (shared memory) <-------+  every hop
+
+The audio callback, the detector and the KeyInjector run under the worker's
+own interpreter lock, so Qt repaints, garbage collection pauses or the pynput
+listener in the GUI process can't delay a key press. The window only reads
+the newest record of the shared ring (and draws the shared LevelHistory
+image); settings go the other way as small
+pickled commands, and the worker sends latency statistics once a second.
+"""
+import math
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from latency_trace import LatencyTracer
+from level_history import LevelHistory
+
+
+STATES = ('idle', 'attack', 'voice', 'hold', 'calibrating')
+MAX_CHANNELS = 16  # per-channel levels published to the ring
+STATS_INTERVAL = 1.0  # s between latency statistics messages
+START_TIMEOUT = 15.0  # s to wait for the worker to open its streams
+REPLY_TIMEOUT = 5.0
+
+
+class LevelRing:
+    """Ring of detector snapshots in shared memory.
+
+    One float64 array: a header of [records published, overruns, dropped
+    frames, backlog frames], then `capacity` records of [seq, level,
+    threshold, state, calibration progress, meter us, VAD us, channel count,
+    channel levels..., channel thresholds...]. Missing values are NaN. The
+    writer fills a record before bumping the published count and the reader
+    checks the count again after copying, so it never sees a record that is
+    being overwritten.
+    """
+
+    HEADER = 4
+    FIELDS = 8
+    WIDTH = FIELDS + 2 * MAX_CHANNELS
+
+    def __init__(self, name=None, capacity=64):
+        self.capacity = capacity
+        size = (self.HEADER + capacity * self.WIDTH) * 8
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        self.name = self.shm.name
+        values = np.ndarray((self.HEADER + capacity * self.WIDTH,), dtype=np.float64, buffer=self.shm.buf)
+        if self.owner:
+            values.fill(0.0)
+        self.header = values[:self.HEADER]
+        self.records = values[self.HEADER:].reshape(capacity, self.WIDTH)
+        self.lock = threading.Lock()  # several device callbacks may publish
+
+    def write(self, snapshot, overruns=0, dropped_frames=0, backlog_frames=0):
+        with self.lock:
+            published = int(self.header[0])
+            record = self.records[published % self.capacity]
+            record[0] = snapshot['seq']
+            record[1] = math.nan if snapshot['level'] is None else snapshot['level']
+            record[2] = math.nan if snapshot['threshold'] is None else snapshot['threshold']
+            record[3] = STATES.index(snapshot['state'])
+            record[4] = snapshot['calibration_progress']
+            record[5:7] = snapshot['dsp_cost']
+            levels = snapshot['channel_levels'][:MAX_CHANNELS]
+            thresholds = snapshot['channel_thresholds'][:MAX_CHANNELS]
+            record[7] = len(levels)
+            record[self.FIELDS:self.FIELDS + len(levels)] = levels
+            record[self.FIELDS + MAX_CHANNELS:self.FIELDS + MAX_CHANNELS + len(thresholds)] = thresholds
+            record[self.FIELDS + MAX_CHANNELS + len(thresholds):] = math.nan
+            self.header[1] = overruns
+            self.header[2] = dropped_frames
+            self.header[3] = backlog_frames
+            self.header[0] = published + 1
+
+    def read(self):
+        """Return the newest snapshot as a CaptureEngine.get_snapshot() dict, or None before the first one."""
+        while True:
+            published = int(self.header[0])
+            if published == 0:
+                return None
+            record = self.records[(published - 1) % self.capacity].copy()
+            if int(self.header[0]) - published < self.capacity - 1:
+                break
+        count = int(record[7])
+        thresholds = record[self.FIELDS + MAX_CHANNELS:self.FIELDS + MAX_CHANNELS + count]
+        return {
+            'seq': int(record[0]),
+            'level': None if math.isnan(record[1]) else float(record[1]),
+            'threshold': None if math.isnan(record[2]) else float(record[2]),
+            'state': STATES[int(record[3])],
+            'calibration_progress': int(record[4]),
+            'dsp_cost': (float(record[5]), float(record[6])),
+            'channel_levels': record[self.FIELDS:self.FIELDS + count].tolist(),
+            'channel_thresholds': thresholds[~np.isnan(thresholds)].tolist(),
+        }
+
+    def counters(self):
+        """(overruns, dropped frames, backlog frames) as last published."""
+        return int(self.header[1]), int(self.header[2]), int(self.header[3])
+
+    def close(self):
+        self.header = self.records = None  # release the views before closing the mapping
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def worker_main(conn, ring_name, ring_capacity, history_name, engine_args, settings, threshold, noise_levels):
+    """Entry point of the worker process: run a CaptureEngine until told to stop or the GUI goes away."""
+    import pyaudio
+    from capture_engine import CaptureEngine
+    from key_injection import raise_process_priority
+
+    raise_process_priority()
+    ring = LevelRing(ring_name, ring_capacity)
+    p = pyaudio.PyAudio()
+    try:
+        capture = CaptureEngine(p, *engine_args)
+    except OSError as e:
+        conn.send(('error', str(e)))
+        ring.close()
+        p.terminate()
+        return
+    history_shm = shared_memory.SharedMemory(name=history_name)
+    capture.history = LevelHistory(capture.RATE, capture.detector.HOP, buffer=history_shm.buf)
+    capture.configure(**settings)
+    capture.publish = lambda snapshot: ring.write(snapshot, capture.overruns, capture.dropped_frames,
+                                                  capture.backlog_frames)
+    try:
+        capture.start(threshold, noise_levels)
+    except Exception as e:
+        capture.stop()
+        conn.send(('error', str(e)))
+        capture.history = None
+        history_shm.close()
+        ring.close()
+        p.terminate()
+        return
+    conn.send(('started', None))
+
+    last_stats = time.monotonic()
+    try:
+        while True:
+            if conn.poll(STATS_INTERVAL):
+                command, arg = conn.recv()
+                if command == 'stop':
+                    break
+                elif command == 'configure':
+                    capture.configure(**arg)
+                elif command == 'noise_levels':
+                    conn.send(('noise_levels', capture.noise_levels()))
+                elif command == 'export':
+                    try:
+                        capture.tracer.export(*arg)
+                        conn.send(('exported', None))
+                    except OSError as e:
+                        conn.send(('exported', str(e)))
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                last_stats = time.monotonic()
+                conn.send(('stats', {'latency': capture.latency_summary(), 'queue_latency': capture.queue_latency()}))
+    except (EOFError, OSError):
+        pass  # the GUI process went away; still stop below so the key is released
+    finally:
+        capture.stop()
+
+    times, kinds = capture.tracer.snapshot()
+    try:
+        conn.send(('stopped', {'noise_levels': capture.noise_levels(), 'times': times, 'kinds': kinds,
+                               'count': capture.tracer.count}))
+    except (EOFError, OSError):
+        pass
+    capture.history = None  # release the views before closing the mapping
+    history_shm.close()
+    ring.close()
+    p.terminate()
+
+
+class DSPWorkerClient:
+    """Drives a CaptureEngine in a worker process through the interface the GUI uses on CaptureEngine.
+
+    Takes the same arguments as CaptureEngine; `p` is unused because the
+    worker opens PortAudio itself. `history` is only valid while monitoring:
+    drop every reference to it before stop() unmaps the shared memory.
+    """
+
+    def __init__(self, p, device_index, fmt, channels, rate, chunk, window_duration, calibration_total,
+                 noise_percentile=50, hop_size=None, key_backend=None, extra_devices=(), capture_mode='callback',
+                 latency_budget=0.1, analysis_rate=None, session_log=None):
+        self.engine_args = (device_index, fmt, channels, rate, chunk, window_duration, calibration_total,
+                            noise_percentile, hop_size, key_backend, list(extra_devices), capture_mode,
+                            latency_budget, analysis_rate, session_log)
+        self.sources = [(device_index, channels)] + list(extra_devices)
+        self.rate = rate
+        self.hop = hop_size or chunk
+        self.capture_mode = capture_mode
+        self.settings = {}
+        self.tracer = LatencyTracer()  # filled with the worker's trace when it stops
+        self.stats = {'latency': {'decision': None, 'key': None}, 'queue_latency': None}
+        self.final_noise_levels = [None] * len(self.sources)
+        self.snapshot = {'seq': 0, 'level': None, 'threshold': None, 'state': 'idle', 'calibration_progress': 0,
+                         'dsp_cost': (0.0, 0.0), 'channel_levels': [], 'channel_thresholds': []}
+        self.process = None
+        self.conn = None
+        self.ring = None
+        self.history_shm = None
+        self.history = None
+
+    @property
+    def overruns(self):
+        return self.ring.counters()[0] if self.ring is not None else 0
+
+    @property
+    def dropped_frames(self):
+        return self.ring.counters()[1] if self.ring is not None else 0
+
+    @property
+    def backlog_frames(self):
+        return self.ring.counters()[2] if self.ring is not None else 0
+
+    def start(self, threshold=None, noise_levels=None):
+        try:
+            self.ring = LevelRing()
+            self.history_shm = shared_memory.SharedMemory(create=True,
+                                                          size=LevelHistory.nbytes(self.rate, self.hop))
+            self.history = LevelHistory(self.rate, self.hop, buffer=self.history_shm.buf)
+            context = multiprocessing.get_context('spawn')
+            self.conn, child_conn = context.Pipe()
+            self.process = context.Process(target=worker_main, name='DSPWorker', daemon=True,
+                                           args=(child_conn, self.ring.name, self.ring.capacity,
+                                                 self.history_shm.name, self.engine_args, self.settings,
+                                                 threshold, noise_levels))
+            self.process.start()
+            child_conn.close()
+            kind, error = self._wait_for(('started', 'error'), START_TIMEOUT)
+        except Exception as e:
+            # The worker died before it started (or never ran): don't leave the shared memory behind
+            self._shutdown()
+            if isinstance(e, OSError):
+                raise
+            raise OSError(f"DSP worker did not start: {str(e)}") from e
+        if kind != 'started':
+            self._shutdown()
+            raise OSError(error or "DSP worker did not start")
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(('stop', None))
+            kind, final = self._wait_for(('stopped',), REPLY_TIMEOUT)
+        except (EOFError, OSError):
+            kind = None
+        if kind == 'stopped':
+            self.final_noise_levels = final['noise_levels']
+            self.tracer.load(final['times'], final['kinds'], final['count'])
+        self._shutdown()
+
+    def _shutdown(self):
+        # Also cleans up after a start() that failed halfway, so every step checks what exists
+        if self.process is not None:
+            if self.process.pid is not None:
+                self.process.join(timeout=REPLY_TIMEOUT)
+                if self.process.is_alive():
+                    print("DSP worker did not exit; terminating it.")
+                    self.process.terminate()
+            self.process = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.snapshot = self.get_snapshot()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        self.history = None
+        if self.history_shm is not None:
+            self.history_shm.close()
+            self.history_shm.unlink()
+            self.history_shm = None
+
+    def _lost(self):
+        # The worker died while monitoring: release its resources so the GUI's timers see a stopped engine
+        print(f"{self._exit_message()}; monitoring stopped.")
+        self._shutdown()
+
+    def _exit_message(self):
+        self.process.join(timeout=REPLY_TIMEOUT)
+        if self.process.exitcode is None:
+            return "DSP worker closed its pipe"
+        return f"DSP worker exited with code {self.process.exitcode}"
+
+    def configure(self, **settings):
+        self.settings = settings
+        if self.conn is not None:
+            try:
+                self.conn.send(('configure', settings))
+            except OSError:
+                self._lost()
+
+    def get_snapshot(self):
+        if self.ring is None:
+            return dict(self.snapshot)
+        self._poll()
+        if self.ring is None:
+            return dict(self.snapshot)
+        snapshot = self.ring.read()
+        return snapshot if snapshot is not None else dict(self.snapshot)
+
+    def noise_levels(self):
+        if self.conn is None:
+            return self.final_noise_levels
+        try:
+            self.conn.send(('noise_levels', None))
+            kind, levels = self._wait_for(('noise_levels',), REPLY_TIMEOUT)
+        except OSError:
+            self._lost()
+            return self.final_noise_levels
+        return levels if kind == 'noise_levels' else [None] * len(self.sources)
+
+    def latency_summary(self):
+        self._poll()
+        return self.stats['latency']
+
+    def queue_latency(self):
+        self._poll()
+        return self.stats['queue_latency']
+
+    def export_trace(self, path, metadata=None):
+        if self.conn is None:
+            self.tracer.export(path, metadata)
+            return
+        self.conn.send(('export', (path, metadata)))
+        kind, error = self._wait_for(('exported',), REPLY_TIMEOUT)
+        if kind != 'exported' or error:
+            raise OSError(error or "DSP worker did not export the trace")
+
+    def _handle(self, kind, arg):
+        if kind == 'stats':
+            self.stats = arg
+
+    def _poll(self):
+        try:
+            while self.conn is not None and self.conn.poll():
+                self._handle(*self.conn.recv())
+        except (EOFError, OSError):
+            self._lost()
+
+    def _wait_for(self, kinds, timeout):
+        """Receive messages until one of `kinds` arrives; return (kind, arg), or (None, None) on timeout.
+
+        Raises OSError if the worker has gone away.
+        """
+        deadline = time.monotonic() + timeout
+        try:
+            while self.conn.poll(max(deadline - time.monotonic(), 0)):
+                kind, arg = self.conn.recv()
+                if kind in kinds:
+                    return kind, arg
+                self._handle(kind, arg)
+        except (EOFError, OSError) as e:
+            raise OSError(self._exit_message()) from e
+        return None, None
@@ -0,0 +1,230 @@
+"""Push-to-talk key injection off the audio path.
+
+The detector posts press/release intents to a KeyInjector. A dedicated,
+raised-priority thread applies them through a backend:
+
+    sendinput   Win32 SendInput (default on Windows)
+    pynput      pynput's keyboard Controller, for other platforms
+    recording   keeps events in memory; for tests and benchmarks
+"""
+import atexit
+import ctypes
+import sys
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from latency_trace import KIND_PRESS, KIND_RELEASE, latency_percentiles
+
+
+class RecordingBackend:
+    """Records (vk, pressed, perf_counter time) tuples instead of touching the OS."""
+
+    def __init__(self):
+        self.events = []
+
+    def press(self, vk):
+        self.events.append((vk, True, time.perf_counter()))
+
+    def release(self, vk):
+        self.events.append((vk, False, time.perf_counter()))
+
+
+class SendInputBackend:
+    INPUT_KEYBOARD = 1
+    KEYEVENTF_KEYUP = 0x0002
+
+    def __init__(self):
+        from ctypes import wintypes
+
+        class KEYBDINPUT(ctypes.Structure):
+            _fields_ = [('wVk', wintypes.WORD), ('wScan', wintypes.WORD), ('dwFlags', wintypes.DWORD),
+                        ('time', wintypes.DWORD), ('dwExtraInfo', wintypes.WPARAM)]
+
+        class MOUSEINPUT(ctypes.Structure):
+            _fields_ = [('dx', wintypes.LONG), ('dy', wintypes.LONG), ('mouseData', wintypes.DWORD),
+                        ('dwFlags', wintypes.DWORD), ('time', wintypes.DWORD), ('dwExtraInfo', wintypes.WPARAM)]
+
+        class INPUTUNION(ctypes.Union):
+            # The mouse member sizes the union the way Windows expects
+            _fields_ = [('ki', KEYBDINPUT), ('mi', MOUSEINPUT)]
+
+        class INPUT(ctypes.Structure):
+            _fields_ = [('type', wintypes.DWORD), ('union', INPUTUNION)]
+
+        self.INPUT = INPUT
+        self.user32 = ctypes.windll.user32
+        self.scan_codes = {}
+
+    def send(self, vk, flags):
+        scan = self.scan_codes.get(vk)
+        if scan is None:
+            # Games reading scan codes (DirectInput/raw input) ignore a bare VK
+            scan = self.scan_codes[vk] = self.user32.MapVirtualKeyW(vk, 0)
+        event = self.INPUT(type=self.INPUT_KEYBOARD)
+        event.union.ki.wVk = vk
+        event.union.ki.wScan = scan
+        event.union.ki.dwFlags = flags
+        if self.user32.SendInput(1, ctypes.byref(event), ctypes.sizeof(event)) != 1:
+            print(f"SendInput failed for key {vk}")
+
+    def press(self, vk):
+        self.send(vk, 0)
+
+    def release(self, vk):
+        self.send(vk, self.KEYEVENTF_KEYUP)
+
+
+class PynputBackend:
+    def __init__(self):
+        from pynput import keyboard
+        self.keyboard = keyboard
+        self.controller = keyboard.Controller()
+
+    def press(self, vk):
+        self.controller.press(self.keyboard.KeyCode.from_vk(vk))
+
+    def release(self, vk):
+        self.controller.release(self.keyboard.KeyCode.from_vk(vk))
+
+
+BACKENDS = {
+    'sendinput': SendInputBackend,
+    'pynput': PynputBackend,
+    'recording': RecordingBackend,
+}
+DEFAULT_BACKEND = 'sendinput' if sys.platform == 'win32' else 'pynput'
+
+
+def create_backend(name=None):
+    """Return the named backend (the platform default for None); raises OSError if it can't be used here."""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise OSError(f"unknown key backend '{name}'")
+    try:
+        return BACKENDS[name]()
+    except Exception as e:
+        # pynput missing or without a display, no user32 outside Windows, ...
+        raise OSError(f"key backend '{name}' is not available: {str(e)}") from e
+
+
+def raise_thread_priority():
+    if sys.platform == 'win32':
+        THREAD_PRIORITY_HIGHEST = 2
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_PRIORITY_HIGHEST)
+
+
+def raise_process_priority():
+    if sys.platform == 'win32':
+        HIGH_PRIORITY_CLASS = 0x80
+        kernel32 = ctypes.windll.kernel32
+        kernel32.SetPriorityClass(kernel32.GetCurrentProcess(), HIGH_PRIORITY_CLASS)
+
+
+class KeyInjector:
+    """Applies press/release intents on a dedicated thread.
+
+    post() only appends to a deque (atomic, no lock) and sets an event, so
+    the audio callback never waits on the OS input path. A release followed
+    by a press of the same key within `debounce` seconds cancels out, so the
+    key isn't chattered. Every key still held is released when the injector
+    stops, including at interpreter exit.
+    """
+
+    def __init__(self, backend, debounce=0.02, on_injected=None, latency_history=1024):
+        self.backend = backend
+        self.debounce = debounce
+        self.on_injected = on_injected  # called as on_injected(token, kind, perf_counter time)
+        self.intents = deque()
+        self.wakeup = threading.Event()
+        self.pressed = set()
+        self.pending_releases = {}  # vk -> (deadline, token)
+        self.latencies = deque(maxlen=latency_history)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='KeyInjector', daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        self.release_all()
+        atexit.unregister(self.stop)
+
+    def post(self, kind, vk, token=None):
+        self.intents.append((kind, vk, time.perf_counter(), token))
+        self.wakeup.set()
+
+    def press(self, vk, token=None):
+        self.post(KIND_PRESS, vk, token)
+
+    def release(self, vk, token=None):
+        self.post(KIND_RELEASE, vk, token)
+
+    def queue_latency(self):
+        """p50/p95/p99 time from post() to the backend call, in ms."""
+        return latency_percentiles(np.array(self.latencies))
+
+    def release_all(self):
+        for vk in list(self.pressed):
+            self._inject(KIND_RELEASE, vk, time.perf_counter(), None)
+        self.pending_releases.clear()
+
+    def _run(self):
+        raise_thread_priority()
+        try:
+            while self.running:
+                timeout = None
+                if self.pending_releases:
+                    timeout = max(min(d for d, _ in self.pending_releases.values()) - time.perf_counter(), 0)
+                self.wakeup.wait(timeout)
+                self.wakeup.clear()
+                while self.intents:
+                    self._apply(*self.intents.popleft())
+                now = time.perf_counter()
+                for vk, (deadline, token) in list(self.pending_releases.items()):
+                    if deadline <= now:
+                        # Latency counts from the end of the debounce window
+                        del self.pending_releases[vk]
+                        self._inject(KIND_RELEASE, vk, deadline, token)
+        finally:
+            self.release_all()
+
+    def _apply(self, kind, vk, posted, token):
+        if kind == KIND_PRESS:
+            if self.pending_releases.pop(vk, None) is not None:
+                return  # release/press inside the debounce window: keep holding
+            if vk not in self.pressed:
+                self._inject(kind, vk, posted, token)
+        elif vk in self.pressed:
+            if self.debounce > 0:
+                self.pending_releases[vk] = (posted + self.debounce, token)
+            else:
+                self._inject(kind, vk, posted, token)
+
+    def _inject(self, kind, vk, posted, token):
+        try:
+            if kind == KIND_PRESS:
+                self.backend.press(vk)
+                self.pressed.add(vk)
+            else:
+                self.backend.release(vk)
+                self.pressed.discard(vk)
+        except Exception as e:
+            print(f"Error injecting key {vk}: {str(e)}")
+            return
+        injected = time.perf_counter()
+        self.latencies.append(injected - posted)
+        if self.on_injected is not None:
+            self.on_injected(token, kind, injected)
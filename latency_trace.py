@@ -0,0 +1,159 @@
+"""Latency tracing from ADC capture to key injection.
+
+Every processed buffer gets one record in a fixed-size ring. All timestamps
+are on PortAudio's stream clock (seconds), so they can be compared with the
+input_buffer_adc_time PortAudio reports for the buffer:
+
+    adc       capture time of the buffer's first frame
+    callback  when the callback started running
+    decision  when the detector finished with the buffer
+    onset     start of the hop that pressed/released the key (NaN otherwise)
+    inject    when the key event was sent to the OS (NaN otherwise)
+
+Summarize an exported trace with:
+
+    python latency_trace.py trace.csv
+"""
+import csv
+import math
+import sys
+import threading
+
+import numpy as np
+
+
+KIND_NONE = 0
+KIND_PRESS = 1
+KIND_RELEASE = 2
+KIND_NAMES = {KIND_NONE: '', KIND_PRESS: 'press', KIND_RELEASE: 'release'}
+
+COLUMNS = ('adc', 'callback', 'decision', 'onset', 'inject')
+PERCENTILES = (50, 95, 99)
+
+
+def latency_percentiles(values, percentiles=PERCENTILES):
+    """Percentiles of the finite entries of `values` in ms, or None when there are none."""
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return None
+    return [float(v) * 1000 for v in np.percentile(values, percentiles)]
+
+
+class LatencyTracer:
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.times = np.full((capacity, len(COLUMNS)), np.nan)
+        self.kinds = np.zeros(capacity, dtype=np.uint8)
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def clear(self):
+        with self.lock:
+            self.times.fill(np.nan)
+            self.kinds.fill(KIND_NONE)
+            self.count = 0
+
+    def record(self, adc, callback, decision, kind=KIND_NONE, onset=math.nan, inject=math.nan):
+        """Store one buffer's timestamps and return its sequence number."""
+        with self.lock:
+            seq = self.count
+            row = self.times[seq % self.capacity]
+            row[0] = adc
+            row[1] = callback
+            row[2] = decision
+            row[3] = onset
+            row[4] = inject
+            self.kinds[seq % self.capacity] = kind
+            self.count = seq + 1
+        return seq
+
+    def set_inject(self, seq, inject):
+        """Fill in the injection time of a record once the key event has gone out."""
+        with self.lock:
+            if self.count - seq <= self.capacity:
+                self.times[seq % self.capacity, 4] = inject
+
+    def snapshot(self):
+        """Return (times, kinds) copies of the stored records, oldest first."""
+        with self.lock:
+            if self.count <= self.capacity:
+                return self.times[:self.count].copy(), self.kinds[:self.count].copy()
+            start = self.count % self.capacity
+            return np.roll(self.times, -start, axis=0), np.roll(self.kinds, -start)
+
+    def load(self, times, kinds, count):
+        """Replace the records with a snapshot() taken elsewhere, e.g. in the DSP worker process."""
+        with self.lock:
+            self.times.fill(np.nan)
+            self.kinds.fill(KIND_NONE)
+            times, kinds = times[-self.capacity:], kinds[-self.capacity:]
+            slots = np.arange(count - len(times), count) % self.capacity
+            self.times[slots] = times
+            self.kinds[slots] = kinds
+            self.count = count
+
+    def summary(self):
+        """Percentiles (ms) of the processing latency per buffer and of the onset-to-key latency."""
+        times, kinds = self.snapshot()
+        return summarize(times, kinds)
+
+    def export(self, path, metadata=None):
+        times, kinds = self.snapshot()
+        with open(path, 'w', newline='') as f:
+            for key, value in (metadata or {}).items():
+                f.write(f"# {key}={value}\n")
+            writer = csv.writer(f)
+            writer.writerow(('seq', 'kind') + COLUMNS)
+            first_seq = max(self.count - len(times), 0)
+            for i, (row, kind) in enumerate(zip(times.tolist(), kinds.tolist())):
+                writer.writerow([first_seq + i, KIND_NAMES[kind]] +
+                                ['' if math.isnan(v) else f"{v:.6f}" for v in row])
+
+
+def summarize(times, kinds):
+    events = kinds != KIND_NONE
+    return {
+        'decision': latency_percentiles(times[:, 2] - times[:, 0]),
+        'key': latency_percentiles(times[events, 4] - times[events, 3]),
+    }
+
+
+def load_trace(path):
+    rows = []
+    kinds = []
+    names = {name: kind for kind, name in KIND_NAMES.items()}
+    with open(path, newline='') as f:
+        reader = csv.DictReader(line for line in f if not line.startswith('#'))
+        for record in reader:
+            kinds.append(names[record['kind']])
+            rows.append([float(record[c]) if record[c] else math.nan for c in COLUMNS])
+    return np.array(rows, dtype=float).reshape(-1, len(COLUMNS)), np.array(kinds, dtype=np.uint8)
+
+
+def print_histogram(label, values, bins=10, width=40):
+    values = values[np.isfinite(values)] * 1000
+    if not len(values):
+        print(f"{label}: no samples")
+        return
+    p50, p95, p99 = np.percentile(values, PERCENTILES)
+    print(f"{label}: {len(values)} samples, p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms")
+    counts, edges = np.histogram(values, bins=bins)
+    for count, low, high in zip(counts, edges[:-1], edges[1:]):
+        bar = '#' * int(round(count / counts.max() * width))
+        print(f"  {low:8.1f} - {high:8.1f} ms  {count:6d}  {bar}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print("usage: python latency_trace.py trace.csv", file=sys.stderr)
+        return 2
+    times, kinds = load_trace(argv[0])
+    events = kinds != KIND_NONE
+    print_histogram("ADC to decision", times[:, 2] - times[:, 0])
+    print_histogram("Onset to key event", times[events, 4] - times[events, 3])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
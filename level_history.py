@@ -0,0 +1,183 @@
+"""Scrolling level history and spectrogram for the Magic Push-to-Talk window.
+
+LevelHistory is an image ring: one preallocated uint32 array of 0xAARRGGBB
+pixels with a column per analysis hop, written in place by the capture path
+and shown by the GUI through a QImage over the very same memory. From top to
+bottom each column holds
+
+    spectrum    SPECTRUM_ROWS rows, 0 Hz at the bottom, up to 8 kHz
+    level       LEVEL_ROWS rows, a bar up to the hop's level, green above the
+                threshold and grey below it, with the threshold as a tick
+    gate        STATE_ROWS rows colored by the gate state; a white column
+                marks a press and a red one a release
+
+The array can live in a shared memory block (`buffer`), so a DSP worker
+process fills what the window draws. Only the end of each hop is analyzed,
+summed in blocks down to about 16 kHz (nothing above 8 kHz is shown; the
+aliasing a block sum lets through is fine for a picture), so the FFT stays
+FFT_SIZE frames long whatever the hop size.
+Only numpy is needed here.
+"""
+import numpy as np
+
+
+SPECTRUM_ROWS = 64
+LEVEL_ROWS = 48
+STATE_ROWS = 6
+ROWS = SPECTRUM_ROWS + LEVEL_ROWS + STATE_ROWS
+MAX_FREQUENCY = 8000.0  # Hz at the top of the spectrum
+FFT_SIZE = 256  # longest spectrum frame, after decimation
+SPECTRUM_RANGE = (-100.0, -20.0)  # dB full scale mapped onto the palette
+HEADER = 2  # int64 slots before the image: [columns written, 0]
+
+BACKGROUND = 0xff333333
+LEVEL_BELOW = 0xff78909c
+LEVEL_ABOVE = 0xff4caf50
+THRESHOLD = 0xffff5722
+PRESS = 0xffffffff
+RELEASE = 0xfff44336
+STATE_COLORS = {
+    'idle': BACKGROUND,
+    'calibrating': 0xff2196f3,
+    'attack': 0xffffeb3b,
+    'voice': 0xff4caf50,
+    'hold': 0xff2e7d32,
+}
+
+
+def spectrum_palette(size=256):
+    """Black through purple and orange to pale yellow, as 0xAARRGGBB."""
+    stops = np.array([0.0, 0.3, 0.6, 0.85, 1.0])
+    colors = np.array([[0, 0, 4], [87, 16, 110], [188, 55, 84], [249, 142, 9], [252, 255, 164]], dtype=float)
+    x = np.linspace(0, 1, size)
+    rgb = np.stack([np.interp(x, stops, colors[:, c]) for c in range(3)], axis=1).round().astype(np.uint32)
+    return 0xff000000 | rgb[:, 0] << 16 | rgb[:, 1] << 8 | rgb[:, 2]
+
+
+class LevelHistory:
+    """Image ring of the last `seconds` of spectra, levels, thresholds and gate states.
+
+    write() adds one column per hop at `written % columns`; readers draw the
+    columns from there to the end and then from the start, oldest first.
+    """
+
+    PALETTE = spectrum_palette()
+
+    def __init__(self, rate, hop, seconds=10.0, level_range=(-60.0, 0.0), buffer=None, max_hops=64):
+        self.rate = rate
+        self.hop = hop
+        self.columns = self.columns_for(rate, hop, seconds)
+        if buffer is None:
+            buffer = bytearray(self.nbytes(rate, hop, seconds))
+        self.header = np.ndarray((HEADER,), dtype=np.int64, buffer=buffer)
+        self.image = np.ndarray((ROWS, self.columns), dtype=np.uint32, buffer=buffer, offset=HEADER * 8)
+
+        # Spectrum bins averaged into each spectrogram row, top row first
+        self.decimation = max(min(int(rate // (2 * MAX_FREQUENCY)), hop // 2), 1)
+        fft_rate = rate / self.decimation
+        fft_hop = min(hop // self.decimation, FFT_SIZE)
+        self.first_frame = hop - fft_hop * self.decimation  # where the analyzed end of a hop starts
+        freqs = np.fft.rfftfreq(fft_hop, 1 / fft_rate)
+        top = min(MAX_FREQUENCY, fft_rate / 2)
+        self.bands = np.zeros((len(freqs), SPECTRUM_ROWS))
+        edges = np.linspace(0, top, SPECTRUM_ROWS + 1)
+        for row in range(SPECTRUM_ROWS):
+            inside = np.flatnonzero((freqs >= edges[row]) & (freqs < edges[row + 1]))
+            if not len(inside):
+                inside = [int(np.abs(freqs - (edges[row] + edges[row + 1]) / 2).argmin())]
+            self.bands[inside, SPECTRUM_ROWS - 1 - row] = 1.0 / len(inside)
+        self.window = np.hanning(fft_hop).astype(np.float32)
+        # Relative to a full-scale sine through the window (and the block sums), so rows read in dB full scale
+        self.bands /= (self.window.sum() / 2 * 32768.0 * self.decimation) ** 2
+        # Band power at which each palette color starts
+        low, high = SPECTRUM_RANGE
+        self.color_edges = 10 ** (np.linspace(low, high, len(self.PALETTE) + 1)[1:-1] / 10)
+
+        # Level of each level-area row, top row first; a row is lit when the level reaches it
+        low, high = level_range
+        self.level_range = level_range
+        self.row_levels = high - (np.arange(LEVEL_ROWS) + 0.5) * (high - low) / LEVEL_ROWS
+        self._allocate(max_hops)
+        self.reset()
+
+    @staticmethod
+    def columns_for(rate, hop, seconds):
+        return min(max(int(seconds * rate / hop), 64), 4096)
+
+    @classmethod
+    def nbytes(cls, rate, hop, seconds=10.0):
+        """Bytes of buffer a LevelHistory with these arguments needs."""
+        return HEADER * 8 + ROWS * cls.columns_for(rate, hop, seconds) * 4
+
+    def _allocate(self, max_hops):
+        fft_hop = len(self.window)
+        self._decimated = np.zeros((max_hops, fft_hop), dtype=np.float32)
+        self._windowed = np.zeros((max_hops, fft_hop), dtype=np.float32)
+        self._power = np.zeros((max_hops, fft_hop // 2 + 1))
+        self._bands = np.zeros((max_hops, SPECTRUM_ROWS))
+        self._column = np.zeros((max_hops, ROWS), dtype=np.uint32)
+        self._lit = np.zeros((max_hops, LEVEL_ROWS), dtype=bool)
+
+    @property
+    def written(self):
+        """Columns written since the last reset()."""
+        return int(self.header[0])
+
+    def reset(self):
+        self.image.fill(BACKGROUND)
+        self.header[:] = 0
+
+    def write(self, rows, levels, threshold=None, state='idle', events=()):
+        """Add a column for every hop in `rows` (hops x hop frames) with its dB level.
+
+        `threshold` and `state` hold for the whole batch; `events` are
+        (hop index, 'press'/'release') pairs, as GateStateMachine.feed() returns,
+        marked on the column of their hop.
+        """
+        hops = len(levels)
+        if not hops:
+            return
+        if hops > len(self._column):
+            self._allocate(hops)
+        column = self._column[:hops]
+
+        # Spectrum: windowed rfft power averaged into bands, as palette colors
+        rows = rows[:, self.first_frame:]
+        if self.decimation > 1:
+            blocks = rows.reshape(hops, -1, self.decimation)
+            rows = self._decimated[:hops]
+            np.add(blocks[:, :, 0], blocks[:, :, 1], out=rows)
+            for k in range(2, self.decimation):
+                rows += blocks[:, :, k]
+        windowed = self._windowed[:hops]
+        power = self._power[:hops]
+        bands = self._bands[:hops]
+        np.multiply(rows, self.window, out=windowed)
+        spectrum = np.fft.rfft(windowed, axis=1)
+        np.abs(spectrum, out=power)
+        np.square(power, out=power)
+        np.matmul(power, self.bands, out=bands)
+        np.take(self.PALETTE, np.searchsorted(self.color_edges, bands), out=column[:, :SPECTRUM_ROWS])
+
+        # Level bar, colored by whether the hop crossed the threshold, and the threshold tick
+        area = column[:, SPECTRUM_ROWS:SPECTRUM_ROWS + LEVEL_ROWS]
+        lit = self._lit[:hops]
+        np.less_equal(self.row_levels, np.asarray(levels)[:, None], out=lit)
+        area.fill(BACKGROUND)
+        if threshold is None:
+            area[lit] = LEVEL_BELOW
+        else:
+            for i, level in enumerate(levels):
+                area[i, lit[i]] = LEVEL_ABOVE if level > threshold else LEVEL_BELOW
+            low, high = self.level_range
+            if low <= threshold <= high:
+                area[:, min(int((high - threshold) / (high - low) * LEVEL_ROWS), LEVEL_ROWS - 1)] = THRESHOLD
+
+        column[:, SPECTRUM_ROWS + LEVEL_ROWS:] = STATE_COLORS.get(state, BACKGROUND)
+        for i, kind in events:
+            column[i, SPECTRUM_ROWS + LEVEL_ROWS:] = PRESS if kind == 'press' else RELEASE
+
+        written = int(self.header[0])
+        for i in range(hops):
+            self.image[:, (written + i) % self.columns] = column[i]
+        self.header[0] = written + hops
@@ -1,39 +1,164 @@
 import sys
-import pyaudio
-import numpy as np
-from pynput import keyboard
-from collections import deque
-from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QComboBox, QPushButton, QLabel, QSlider, QProgressBar, QStatusBar, QCheckBox
-from PyQt6.QtCore import QTimer, Qt
-from PyQt6.QtGui import QFont
-import configparser
-import os
-import time
-import win32api
-import win32con
-from PyQt6.QtWidgets import QLabel
-
-
-
-class ColorProgressBar(QProgressBar):
+from startup_timing import StartupTimer
+STARTUP = StartupTimer()  # before anything else, so the imports are timed
+
+# PyAudio, numpy, pynput and the capture/key injection modules are imported
+# lazily, off the path to the first paint.
+import threading  # noqa: E402
+from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QComboBox, QPushButton, QLabel, QSlider, QStatusBar, QCheckBox, QFileDialog  # noqa: E402
+from PyQt6.QtCore import QTimer, Qt, QRectF, QEvent, pyqtSignal  # noqa: E402
+from PyQt6.QtGui import QFont, QColor, QImage, QLinearGradient, QPainter, QPainterPath, QPen  # noqa: E402
+import time  # noqa: E402
+import configparser  # noqa: E402
+import os  # noqa: E402
+from PyQt6.QtWidgets import QLabel  # noqa: E402
+from key_names import get_key_name  # noqa: E402
+STARTUP.since_start('imports')
+
+
+class LevelMeterWidget(QWidget):
+    """Audio level bar with a threshold marker and peak hold, painted in a single pass.
+
+    set_values() only schedules a repaint when one of the drawn pixel
+    positions actually moves, and never changes the widget's geometry, so
+    meter updates don't trigger stylesheet polish or layout reflow.
+    """
+
+    PEAK_HOLD = 1.0  # seconds the peak marker stays put
+    PEAK_DECAY = 20.0  # dB per second the peak marker falls afterwards
+
+    def __init__(self, minimum=-60, maximum=0, parent=None):
+        super().__init__(parent)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.setFixedHeight(24)
+        self.level = None
+        self.threshold = None
+        self.peak = None  # where the peak marker is drawn
+        self.held_peak = None  # the peak it decays from
+        self.peak_time = 0.0
+        self.drawn = None
+        self.gradient = None
+
+    def set_values(self, level, threshold, now):
+        if level is not None:
+            if self.peak is None or level >= self.peak:
+                self.peak = self.held_peak = level
+                self.peak_time = now
+            elif now - self.peak_time > self.PEAK_HOLD:
+                decayed = self.held_peak - self.PEAK_DECAY * (now - self.peak_time - self.PEAK_HOLD)
+                self.peak = max(level, decayed)
+        self.level = level
+        self.threshold = threshold
+
+        positions = (self.position(level), self.position(threshold), self.position(self.peak))
+        if positions != self.drawn:
+            self.drawn = positions
+            self.update()
+
+    def reset(self):
+        self.level = self.threshold = self.peak = self.held_peak = None
+        self.drawn = None
+        self.update()
+
+    def position(self, value):
+        if value is None:
+            return None
+        fraction = (value - self.minimum) / (self.maximum - self.minimum)
+        return int(min(max(fraction, 0.0), 1.0) * (self.width() - 4)) + 2
+
+    def resizeEvent(self, event):
+        self.gradient = QLinearGradient(0, 0, self.width(), 0)
+        self.gradient.setColorAt(0.0, QColor("#4caf50"))
+        self.gradient.setColorAt(0.5, QColor("#ffeb3b"))
+        self.gradient.setColorAt(1.0, QColor("#f44336"))
+        self.drawn = None
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = QRectF(self.rect()).adjusted(1, 1, -1, -1)
+        painter.setPen(QPen(QColor("#444"), 2))
+        painter.setBrush(QColor("#333"))
+        painter.drawRoundedRect(rect, 10, 10)
+
+        level_x, threshold_x, peak_x = self.drawn or (None, None, None)
+        painter.setPen(Qt.PenStyle.NoPen)
+        if level_x is not None and self.gradient is not None:
+            path = QPainterPath()
+            path.addRoundedRect(rect.adjusted(1, 1, -1, -1), 9, 9)
+            painter.setClipPath(path)
+            painter.fillRect(QRectF(0, 0, level_x, self.height()), self.gradient)
+            painter.setClipping(False)
+        if peak_x is not None:
+            painter.fillRect(QRectF(peak_x - 1, 4, 2, self.height() - 8), QColor("#eee"))
+        if threshold_x is not None:
+            painter.fillRect(QRectF(threshold_x - 1.5, 0, 3, self.height()), QColor("#ff5722"))
+        painter.end()
+
+
+class LevelHistoryWidget(QWidget):
+    """Scrolling spectrogram, level, threshold and gate history, drawn straight from a LevelHistory.
+
+    The QImage wraps the history's pixel array (level_history.py) without
+    copying it. A 60 fps timer repaints only when new columns were written,
+    and the ring is drawn in two pieces, oldest columns first, scaled to the
+    widget.
+    """
+
+    FRAME_INTERVAL = 16  # ms between checks for new columns
+
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.setTextVisible(False)
-        self.setStyleSheet("""
-            QProgressBar {
-                border: 2px solid #444;
-                border-radius: 10px;
-                text-align: center;
-                background-color: #333;
-                height: 15px;
-            }
-            QProgressBar::chunk {
-                background-color: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #4caf50, stop:0.5 #ffeb3b, stop:1 #f44336);
-                border-radius: 10px;
-            }
-        """)
+        self.setFixedHeight(118)  # one pixel per image row
+        self.history = None
+        self.image = None
+        self.written = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    def set_history(self, history):
+        """Draw `history` as it fills; None keeps showing a copy of the last picture and lets go of its memory."""
+        self.timer.stop()
+        self.history = history
+        if history is None:
+            if self.image is not None:
+                self.image = self.image.copy()
+            return
+        rows, columns = history.image.shape
+        self.image = QImage(history.image.data, columns, rows, columns * 4, QImage.Format.Format_RGB32)
+        self.written = 0
+        self.timer.start(self.FRAME_INTERVAL)
+        self.update()
+
+    def refresh(self):
+        if self.history.written != self.written and self.isVisible():
+            self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        if self.image is None:
+            painter.fillRect(self.rect(), QColor("#333"))
+            painter.end()
+            return
+        if self.history is not None:
+            self.written = self.history.written
+        columns = self.image.width()
+        head = self.written % columns
+        split = self.width() * (columns - head) / columns
+        height = self.height()
+        painter.drawImage(QRectF(0, 0, split, height), self.image, QRectF(head, 0, columns - head, self.image.height()))
+        if head:
+            painter.drawImage(QRectF(split, 0, self.width() - split, height), self.image,
+                              QRectF(0, 0, head, self.image.height()))
+        painter.end()
+
 
 class MagicPTTApp(QMainWindow):
+    audio_ready = pyqtSignal(object, object)  # (PyAudio instance or None, [(device name, index)])
+    ptt_key_captured = pyqtSignal(int, str)  # (virtual key code, name), from the pynput listener thread
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Magic Push-to-Talk")
@@ -46,23 +171,32 @@ class MagicPTTApp(QMainWindow):
 
         self.config = configparser.ConfigParser()
         self.config_file = 'magic_ptt_config.ini'
+        self.calibration_file = 'magic_ptt_calibration.ini'
+        self.calibration_cache = None  # created once the audio modules have loaded
+        self.capture = None  # set before load_config(), whose widget changes call sync_capture_settings()
 
-        self.setup_ui()
+        self.startup_report = '--startup-report' in sys.argv
+        with STARTUP.phase('setup_ui'):
+            self.setup_ui()
         self.setup_audio()
-        self.load_config()
+        with STARTUP.phase('load_config'):
+            self.load_config()
+        self.central_widget.installEventFilter(self)  # to time the first paint
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_audio)
         self.is_running = False
         self.is_calibrating = False
-        self.calibration_samples = 0
-        self.calibration_total = 100  # Number of samples for calibration
+        self.calibration_total = 100  # Number of buffers for calibration
 
         self.ptt_key = 0x56  # Virtual key code for 'V'
-        self.ptt_active = False
 
         self.test_mode = False
-        self.last_active_time = 0
+        self.tracer = None  # Latency trace of the current or last monitoring session
+        self.LATENCY_REFRESH = 20  # Display ticks between latency and DSP cost refreshes
+        self.latency_ticks = 0
+        self.rendered_seq = None  # Detector buffer count of the last rendered snapshot
+        self.rendered_text = {}  # Last text set on each label, to skip unchanged updates
 
 
     def setup_ui(self):
@@ -87,6 +221,15 @@ class MagicPTTApp(QMainWindow):
         self.layout.addWidget(self.threshold_label)
         self.layout.addWidget(self.threshold_slider)
         self.threshold_slider.valueChanged.connect(self.update_threshold_label)
+        self.threshold_slider.valueChanged.connect(self.sync_capture_settings)
+
+        # How the noise floor under the threshold offset is estimated
+        self.noise_floor_combo = QComboBox()
+        self.noise_floor_combo.addItem("Median of recent levels", 'median')
+        self.noise_floor_combo.addItem("Adaptive (ignores speech)", 'adaptive')
+        self.noise_floor_combo.currentIndexChanged.connect(self.sync_capture_settings)
+        self.layout.addWidget(self.create_label("Noise Floor:"))
+        self.layout.addWidget(self.noise_floor_combo)
 
         # Timeout duration slider
         self.timeout_slider = QSlider(Qt.Orientation.Horizontal)
@@ -96,6 +239,7 @@ class MagicPTTApp(QMainWindow):
         self.layout.addWidget(self.timeout_label)
         self.layout.addWidget(self.timeout_slider)
         self.timeout_slider.valueChanged.connect(self.update_timeout_label)
+        self.timeout_slider.valueChanged.connect(self.sync_capture_settings)
 
         # Manual threshold mode
         self.manual_threshold_checkbox = self.create_checkbox("Use Manual Threshold")
@@ -111,6 +255,21 @@ class MagicPTTApp(QMainWindow):
         self.layout.addWidget(self.manual_threshold_label)
         self.layout.addWidget(self.manual_threshold_slider)
         self.manual_threshold_slider.valueChanged.connect(self.update_manual_threshold_label)
+        self.manual_threshold_slider.valueChanged.connect(self.sync_capture_settings)
+
+        # Spectral voice detection
+        self.spectral_vad_checkbox = self.create_checkbox("Ignore Non-Speech Sounds (Clicks, Fans)")
+        self.spectral_vad_checkbox.stateChanged.connect(self.sync_capture_settings)
+        self.layout.addWidget(self.spectral_vad_checkbox)
+
+        # How channels and extra microphones are combined into one key decision
+        self.combine_combo = QComboBox()
+        self.combine_combo.addItem("Any channel is loud", 'any')
+        self.combine_combo.addItem("All channels are loud", 'all')
+        self.combine_combo.addItem("Weighted channel vote", 'weighted')
+        self.combine_combo.currentIndexChanged.connect(self.sync_capture_settings)
+        self.layout.addWidget(self.create_label("Multiple Channels/Microphones:"))
+        self.layout.addWidget(self.combine_combo)
 
         # Start/Stop button
         self.start_stop_button = self.create_button("Start", primary=True)
@@ -122,6 +281,12 @@ class MagicPTTApp(QMainWindow):
         self.test_mode_checkbox.stateChanged.connect(self.toggle_test_mode)
         self.layout.addWidget(self.test_mode_checkbox)
 
+        # Latency trace export
+        self.export_trace_button = self.create_button("Export Latency Trace")
+        self.export_trace_button.clicked.connect(self.export_latency_trace)
+        self.export_trace_button.setEnabled(False)
+        self.layout.addWidget(self.export_trace_button)
+
         # Status message
         self.status_label = self.create_label("Ready to start", large=True)
         self.layout.addWidget(self.status_label)
@@ -129,25 +294,34 @@ class MagicPTTApp(QMainWindow):
         # Audio level display
         self.level_label = self.create_label("Current Level: N/A")
         self.threshold_display_label = self.create_label("Current Threshold: N/A")
+        self.channel_levels_label = self.create_label("")
         self.layout.addWidget(self.level_label)
         self.layout.addWidget(self.threshold_display_label)
+        self.layout.addWidget(self.channel_levels_label)
 
-        # Visual audio meter
-        self.audio_meter = ColorProgressBar()
-        self.audio_meter.setRange(-60, 0)  # Typical range for audio levels in dB
+        # Visual audio meter with threshold marker and peak hold
+        self.audio_meter = LevelMeterWidget(-60, 0)  # Typical range for audio levels in dB
         self.layout.addWidget(self.create_label("Audio Level:"))
         self.layout.addWidget(self.audio_meter)
 
-        # Threshold indicator
-        self.threshold_indicator = QWidget()
-        self.threshold_indicator.setFixedHeight(5)
-        self.threshold_indicator.setStyleSheet("background-color: #ff5722;")
-        self.layout.addWidget(self.threshold_indicator)
+        # Scrolling spectrogram and level history with the threshold and gate state
+        self.level_history_checkbox = self.create_checkbox("Show Level History & Spectrogram")
+        self.level_history_checkbox.setChecked(True)
+        self.level_history_checkbox.stateChanged.connect(self.toggle_level_history)
+        self.layout.addWidget(self.level_history_checkbox)
+        self.history_view = LevelHistoryWidget()
+        self.layout.addWidget(self.history_view)
 
         # Status bar
         self.statusBar = QStatusBar()
         self.setStatusBar(self.statusBar)
         self.statusBar.setStyleSheet("background-color: #333; color: #eee;")
+        self.latency_label = QLabel("")
+        self.statusBar.addPermanentWidget(self.latency_label)
+        self.dsp_cost_label = QLabel("")
+        self.statusBar.addPermanentWidget(self.dsp_cost_label)
+        self.xrun_label = QLabel("")
+        self.statusBar.addPermanentWidget(self.xrun_label)
 
     def create_label(self, text, large=False):
         label = QLabel(text)
@@ -203,11 +377,16 @@ class MagicPTTApp(QMainWindow):
     def toggle_manual_threshold(self, state):
         manual_mode = bool(state)
         self.manual_threshold_slider.setEnabled(manual_mode)
+        self.sync_capture_settings()
         if manual_mode:
             self.statusBar.showMessage("Manual Threshold Mode Active")
         else:
             self.statusBar.showMessage("Automatic Threshold Mode Active")
 
+    def toggle_level_history(self, state):
+        self.history_view.setVisible(bool(state))
+        self.sync_capture_settings()
+
     def update_manual_threshold_label(self):
         value = self.manual_threshold_slider.value()
         self.manual_threshold_label.setText(f"Manual Threshold: {value} dB")
@@ -215,25 +394,106 @@ class MagicPTTApp(QMainWindow):
     # Rest of the methods remain unchanged
 
     def setup_audio(self):
-        self.p = pyaudio.PyAudio()
-        self.update_mic_list()
-        
-        self.CHUNK = 1024
-        self.FORMAT = pyaudio.paInt16
-        self.CHANNELS = 1
-        self.RATE = 44100
-        self.WINDOW_DURATION = 5
-        self.UPDATE_INTERVAL = 50  # ms, increased update frequency for smoother meter
+        self.p = None  # PyAudio instance, created by init_audio on a worker thread
+        self.configured_microphone = ''
+        self.start_stop_button.setEnabled(False)
+        self.statusBar.showMessage("Initializing audio...")
+        self.audio_ready.connect(self.on_audio_ready)
+        self.ptt_key_captured.connect(self.set_ptt_key)
+        threading.Thread(target=self.init_audio, name='AudioInit', daemon=True).start()
+
+        self.CHUNK = 1024  # frames per buffer, derived from BUFFER_MS when monitoring starts
+        self.BUFFER_MS = 20  # target buffer length in ms
+        self.FORMAT = None  # pyaudio.paInt16, set once PyAudio has loaded
+        self.CHANNELS = 1  # channels per microphone, each gated against its own noise floor
+        self.EXTRA_MICROPHONES = []  # names of additional microphones that can also trigger the key
+        self.CHANNEL_WEIGHTS = []  # per-channel weights for the weighted vote, in device order
+        self.RATE = 44100  # the microphone's default rate once monitoring starts
+        self.SAMPLE_RATE = 0  # Hz, 0 = open the microphone at its default (native) rate
+        self.ANALYSIS_RATE = 0  # Hz the spectral VAD decimates to, 0 = the full rate (its thresholds are tuned for)
+        self.WINDOW_DURATION = 5  # s of history for the automatic noise floor
+        self.NOISE_PERCENTILE = 50  # percentile of that history used as the noise floor
+        self.HOP_SIZE = 0  # frames per level measurement, 0 = one per CHUNK (64-256 for low latency)
+        self.KEY_BACKEND = ''  # key injection backend, empty = platform default
+        self.ATTACK_HOPS = 1  # loud hops in a row before the key is pressed
+        self.HYSTERESIS = 3.0  # dB below the threshold the level must fall before the release delay starts
+        self.CAPTURE_MODE = 'callback'  # or 'blocking': a reader thread drains the queued audio in batches
+        self.LATENCY_BUDGET = 100  # ms of queued audio kept in blocking mode; older audio is dropped
+        self.DSP_PROCESS = False  # run capture, detection and key injection in a worker process
+        self.SESSION_LOG = False  # record levels, gate and key events to session_logs/ (see session_log.py)
+        self.UPDATE_INTERVAL = 50  # ms, caps the display at 20 fps; detection runs per buffer
+        self.CALIBRATION_SAVE_INTERVAL = 30  # s between calibration cache updates while monitoring
 
-        self.audio_levels = deque(maxlen=int(self.WINDOW_DURATION * self.RATE / self.CHUNK))
         self.threshold = None
+        self.legacy_threshold = None  # threshold from a config written before the calibration cache
+        self.calibration_saved_at = 0.0
+
+    def init_audio(self):
+        # Runs on a worker thread: loading PortAudio and scanning the devices
+        # can take a second or more with some drivers, so the window shows first.
+        p = None
+        devices = []
+        try:
+            with STARTUP.phase('audio imports'):
+                import pyaudio
+                import capture_engine  # noqa: F401 (numpy and the key injection backends)
+                import calibration_cache  # noqa: F401
+            with STARTUP.phase('PortAudio init'):
+                p = pyaudio.PyAudio()
+            with STARTUP.phase('device enumeration'):
+                for i in range(p.get_device_count()):
+                    dev = p.get_device_info_by_index(i)
+                    if dev['maxInputChannels'] > 0:
+                        devices.append((dev['name'], i))
+        except Exception as e:
+            print(f"Error initializing audio: {str(e)}")
+        self.audio_ready.emit(p, devices)
 
-    def update_mic_list(self):
+    def on_audio_ready(self, p, devices):
+        STARTUP.mark('audio ready')
+        if p is None:
+            self.statusBar.showMessage("Audio initialization failed")
+            return
+        import pyaudio
+        from calibration_cache import CalibrationCache
+
+        self.p = p
+        self.FORMAT = pyaudio.paInt16
+        self.calibration_cache = CalibrationCache(self.calibration_file)
+        self.update_mic_list(devices)
+
+        mic_index = self.mic_combo.findText(self.configured_microphone)
+        if mic_index >= 0:
+            self.mic_combo.setCurrentIndex(mic_index)
+        elif self.configured_microphone:
+            print(f"Configured microphone '{self.configured_microphone}' not found. Using default.")
+
+        from key_injection import BACKENDS
+        if self.KEY_BACKEND not in BACKENDS:
+            if self.KEY_BACKEND:
+                print(f"Unknown key_backend '{self.KEY_BACKEND}' (use one of: {', '.join(BACKENDS)}). Using default.")
+            self.KEY_BACKEND = ''
+
+        self.start_stop_button.setEnabled(True)
+        self.statusBar.showMessage("Ready")
+        self.print_startup_report()
+
+    def eventFilter(self, watched, event):
+        if watched is self.central_widget and event.type() == QEvent.Type.Paint:
+            self.central_widget.removeEventFilter(self)
+            STARTUP.mark('first paint')
+            self.print_startup_report()
+        return super().eventFilter(watched, event)
+
+    def print_startup_report(self):
+        if self.startup_report and STARTUP.has('first paint') and STARTUP.has('audio ready'):
+            self.startup_report = False
+            STARTUP.report()
+
+    def update_mic_list(self, devices):
         self.mic_combo.clear()
-        for i in range(self.p.get_device_count()):
-            dev = self.p.get_device_info_by_index(i)
-            if dev['maxInputChannels'] > 0:
-                self.mic_combo.addItem(dev['name'], i)
+        for name, index in devices:
+            self.mic_combo.addItem(name, index)
 
     def update_threshold_label(self):
         value = self.threshold_slider.value()
@@ -244,153 +504,323 @@ class MagicPTTApp(QMainWindow):
         self.timeout_label.setText(f"Release Delay Duration: {value} ms")
 
     def capture_ptt_key(self):
+        from pynput import keyboard
+
         self.ptt_key_button.setText("Press any key...")
         self.ptt_key_button.setEnabled(False)
         
         def on_press(key):
+            # Runs on the listener thread: hand the key to the GUI thread, which
+            # owns the widgets and the DSP worker's pipe
+            vk = self.ptt_key
             try:
                 if hasattr(key, 'vk'):
-                    self.ptt_key = key.vk
+                    vk = key.vk
                     key_name = key.char if hasattr(key, 'char') else key.name
                 else:
-                    self.ptt_key = key.value.vk
+                    vk = key.value.vk
                     key_name = key.name
-                self.ptt_key_button.setText(f"Set Push-to-Talk Key (current: {key_name})")
             except AttributeError:
-                self.ptt_key_button.setText(f"Set Push-to-Talk Key (current: {key})")
-            self.ptt_key_button.setEnabled(True)
+                key_name = str(key)
+            self.ptt_key_captured.emit(vk, str(key_name))
             return False  # Stop listener
 
         listener = keyboard.Listener(on_press=on_press)
         listener.start()
 
+    def set_ptt_key(self, vk, key_name):
+        self.ptt_key = vk
+        self.ptt_key_button.setText(f"Set Push-to-Talk Key (current: {key_name})")
+        self.ptt_key_button.setEnabled(True)
+        self.sync_capture_settings()
+
     def toggle_monitoring(self):
+        if self.p is None:
+            return
         if self.is_running:
             self.stop_monitoring()
         else:
             self.start_monitoring()
 
+    def sync_capture_settings(self):
+        if self.capture is None:
+            return
+        manual_threshold = None
+        if self.manual_threshold_checkbox.isChecked():
+            manual_threshold = self.manual_threshold_slider.value()
+        self.capture.configure(
+            threshold_offset=self.threshold_slider.value(),
+            timeout_duration=self.timeout_slider.value() / 1000,  # Convert ms to seconds
+            manual_threshold=manual_threshold,
+            vad_enabled=self.spectral_vad_checkbox.isChecked(),
+            attack_hops=self.ATTACK_HOPS,
+            hysteresis=self.HYSTERESIS,
+            combine_rule=self.combine_combo.currentData(),
+            channel_weights=self.CHANNEL_WEIGHTS,
+            ptt_key=self.ptt_key,
+            test_mode=self.test_mode,
+            noise_tracking=self.noise_floor_combo.currentData(),
+            show_history=self.level_history_checkbox.isChecked(),
+        )
+
+    def device_channels(self, device_index):
+        max_channels = int(self.p.get_device_info_by_index(device_index)['maxInputChannels'])
+        return max(min(self.CHANNELS, max_channels), 1)
+
+    def session_log_directory(self):
+        return os.path.join(os.path.dirname(os.path.abspath(self.config_file)), 'session_logs')
+
+    def stream_format(self, device_index):
+        # Native rate, so the host API doesn't resample; extra microphones are opened at the same rate
+        rate = self.SAMPLE_RATE or int(self.p.get_device_info_by_index(device_index)['defaultSampleRate'])
+        return rate, max(int(round(rate * self.BUFFER_MS / 1000)), 64)
+
+    def extra_devices(self, device_index):
+        devices = []
+        for name in self.EXTRA_MICROPHONES:
+            index = self.mic_combo.findText(name)
+            if index < 0:
+                print(f"Extra microphone '{name}' not found. Skipping.")
+                continue
+            extra_index = self.mic_combo.itemData(index)
+            if extra_index != device_index and extra_index not in [d for d, _ in devices]:
+                devices.append((extra_index, self.device_channels(extra_index)))
+        return devices
+
     def start_monitoring(self):
+        if self.DSP_PROCESS:
+            from dsp_worker import DSPWorkerClient as CaptureEngine
+        else:
+            from capture_engine import CaptureEngine
+
         device_index = self.mic_combo.currentData()
-        self.stream = self.p.open(format=self.FORMAT,
-                                  channels=self.CHANNELS,
-                                  rate=self.RATE,
-                                  input=True,
-                                  input_device_index=device_index,
-                                  frames_per_buffer=self.CHUNK)
-        self.timer.start(self.UPDATE_INTERVAL)
-        self.is_running = True
-        self.start_stop_button.setText("Stop")
-        
+        self.RATE, self.CHUNK = self.stream_format(device_index)
+        try:
+            self.capture = CaptureEngine(self.p, device_index, self.FORMAT, self.device_channels(device_index),
+                                         self.RATE, self.CHUNK, self.WINDOW_DURATION, self.calibration_total,
+                                         self.NOISE_PERCENTILE, self.HOP_SIZE or None, self.KEY_BACKEND or None,
+                                         self.extra_devices(device_index), self.CAPTURE_MODE,
+                                         self.LATENCY_BUDGET / 1000, self.ANALYSIS_RATE or None,
+                                         self.session_log_directory() if self.SESSION_LOG else None)
+        except OSError as e:
+            # e.g. the key backend can't be created; the window stays stopped
+            self.capture_failed(e)
+            return
+        self.sync_capture_settings()
+
+        # Noise floors from earlier sessions on the same devices, so they don't need calibrating
+        noise_levels = [self.calibration_cache.load(self.calibration_key(index), channels)
+                        for index, channels in self.capture.sources]
+        self.threshold = None
+        if (noise_levels[0] is None and self.legacy_threshold is not None
+                and self.mic_combo.currentText() == self.configured_microphone):
+            self.threshold = self.legacy_threshold
+        self.legacy_threshold = None
+
         if self.manual_threshold_checkbox.isChecked():
             self.threshold = self.manual_threshold_slider.value()
             self.status_label.setText(f"Monitoring audio... Manual Threshold: {self.threshold:.2f} dB")
             self.statusBar.showMessage("Monitoring with Manual Threshold")
         else:
-            if self.threshold is None:
+            if self.threshold is None and any(levels is None for levels in noise_levels):
                 self.is_calibrating = True
-                self.calibration_samples = 0
                 self.status_label.setText("Calibrating noise floor... Please remain silent.")
                 self.statusBar.showMessage("Calibrating...")
             else:
                 self.status_label.setText("Monitoring audio...")
                 self.statusBar.showMessage("Monitoring")
 
+        self.rendered_seq = None
+        self.rendered_text.clear()
+        self.audio_meter.reset()
+        try:
+            self.capture.start(self.threshold, noise_levels)
+        except OSError as e:
+            self.capture.stop()
+            self.capture_failed(e)
+            return
+        self.calibration_saved_at = time.monotonic()
+        self.tracer = self.capture.tracer
+        self.history_view.set_history(self.capture.history)
+        self.export_trace_button.setEnabled(True)
+        self.timer.start(self.UPDATE_INTERVAL)
+        self.is_running = True
+        self.start_stop_button.setText("Stop")
+
+    def capture_failed(self, error):
+        print(f"Error starting audio capture: {str(error)}")
+        self.status_label.setText("Could not start audio capture.")
+        self.statusBar.showMessage("Error")
+        self.capture = None
+        self.is_calibrating = False
+
     def stop_monitoring(self):
         self.timer.stop()
-        if hasattr(self, 'stream'):
-            self.stream.stop_stream()
-            self.stream.close()
+        self.history_view.set_history(None)  # before the DSP worker's shared memory goes away
+        if self.capture is not None:
+            self.capture.stop()
+            self.threshold = self.capture.get_snapshot()['threshold']
+            self.tracer = self.capture.tracer
+            self.save_calibration()
+            self.capture = None
         self.is_running = False
         self.start_stop_button.setText("Start")
         self.status_label.setText("Monitoring stopped")
         self.statusBar.showMessage("Stopped")
 
+    def calibration_key(self, device_index):
+        from calibration_cache import CalibrationCache
+
+        dev = self.p.get_device_info_by_index(device_index)
+        host_api = self.p.get_host_api_info_by_index(dev['hostApi'])['name']
+        return CalibrationCache.device_key(dev['name'], host_api, self.RATE, self.noise_floor_combo.currentData())
+
+    def save_calibration(self):
+        # Only the devices whose noise window is full enough; the file is replaced atomically
+        self.calibration_saved_at = time.monotonic()
+        for (device_index, _), levels in zip(self.capture.sources, self.capture.noise_levels()):
+            if levels is not None:
+                self.calibration_cache.store(self.calibration_key(device_index), levels)
+
     def toggle_test_mode(self, state):
         self.test_mode = bool(state)
+        self.sync_capture_settings()
         if self.test_mode:
             self.statusBar.showMessage("Test Mode Active - No Key Press")
         else:
             self.statusBar.showMessage("Normal Mode - Key Press Active")
 
-    def get_audio_level(self, data):
-        data_float = data.astype(float)
-        normalized = np.abs(data_float) / 32768.0
-        rms = np.sqrt(np.mean(normalized**2))
-        db = 20 * np.log10(max(rms, 1e-10))
-        return db
+    def set_text(self, widget, text):
+        if self.rendered_text.get(widget) != text:
+            self.rendered_text[widget] = text
+            widget.setText(text)
 
-    def update_threshold(self):
-        if self.threshold is None:
-            return None
-        noise_floor = np.median(self.audio_levels)
-        return noise_floor + self.threshold_slider.value()
+    def show_status_message(self, text):
+        if self.rendered_text.get(self.statusBar) != text:
+            self.rendered_text[self.statusBar] = text
+            self.statusBar.showMessage(text)
 
     def update_audio(self):
-        data = np.frombuffer(self.stream.read(self.CHUNK), dtype=np.int16)
-        db_level = self.get_audio_level(data)
-        self.audio_levels.append(db_level)
-        
-        if self.manual_threshold_checkbox.isChecked():
-            self.threshold = self.manual_threshold_slider.value()
+        # Runs at the display rate (UPDATE_INTERVAL) and renders only the
+        # latest snapshot; buffers that arrived in between are coalesced.
+        snapshot = self.capture.get_snapshot()
+        db_level = snapshot['level']
+        if db_level is None or snapshot['seq'] == self.rendered_seq:
+            return
+        self.rendered_seq = snapshot['seq']
+        self.threshold = snapshot['threshold']
+        state = snapshot['state']
+
+        if state == 'calibrating':
+            self.show_status_message(f"Calibrating... {snapshot['calibration_progress']}%")
         elif self.is_calibrating:
-            self.calibration_samples += 1
-            if self.calibration_samples >= self.calibration_total:
-                self.threshold = np.median(self.audio_levels) + self.threshold_slider.value()
-                self.is_calibrating = False
-                self.status_label.setText("Calibration complete. Monitoring audio...")
-                self.statusBar.showMessage("Monitoring")
-            else:
-                progress = int((self.calibration_samples / self.calibration_total) * 100)
-                self.statusBar.showMessage(f"Calibrating... {progress}%")
-        else:
-            self.threshold = self.update_threshold()
-        
-        self.level_label.setText(f"Current Level: {db_level:.2f} dB")
-        if self.threshold is not None:
-            self.threshold_display_label.setText(f"Current Threshold: {self.threshold:.2f} dB")
-        
-        # Update audio meter
-        self.audio_meter.setValue(int(db_level))
-        
-        # Update threshold indicator position
+            self.is_calibrating = False
+            self.set_text(self.status_label, "Calibration complete. Monitoring audio...")
+            self.show_status_message("Monitoring")
+
+        self.latency_ticks += 1
+        if self.latency_ticks >= self.LATENCY_REFRESH:
+            self.latency_ticks = 0
+            self.update_latency_label()
+            meter_us, vad_us = snapshot['dsp_cost']
+            cost_text = f"DSP {meter_us:.0f} µs/buffer"
+            if self.spectral_vad_checkbox.isChecked():
+                cost_text += f" + VAD {vad_us:.0f} µs"
+            self.set_text(self.dsp_cost_label, cost_text)
+            self.update_xrun_label()
+            if time.monotonic() - self.calibration_saved_at >= self.CALIBRATION_SAVE_INTERVAL:
+                self.save_calibration()
+
+        if self.isMinimized():
+            return
+
+        self.set_text(self.level_label, f"Current Level: {db_level:.2f} dB")
         if self.threshold is not None:
-            meter_width = self.audio_meter.width()
-            threshold_pos = int((self.threshold - self.audio_meter.minimum()) / (self.audio_meter.maximum() - self.audio_meter.minimum()) * meter_width)
-            self.threshold_indicator.setFixedWidth(threshold_pos)
-        
-        current_time = time.time()
-        timeout_duration = self.timeout_slider.value() / 1000  # Convert ms to seconds
-
-        if self.threshold is not None and db_level > self.threshold:
-            self.last_active_time = current_time
-            if not self.test_mode and not self.ptt_active:
-                win32api.keybd_event(self.ptt_key, 0, 0, 0)
-                self.ptt_active = True
-            self.status_label.setText("Voice detected!" + (" (Test Mode - No Key Press)" if self.test_mode else " Push-to-Talk activated."))
-        elif current_time - self.last_active_time < timeout_duration:
-            # Keep PTT active during timeout period
-            if not self.test_mode and not self.ptt_active:
-                win32api.keybd_event(self.ptt_key, 0, 0, 0)
-                self.ptt_active = True
-            self.status_label.setText("Timeout active" + (" (Test Mode - No Key Press)" if self.test_mode else " - Push-to-Talk still on."))
-        else:
-            if self.ptt_active and not self.test_mode:
-                win32api.keybd_event(self.ptt_key, 0, win32con.KEYEVENTF_KEYUP, 0)
-                self.ptt_active = False
-            if not self.is_calibrating:
-                self.status_label.setText("Monitoring audio..." + (" (Test Mode)" if self.test_mode else ""))
+            self.set_text(self.threshold_display_label, f"Current Threshold: {self.threshold:.2f} dB")
+
+        self.audio_meter.set_values(db_level, self.threshold, time.monotonic())
+        if len(snapshot['channel_levels']) > 1:
+            self.set_text(self.channel_levels_label,
+                          "Channels: " + " / ".join(f"{level:.0f}" for level in snapshot['channel_levels']) + " dB")
+
+        if state == 'voice':
+            self.set_text(self.status_label, "Voice detected!" + (" (Test Mode - No Key Press)" if self.test_mode else " Push-to-Talk activated."))
+        elif state == 'hold':
+            self.set_text(self.status_label, "Timeout active" + (" (Test Mode - No Key Press)" if self.test_mode else " - Push-to-Talk still on."))
+        elif state in ('idle', 'attack'):
+            self.set_text(self.status_label, "Monitoring audio..." + (" (Test Mode)" if self.test_mode else ""))
+
+    def update_latency_label(self):
+        summary = self.capture.latency_summary()
+        parts = []
+        if summary['key'] is not None:
+            parts.append("Key latency p50/p95/p99: {:.0f}/{:.0f}/{:.0f} ms".format(*summary['key']))
+        if summary['decision'] is not None:
+            parts.append("Buffer: {:.0f}/{:.0f}/{:.0f} ms".format(*summary['decision']))
+        queue_latency = self.capture.queue_latency()
+        if queue_latency is not None:
+            parts.append("Inject: {:.1f}/{:.1f}/{:.1f} ms".format(*queue_latency))
+        self.set_text(self.latency_label, " | ".join(parts))
+
+    def update_xrun_label(self):
+        capture = self.capture
+        text = f"Overruns {capture.overruns} | Dropped {capture.dropped_frames / self.RATE * 1000:.0f} ms"
+        if capture.capture_mode == 'blocking':
+            text += f" | Backlog {capture.backlog_frames / self.RATE * 1000:.0f} ms"
+        self.set_text(self.xrun_label, text)
+
+    def export_latency_trace(self):
+        if self.tracer is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Export Latency Trace", "latency_trace.csv", "CSV Files (*.csv)")
+        if not path:
+            return
+        export = self.capture.export_trace if self.capture is not None else self.tracer.export
+        try:
+            export(path, {
+                'rate': self.RATE,
+                'chunk': self.CHUNK,
+                'hop_size': self.HOP_SIZE or self.CHUNK,
+                'analysis_rate': self.ANALYSIS_RATE or self.RATE,
+                'update_interval_ms': self.UPDATE_INTERVAL,
+                'spectral_vad': self.spectral_vad_checkbox.isChecked(),
+                'capture_mode': self.CAPTURE_MODE,
+                'dsp_process': self.DSP_PROCESS,
+            })
+            self.statusBar.showMessage(f"Latency trace exported to {path}")
+        except OSError as e:
+            print(f"Error exporting latency trace: {str(e)}")
+            self.statusBar.showMessage("Error exporting latency trace")
 
     def save_config(self):
         self.config['Settings'] = {
-            'microphone': self.mic_combo.currentText(),
+            'microphone': self.mic_combo.currentText() or self.configured_microphone,
             'ptt_key': str(self.ptt_key),
             'threshold_offset': str(self.threshold_slider.value()),
-            'threshold': str(self.threshold) if self.threshold is not None else '',
             'test_mode': str(self.test_mode),
             'timeout_duration': str(self.timeout_slider.value()),
             'manual_threshold': str(self.manual_threshold_checkbox.isChecked()),
-            'manual_threshold_value': str(self.manual_threshold_slider.value())
+            'manual_threshold_value': str(self.manual_threshold_slider.value()),
+            'noise_window': str(self.WINDOW_DURATION),
+            'noise_percentile': str(self.NOISE_PERCENTILE),
+            'noise_floor': self.noise_floor_combo.currentData(),
+            'level_history': str(self.level_history_checkbox.isChecked()),
+            'hop_size': str(self.HOP_SIZE),
+            'sample_rate': str(self.SAMPLE_RATE),
+            'buffer_ms': str(self.BUFFER_MS),
+            'analysis_rate': str(self.ANALYSIS_RATE),
+            'spectral_vad': str(self.spectral_vad_checkbox.isChecked()),
+            'key_backend': self.KEY_BACKEND,
+            'input_channels': str(self.CHANNELS),
+            'extra_microphones': '|'.join(self.EXTRA_MICROPHONES),
+            'combine_rule': self.combine_combo.currentData(),
+            'channel_weights': ','.join(str(w) for w in self.CHANNEL_WEIGHTS),
+            'attack_hops': str(self.ATTACK_HOPS),
+            'hysteresis': str(self.HYSTERESIS),
+            'capture_mode': self.CAPTURE_MODE,
+            'latency_budget_ms': str(self.LATENCY_BUDGET),
+            'dsp_process': str(self.DSP_PROCESS),
+            'session_log': str(self.SESSION_LOG)
         }
         with open(self.config_file, 'w') as configfile:
             self.config.write(configfile)
@@ -403,13 +833,8 @@ class MagicPTTApp(QMainWindow):
                 if 'Settings' in self.config:
                     settings = self.config['Settings']
                     
-                    # Set microphone
-                    mic_name = settings.get('microphone', '')
-                    mic_index = self.mic_combo.findText(mic_name)
-                    if mic_index >= 0:
-                        self.mic_combo.setCurrentIndex(mic_index)
-                    else:
-                        print(f"Configured microphone '{mic_name}' not found. Using default.")
+                    # Microphone, selected once the devices are listed (see on_audio_ready)
+                    self.configured_microphone = settings.get('microphone', '')
                     
                     # Set PTT key
                     try:
@@ -418,7 +843,7 @@ class MagicPTTApp(QMainWindow):
                         print(f"Invalid ptt_key value in config: {settings.get('ptt_key')}. Using default.")
                         self.ptt_key = 0x56  # Default to 'V'
 
-                    key_name = self.get_key_name(self.ptt_key)
+                    key_name = get_key_name(self.ptt_key)
                     self.ptt_key_button.setText(f"Set Push-to-Talk Key (current: {key_name})")
                     
                     # Set threshold offset
@@ -434,16 +859,14 @@ class MagicPTTApp(QMainWindow):
                         self.threshold_slider.setValue(10)
                     self.update_threshold_label()
                     
-                    # Set threshold
+                    # Thresholds are now kept per device in the calibration cache; a single
+                    # threshold from an older config is still used once for its microphone
                     threshold_str = settings.get('threshold', '')
                     if threshold_str:
                         try:
-                            self.threshold = float(threshold_str)
+                            self.legacy_threshold = float(threshold_str)
                         except ValueError:
                             print(f"Invalid threshold value: {threshold_str}. Will calibrate on start.")
-                            self.threshold = None
-                    else:
-                        self.threshold = None
                     
                     # Load test mode state
                     self.test_mode = settings.getboolean('test_mode', False)
@@ -478,6 +901,140 @@ class MagicPTTApp(QMainWindow):
                             print(f"Invalid manual_threshold_value: {settings.get('manual_threshold_value')}. Using default.")
                             self.manual_threshold_slider.setValue(-30)
                         self.update_manual_threshold_label()
+
+                    # Load spectral voice detection state
+                    self.spectral_vad_checkbox.setChecked(settings.getboolean('spectral_vad', False))
+
+                    # Load key injection backend (checked against the available ones in on_audio_ready)
+                    self.KEY_BACKEND = settings.get('key_backend', '')
+
+                    # Load noise floor window and percentile
+                    try:
+                        noise_window = float(settings.get('noise_window', '5'))
+                        if 1 <= noise_window <= 600:
+                            self.WINDOW_DURATION = noise_window
+                        else:
+                            print(f"Noise window {noise_window} out of range (1-600 s). Using default.")
+                    except ValueError:
+                        print(f"Invalid noise_window value: {settings.get('noise_window')}. Using default.")
+                    try:
+                        noise_percentile = float(settings.get('noise_percentile', '50'))
+                        if 0 <= noise_percentile <= 100:
+                            self.NOISE_PERCENTILE = noise_percentile
+                        else:
+                            print(f"Noise percentile {noise_percentile} out of range (0-100). Using default.")
+                    except ValueError:
+                        print(f"Invalid noise_percentile value: {settings.get('noise_percentile')}. Using default.")
+                    try:
+                        self.level_history_checkbox.setChecked(settings.getboolean('level_history', True))
+                    except ValueError:
+                        print(f"Invalid level_history value: {settings.get('level_history')}. Using default.")
+                    noise_floor_index = self.noise_floor_combo.findData(settings.get('noise_floor', 'median'))
+                    if noise_floor_index >= 0:
+                        self.noise_floor_combo.setCurrentIndex(noise_floor_index)
+                    else:
+                        print(f"Unknown noise_floor '{settings.get('noise_floor')}' (use median or adaptive). Using default.")
+
+                    # Load metering hop size
+                    try:
+                        hop_size = int(settings.get('hop_size', '0'))
+                        if hop_size == 0 or 16 <= hop_size <= 4096:
+                            self.HOP_SIZE = hop_size
+                        else:
+                            print(f"Hop size {hop_size} out of range (0 or 16-4096). Using default.")
+                    except ValueError:
+                        print(f"Invalid hop_size value: {settings.get('hop_size')}. Using default.")
+
+                    # Load sample rate, buffer length and analysis rate
+                    try:
+                        sample_rate = int(settings.get('sample_rate', '0'))
+                        if sample_rate == 0 or 8000 <= sample_rate <= 192000:
+                            self.SAMPLE_RATE = sample_rate
+                        else:
+                            print(f"Sample rate {sample_rate} out of range (0 or 8000-192000). Using default.")
+                    except ValueError:
+                        print(f"Invalid sample_rate value: {settings.get('sample_rate')}. Using default.")
+                    try:
+                        buffer_ms = int(settings.get('buffer_ms', '20'))
+                        if 5 <= buffer_ms <= 200:
+                            self.BUFFER_MS = buffer_ms
+                        else:
+                            print(f"Buffer length {buffer_ms} out of range (5-200 ms). Using default.")
+                    except ValueError:
+                        print(f"Invalid buffer_ms value: {settings.get('buffer_ms')}. Using default.")
+                    try:
+                        analysis_rate = int(settings.get('analysis_rate', '0'))
+                        if analysis_rate == 0 or 8000 <= analysis_rate <= 48000:
+                            self.ANALYSIS_RATE = analysis_rate
+                        else:
+                            print(f"Analysis rate {analysis_rate} out of range (0 or 8000-48000). Using default.")
+                    except ValueError:
+                        print(f"Invalid analysis_rate value: {settings.get('analysis_rate')}. Using default.")
+
+                    # Load multi-channel/multi-microphone settings
+                    try:
+                        input_channels = int(settings.get('input_channels', '1'))
+                        if 1 <= input_channels <= 32:
+                            self.CHANNELS = input_channels
+                        else:
+                            print(f"Input channels {input_channels} out of range (1-32). Using default.")
+                    except ValueError:
+                        print(f"Invalid input_channels value: {settings.get('input_channels')}. Using default.")
+                    self.EXTRA_MICROPHONES = [name for name in settings.get('extra_microphones', '').split('|') if name]
+                    combine_index = self.combine_combo.findData(settings.get('combine_rule', 'any'))
+                    if combine_index >= 0:
+                        self.combine_combo.setCurrentIndex(combine_index)
+                    else:
+                        print(f"Unknown combine_rule '{settings.get('combine_rule')}' (use any, all or weighted). Using default.")
+                    try:
+                        weights = [float(w) for w in settings.get('channel_weights', '').split(',') if w.strip()]
+                        if all(w >= 0 for w in weights):
+                            self.CHANNEL_WEIGHTS = weights
+                        else:
+                            print("Channel weights must not be negative. Using equal weights.")
+                    except ValueError:
+                        print(f"Invalid channel_weights value: {settings.get('channel_weights')}. Using equal weights.")
+
+                    # Load gate attack and hysteresis
+                    try:
+                        attack_hops = int(settings.get('attack_hops', '1'))
+                        if 1 <= attack_hops <= 50:
+                            self.ATTACK_HOPS = attack_hops
+                        else:
+                            print(f"Attack hops {attack_hops} out of range (1-50). Using default.")
+                    except ValueError:
+                        print(f"Invalid attack_hops value: {settings.get('attack_hops')}. Using default.")
+                    try:
+                        hysteresis = float(settings.get('hysteresis', '3'))
+                        if 0 <= hysteresis <= 20:
+                            self.HYSTERESIS = hysteresis
+                        else:
+                            print(f"Hysteresis {hysteresis} out of range (0-20 dB). Using default.")
+                    except ValueError:
+                        print(f"Invalid hysteresis value: {settings.get('hysteresis')}. Using default.")
+
+                    # Load capture mode and latency budget
+                    capture_mode = settings.get('capture_mode', 'callback')
+                    if capture_mode in ('callback', 'blocking'):
+                        self.CAPTURE_MODE = capture_mode
+                    else:
+                        print(f"Unknown capture_mode '{capture_mode}' (use callback or blocking). Using default.")
+                    try:
+                        latency_budget = int(settings.get('latency_budget_ms', '100'))
+                        if 20 <= latency_budget <= 2000:
+                            self.LATENCY_BUDGET = latency_budget
+                        else:
+                            print(f"Latency budget {latency_budget} out of range (20-2000 ms). Using default.")
+                    except ValueError:
+                        print(f"Invalid latency_budget_ms value: {settings.get('latency_budget_ms')}. Using default.")
+                    try:
+                        self.DSP_PROCESS = settings.getboolean('dsp_process', False)
+                    except ValueError:
+                        print(f"Invalid dsp_process value: {settings.get('dsp_process')}. Using default.")
+                    try:
+                        self.SESSION_LOG = settings.getboolean('session_log', False)
+                    except ValueError:
+                        print(f"Invalid session_log value: {settings.get('session_log')}. Using default.")
                 
                 print("Configuration loaded successfully.")
                 self.status_label.setText("Configuration loaded. Ready to start.")
@@ -488,24 +1045,20 @@ class MagicPTTApp(QMainWindow):
             print("No configuration file found. Using default settings.")
             self.status_label.setText("No saved configuration. Will calibrate on start.")
 
-    def get_key_name(self, key_code):
-        """Convert a key code to a readable name."""
-        if 32 <= key_code <= 126:
-            return chr(key_code)
-        for name, value in vars(win32con).items():
-            if name.startswith('VK_') and value == key_code:
-                return name[3:]
-        return f"Unknown ({key_code})"
-    
     def closeEvent(self, event):
         self.stop_monitoring()
         self.save_config()  # Automatically save config on exit
-        self.p.terminate()
+        if self.p is not None:
+            self.p.terminate()
         super().closeEvent(event)  # Call the base class closeEvent
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    app.setStyle('Fusion')
-    window = MagicPTTApp()
+    import multiprocessing
+    multiprocessing.freeze_support()  # the DSP worker process of a frozen build starts here
+    with STARTUP.phase('QApplication'):
+        app = QApplication(sys.argv)
+        app.setStyle('Fusion')
+    with STARTUP.phase('main window'):
+        window = MagicPTTApp()
     window.show()
     sys.exit(app.exec())
@@ -0,0 +1,336 @@
+"""Session recorder for Magic Push-to-Talk.
+
+Logs the level, threshold and gate state of every hop, the gate's press and
+release decisions and the injected key events to a compact binary file, so
+a report like "it cut me off mid-sentence" can be looked at afterwards:
+
+    python session_log.py session_logs/magic_ptt-20261018-120000-000.ptlog
+    python session_log.py LOG --start 120 --end 180 --events
+
+A log is a HEADER_SIZE byte header (MAGIC, then JSON metadata padded with
+spaces) followed by fixed-size RECORDs. Times are on the audio stream clock.
+The audio threads fill one of two preallocated blocks of records; a
+background thread writes a block when it is full (and whatever is pending
+once a second) and starts a new file past max_bytes, keeping the newest
+max_files. If the disk can't keep up, records are dropped and counted
+rather than making the audio thread wait. The reader memory-maps the file
+and works through it in chunks, so hours of log never need to fit in memory.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+
+MAGIC = b'MPTTLOG1'
+HEADER_SIZE = 256
+RECORD = np.dtype([('time', '<f8'), ('level', '<f4'), ('threshold', '<f4'),
+                   ('source', 'u1'), ('state', 'u1'), ('event', 'u1'), ('reserved', 'u1')])
+STATES = ('idle', 'attack', 'voice', 'hold', 'calibrating')
+EVENTS = (None, 'press', 'release', 'key_down', 'key_up')
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+EVENT_CODES = {event: code for code, event in enumerate(EVENTS)}
+KEY_SOURCE = 255  # `source` of key event records
+READ_CHUNK = 1 << 20  # records per pass when summarizing
+
+
+class SessionRecorder:
+    def __init__(self, directory, metadata=None, block_records=4096, max_bytes=32 << 20, max_files=10,
+                 flush_interval=1.0):
+        self.directory = directory
+        self.metadata = dict(metadata or {})
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.blocks = [np.zeros(block_records, dtype=RECORD) for _ in range(2)]
+        self.dropped = 0  # records lost because the writer was behind
+        self.file = None
+        self.path = None
+        self.file_bytes = 0
+        self.file_index = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.running = False
+        self.thread = None
+        self._use_block(0)
+        self.pending = None  # (block index, records) waiting for the writer
+
+    def _use_block(self, index):
+        block = self.blocks[index]
+        self.active = index
+        self.filled = 0
+        # Field views, so add() assigns scalars without looking fields up
+        self._time = block['time']
+        self._level = block['level']
+        self._threshold = block['threshold']
+        self._source = block['source']
+        self._state = block['state']
+        self._event = block['event']
+
+    def start(self):
+        """Open the first log file; raises OSError if it can't be created."""
+        os.makedirs(self.directory, exist_ok=True)
+        self._open()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='SessionLog', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.running = False
+        self.wake.set()
+        self.thread.join(timeout=5.0)
+        self.thread = None
+        if self.dropped:
+            print(f"Session log dropped {self.dropped} records.")
+
+    def channel(self, source):
+        """A hop logger for DetectionEngine.hop_log of input `source`."""
+        return partial(self.add, source)
+
+    def add(self, source, time, level, threshold, state, event=None):
+        with self.lock:
+            i = self.filled
+            if i == len(self._time):
+                if self.pending is not None:
+                    self.dropped += 1
+                    return
+                self.pending = (self.active, i)
+                self._use_block(1 - self.active)
+                self.wake.set()
+                i = 0
+            self._time[i] = time
+            self._level[i] = math.nan if level is None else level
+            self._threshold[i] = math.nan if threshold is None else threshold
+            self._source[i] = source
+            self._state[i] = STATE_CODES[state]
+            self._event[i] = EVENT_CODES[event]
+            self.filled = i + 1
+
+    def add_key(self, time, pressed):
+        self.add(KEY_SOURCE, time, None, None, 'idle', 'key_down' if pressed else 'key_up')
+
+    def _run(self):
+        try:
+            while True:
+                if self.running:
+                    self.wake.wait(self.flush_interval)
+                self.wake.clear()
+                stopping = not self.running
+                with self.lock:
+                    pending = self.pending
+                    if pending is None and self.filled:
+                        pending = self.pending = (self.active, self.filled)
+                        self._use_block(1 - self.active)
+                if pending is not None:
+                    index, count = pending
+                    self._write(self.blocks[index][:count])
+                    with self.lock:
+                        self.pending = None
+                if stopping and not self.filled:
+                    break  # everything added before stop() is on disk
+        except OSError as e:
+            print(f"Error writing session log: {str(e)}")
+        finally:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def _open(self):
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        self.path = os.path.join(self.directory, f"magic_ptt-{stamp}-{self.file_index:03d}.ptlog")
+        self.file_index += 1
+        metadata = dict(self.metadata, created=time.time())
+        header = MAGIC + json.dumps(metadata).encode('utf-8')
+        if len(header) > HEADER_SIZE:
+            header = MAGIC + b'{}'
+        self.file = open(self.path, 'wb')
+        self.file.write(header.ljust(HEADER_SIZE, b' '))
+        self.file_bytes = HEADER_SIZE
+        self._prune()
+
+    def _prune(self):
+        logs = sorted(glob.glob(os.path.join(self.directory, 'magic_ptt-*.ptlog')))
+        for path in logs[:max(len(logs) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Error removing old session log {path}: {str(e)}")
+
+    def _write(self, records):
+        if self.file_bytes + records.nbytes > self.max_bytes and self.file_bytes > HEADER_SIZE:
+            self.file.close()
+            self._open()
+        self.file.write(memoryview(records).cast('B'))
+        self.file.flush()
+        self.file_bytes += records.nbytes
+
+
+def open_log(path):
+    """Return (metadata, records) with the records memory-mapped read-only."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not a Magic PTT session log")
+    metadata = json.loads(header[len(MAGIC):].decode('utf-8').strip() or '{}')
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+    if count <= 0:
+        return metadata, np.zeros(0, dtype=RECORD)
+    return metadata, np.memmap(path, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def select(records, start=None, end=None):
+    """Records between `start` and `end` seconds after the earliest one, in file order.
+
+    Times are not sorted: key records come from the injector thread and
+    several inputs interleave their hops, so this is a mask over the times
+    rather than a binary search.
+    """
+    if not len(records) or (start is None and end is None):
+        return records
+    times = records['time']
+    origin = float(times.min())
+    inside = np.ones(len(records), dtype=bool)
+    if start is not None:
+        inside &= times >= origin + start
+    if end is not None:
+        inside &= times < origin + end
+    return records[inside]
+
+
+def summarize(records):
+    """Counts and key timing of a (memory-mapped) record array, read in chunks."""
+    summary = {'hops': 0, 'calibrating_hops': 0, 'presses': 0, 'releases': 0, 'key_downs': 0, 'key_ups': 0,
+               'held': 0.0, 'longest_hold': 0.0, 'longest_gap': 0.0, 'duration': 0.0}
+    levels = np.zeros(201, dtype=np.int64)  # 1 dB bins from -200 to 0
+    if not len(records):
+        summary['level_percentiles'] = None
+        return summary
+    pressed_at = None
+    last_time = None
+    for first in range(0, len(records), READ_CHUNK):
+        chunk = np.asarray(records[first:first + READ_CHUNK])
+        hops = chunk[chunk['source'] != KEY_SOURCE]
+        summary['hops'] += len(hops)
+        summary['calibrating_hops'] += int((hops['state'] == STATE_CODES['calibrating']).sum())
+        summary['presses'] += int((hops['event'] == EVENT_CODES['press']).sum())
+        summary['releases'] += int((hops['event'] == EVENT_CODES['release']).sum())
+        valid = hops['level'][~np.isnan(hops['level'])]
+        levels += np.bincount(np.clip(np.rint(valid) + 200, 0, 200).astype(np.int64), minlength=201)
+
+        if len(hops):
+            times = hops['time']
+            gaps = np.diff(times) if last_time is None else np.diff(times, prepend=last_time)
+            if len(gaps):
+                summary['longest_gap'] = max(summary['longest_gap'], float(gaps.max()))
+            last_time = float(times[-1])
+
+        keys = chunk[(chunk['source'] == KEY_SOURCE)]
+        for record_time, event in zip(keys['time'].tolist(), keys['event'].tolist()):
+            if event == EVENT_CODES['key_down']:
+                summary['key_downs'] += 1
+                pressed_at = record_time
+            elif pressed_at is not None:
+                summary['key_ups'] += 1
+                held = record_time - pressed_at
+                summary['held'] += held
+                summary['longest_hold'] = max(summary['longest_hold'], held)
+                pressed_at = None
+    summary['duration'] = float(records['time'].max() - records['time'].min())
+    cumulative = np.cumsum(levels)
+    summary['level_percentiles'] = None if not cumulative[-1] else [
+        int(np.searchsorted(cumulative, p / 100 * cumulative[-1])) - 200 for p in (5, 50, 95)]
+    return summary
+
+
+def print_events(records, file=None):
+    origin = float(records['time'].min()) if len(records) else 0.0
+    for first in range(0, len(records), READ_CHUNK):
+        chunk = np.asarray(records[first:first + READ_CHUNK])
+        for record in chunk[chunk['event'] != 0].tolist():
+            record_time, level, threshold, source, _, event, _ = record
+            text = f"{record_time - origin:10.3f}s  {EVENTS[event]:<8}"
+            if source != KEY_SOURCE:
+                text += f"  input {source}  level {level:7.2f} dB  threshold {threshold:7.2f} dB"
+            print(text, file=file)
+
+
+def render(records, width=100, floor=-80.0, file=None):
+    """Print the level (as a sparkline), the threshold and the gate state across `width` columns."""
+    hops = records
+    if not len(hops):
+        return
+    bars = ' ▁▂▃▄▅▆▇█'
+    edges = np.linspace(0, len(hops), min(width, len(hops)) + 1).astype(np.int64)
+    level_line, threshold_line, gate_line = [], [], []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        column = np.asarray(hops[start:stop])
+        column = column[column['source'] != KEY_SOURCE]
+        if not len(column):
+            level_line.append(' ')
+            threshold_line.append(' ')
+            gate_line.append(' ')
+            continue
+        level = np.nanmax(column['level']) if not np.isnan(column['level']).all() else floor
+        position = min(max((level - floor) / -floor, 0.0), 1.0)
+        level_line.append(bars[int(round(position * (len(bars) - 1)))])
+        threshold = column['threshold'][~np.isnan(column['threshold'])]
+        if len(threshold):
+            position = min(max((threshold.mean() - floor) / -floor, 0.0), 1.0)
+            threshold_line.append(bars[int(round(position * (len(bars) - 1)))])
+        else:
+            threshold_line.append('·')
+        states = column['state']
+        if ((states == STATE_CODES['voice']) | (states == STATE_CODES['hold'])).any():
+            gate_line.append('█')
+        elif (states == STATE_CODES['calibrating']).any():
+            gate_line.append('c')
+        else:
+            gate_line.append('·')
+    duration = float(hops['time'].max() - hops['time'].min())
+    print(f"level     |{''.join(level_line)}|  ({floor:.0f} to 0 dB)", file=file)
+    print(f"threshold |{''.join(threshold_line)}|", file=file)
+    print(f"key       |{''.join(gate_line)}|  {duration:.1f} s", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize and render a Magic PTT session log.")
+    parser.add_argument('log', help="a .ptlog file written with session_log = True")
+    parser.add_argument('--start', type=float, help="seconds from the start of the log")
+    parser.add_argument('--end', type=float, help="seconds from the start of the log")
+    parser.add_argument('--events', action='store_true', help="list press/release and key events")
+    parser.add_argument('--width', type=int, default=100, help="columns of the rendered timeline (default: 100)")
+    args = parser.parse_args(argv)
+
+    try:
+        metadata, records = open_log(args.log)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {args.log}: {e}", file=sys.stderr)
+        return 1
+    records = select(records, args.start, args.end)
+    summary = summarize(records)
+    if metadata:
+        print(' '.join(f"{key}={value}" for key, value in metadata.items()))
+    print(f"{len(records)} records, {summary['duration']:.1f} s, {summary['hops']} hops "
+          f"({summary['calibrating_hops']} calibrating), longest gap {summary['longest_gap'] * 1000:.0f} ms")
+    print(f"gate: {summary['presses']} presses, {summary['releases']} releases; "
+          f"key: {summary['key_downs']} down, held {summary['held']:.1f} s, "
+          f"longest {summary['longest_hold']:.1f} s")
+    if summary['level_percentiles'] is not None:
+        print("level p5/p50/p95: {}/{}/{} dB".format(*summary['level_percentiles']))
+    render(records, args.width)
+    if args.events:
+        print_events(records)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""Startup timing for Magic Push-to-Talk.
+
+    python magic_ptt.py --startup-report
+
+prints how long each startup phase took once the window has painted and the
+audio devices are listed, in the spirit of `python -X importtime`:
+
+    startup: phase                     | thread      |  took [ms] | at [ms]
+    startup: imports                   | MainThread  |      120.4 |   120.4
+    ...
+
+`at` is measured from when this module was imported, which is the first
+thing magic_ptt.py does, so interpreter startup itself isn't included.
+"""
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # (name, thread name, start, end); milestones have start None
+        self.lock = threading.Lock()
+
+    def add(self, name, start, end):
+        with self.lock:
+            self.phases.append((name, threading.current_thread().name, start, end))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def since_start(self, name):
+        """Record a phase that started when the timer did (e.g. the imports at the top of a module)."""
+        self.add(name, self.started, time.perf_counter())
+
+    def mark(self, name):
+        """Record a milestone such as the first paint."""
+        self.add(name, None, time.perf_counter())
+
+    def has(self, name):
+        with self.lock:
+            return any(phase[0] == name for phase in self.phases)
+
+    def report(self, file=None):
+        file = file or sys.stderr
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase[3])
+        print(f"startup: {'phase':<28} | {'thread':<12} | {'took [ms]':>10} | {'at [ms]':>9}", file=file)
+        for name, thread, start, end in phases:
+            duration = '' if start is None else f"{(end - start) * 1000:.1f}"
+            print(f"startup: {name:<28} | {thread:<12} | {duration:>10} | {(end - self.started) * 1000:>9.1f}",
+                  file=file)
@@ -0,0 +1,132 @@
+"""Calibration cache tests for calibration_cache.py; run with `python -m pytest`."""
+import configparser
+
+import numpy as np
+import pytest
+
+import calibration_cache
+from calibration_cache import CalibrationCache
+
+
+KEY = CalibrationCache.device_key("Microphone (USB Audio)", "Windows WASAPI", 48000)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time() for the cache module."""
+    now = {'t': 1_760_000_000.0}
+    monkeypatch.setattr(calibration_cache.time, 'time', lambda: now['t'])
+    return now
+
+
+def noise(seed=0, count=500, channels=None):
+    rng = np.random.default_rng(seed)
+    shape = count if channels is None else (count, channels)
+    return rng.normal(-55, 4, shape)
+
+
+def test_histogram_round_trip_keeps_percentiles():
+    cache = CalibrationCache('unused')
+    levels = np.concatenate([noise(), [-90.0, -20.0]])  # long empty runs on both sides
+    text = cache.compress(levels)
+    assert '0*' in text
+    restored = cache.expand(text)
+    assert len(restored) == len(levels)
+    np.testing.assert_array_equal(np.sort(restored),
+                                  np.sort(np.rint(levels / cache.RESOLUTION) * cache.RESOLUTION))
+    for percentile in (5, 25, 50, 75, 95):
+        assert abs(np.percentile(restored, percentile) - np.percentile(levels, percentile)) \
+            <= cache.RESOLUTION / 2 + 1e-9
+
+
+def test_load_after_store(tmp_path, clock):
+    cache = CalibrationCache(str(tmp_path / 'calibration.ini'))
+    mono = noise()
+    cache.store(KEY, mono)
+    loaded = cache.load(KEY)
+    assert loaded.shape == mono.shape
+    np.testing.assert_allclose(np.sort(loaded), np.sort(mono), atol=cache.RESOLUTION / 2 + 1e-9)
+
+    stereo_key = KEY + ' stereo'
+    stereo = noise(1, channels=2)
+    cache.store(stereo_key, stereo)
+    loaded = cache.load(stereo_key, channels=2)
+    assert loaded.shape == stereo.shape
+    for channel in range(2):
+        np.testing.assert_allclose(np.sort(loaded[:, channel]), np.sort(stereo[:, channel]),
+                                   atol=cache.RESOLUTION / 2 + 1e-9)
+    assert cache.load(KEY) is not None  # the first entry is still there
+    assert cache.load(KEY, channels=2) is None  # calibrated with one channel
+    assert cache.load('Unknown | MME | 44100') is None
+
+
+def test_adaptive_entries_are_kept_apart(tmp_path, clock):
+    cache = CalibrationCache(str(tmp_path / 'calibration.ini'))
+    adaptive_key = CalibrationCache.device_key("Microphone (USB Audio)", "Windows WASAPI", 48000, 'adaptive')
+    cache.store(KEY, noise())
+    cache.store(adaptive_key, [-57.0])
+    assert len(cache.load(KEY)) == 500
+    assert cache.load(adaptive_key).tolist() == [-57.0]
+
+
+@pytest.mark.parametrize('section', [
+    "channel_0 = not a histogram",
+    "channel_0 = -60:3,-2,4",
+    "channel_0 = -60:3,0*x,4",
+    "channel_0 = ",
+    "channel_1 = -60:3,4",
+])
+def test_corrupt_entries_are_ignored(tmp_path, clock, section):
+    path = tmp_path / 'calibration.ini'
+    path.write_text(f"[{KEY}]\nupdated = {int(clock['t'])}\n{section}\n", encoding='utf-8')
+    cache = CalibrationCache(str(path))
+    assert cache.load(KEY) is None
+    cache.store(KEY, noise())  # replaced by a good one
+    assert cache.load(KEY) is not None
+
+
+def test_unreadable_file_and_foreign_sections(tmp_path, clock):
+    path = tmp_path / 'calibration.ini'
+    path.write_text("this is not an ini file\n[[[\n", encoding='utf-8')
+    cache = CalibrationCache(str(path))
+    assert cache.load(KEY) is None
+    cache.store(KEY, noise())
+    assert cache.load(KEY) is not None
+
+    # A section written by something else, without an `updated` time, is never loaded and gets dropped
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write("\n[Some other tool]\nchannel_0 = -60:1\n")
+    assert cache.load('Some other tool') is None
+    cache.store(KEY, noise(2))
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(path, encoding='utf-8')
+    assert config.sections() == [KEY]
+
+
+def test_old_entries_expire(tmp_path, clock):
+    cache = CalibrationCache(str(tmp_path / 'calibration.ini'), max_age_days=30)
+    cache.store(KEY, noise())
+    clock['t'] += 29 * 24 * 3600
+    assert cache.load(KEY) is not None
+    clock['t'] += 2 * 24 * 3600
+    assert cache.load(KEY) is None
+    cache.store('Other | MME | 44100', noise(1))
+    config = configparser.ConfigParser(interpolation=None)
+    config.read(cache.path, encoding='utf-8')
+    assert config.sections() == ['Other | MME | 44100']
+
+
+def test_oldest_entries_are_evicted_past_max_entries(tmp_path, clock):
+    cache = CalibrationCache(str(tmp_path / 'calibration.ini'), max_entries=2)
+    for index in range(3):
+        cache.store(f"Mic {index} | MME | 48000", noise(index))
+        clock['t'] += 60
+    assert cache.load("Mic 0 | MME | 48000") is None
+    assert cache.load("Mic 1 | MME | 48000") is not None
+    assert cache.load("Mic 2 | MME | 48000") is not None
+    # Storing an existing entry again refreshes it
+    cache.store("Mic 1 | MME | 48000", noise(4))
+    clock['t'] += 60
+    cache.store("Mic 3 | MME | 48000", noise(3))
+    assert cache.load("Mic 1 | MME | 48000") is not None
+    assert cache.load("Mic 2 | MME | 48000") is None
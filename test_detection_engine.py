@@ -0,0 +1,159 @@
+"""Gate timing tests for detection_engine.py; run with `python -m pytest`."""
+import numpy as np
+import pytest
+
+from detection_engine import (ChannelPercentiles, DetectionEngine, GateStateMachine, MultiChannelPercentile,
+                              SpectralVAD)
+
+
+QUIET = -60.0
+LOUD = -20.0
+
+
+def test_single_loud_hop_presses_without_attack():
+    gate = GateStateMachine(hop=128)
+    assert gate.feed([QUIET, QUIET, LOUD, LOUD], -40) == [(2, 'press')]
+    assert gate.state == 'voice'
+
+
+def test_attack_needs_consecutive_loud_hops():
+    gate = GateStateMachine(hop=128, attack_hops=3)
+    # Two loud hops then a quiet one start the count over
+    levels = [LOUD, LOUD, QUIET, LOUD, LOUD, LOUD, LOUD]
+    assert gate.feed(levels, -40) == [(5, 'press')]
+
+
+def test_attack_count_carries_across_feeds():
+    gate = GateStateMachine(hop=128, attack_hops=3)
+    assert gate.feed([LOUD, LOUD], -40) == []
+    assert gate.state == 'attack'
+    assert gate.feed([LOUD], -40) == [(0, 'press')]
+
+
+def test_hysteresis_keeps_the_gate_open_between_thresholds():
+    gate = GateStateMachine(hop=128)
+    # -45 dB is below the open threshold but above the close threshold
+    levels = [LOUD, -45, -45, -45, QUIET]
+    assert gate.feed(levels, -40, -50) == [(0, 'press'), (4, 'release')]
+
+
+def test_level_between_thresholds_does_not_open():
+    gate = GateStateMachine(hop=128)
+    assert gate.feed([-45] * 8, -40, -50) == []
+    assert gate.state == 'idle'
+
+
+def test_without_hysteresis_the_gate_closes_at_the_open_threshold():
+    gate = GateStateMachine(hop=128)
+    assert gate.feed([LOUD, -45], -40) == [(0, 'press'), (1, 'release')]
+
+
+def test_release_after_hold_frames_of_quiet():
+    gate = GateStateMachine(hop=128, hold_frames=512)
+    levels = [LOUD] + [QUIET] * 6
+    assert gate.feed(levels, -40) == [(0, 'press'), (4, 'release')]
+
+
+def test_loud_hop_during_hold_restarts_the_hold():
+    gate = GateStateMachine(hop=128, hold_frames=512)
+    levels = [LOUD, QUIET, QUIET, QUIET, LOUD] + [QUIET] * 6
+    assert gate.feed(levels, -40) == [(0, 'press'), (8, 'release')]
+
+
+def test_hold_counts_frames_not_hops():
+    gate = GateStateMachine(hop=256, hold_frames=512)
+    assert gate.feed([LOUD, QUIET, QUIET], -40) == [(0, 'press'), (2, 'release')]
+
+
+@pytest.mark.parametrize('hops', [1, 7])
+def test_channel_percentiles_match_the_vectorized_histogram(hops):
+    rng = np.random.default_rng(2)
+    plain = ChannelPercentiles(50, 3)
+    vectorized = MultiChannelPercentile(50, 3)
+    for _ in range(40):
+        levels = rng.normal(-50, 8, (hops, 3))
+        plain.extend(levels)
+        vectorized.extend(levels)
+        assert len(plain) == len(vectorized)
+        np.testing.assert_allclose(plain.value(), vectorized.value())
+        np.testing.assert_allclose(plain.value(90), vectorized.value(90))
+
+
+def test_channel_percentiles_levels_while_a_channel_is_ahead():
+    plain = ChannelPercentiles(50, 3)
+    plain.extend(np.full((4, 3), -50.0))
+    plain.trackers[0].append(-40.0)  # extend() caught halfway on another thread
+    levels = plain.levels()
+    assert levels.shape == (4, 3)
+    np.testing.assert_allclose(levels, -50.0)
+
+
+def hops_of(signal, hop):
+    return signal[:len(signal) // hop * hop].reshape(-1, hop).astype(np.float32)
+
+
+def click_train(rate, frequency=13000, seconds=1.0, seed=3):
+    """1 ms bursts of a high tone every 10 ms over faint noise, like a keyboard's clicks."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    signal = rng.normal(0, 20, len(t))
+    for start in np.arange(0, seconds, 0.01):
+        burst = (t >= start) & (t < start + 0.001)
+        signal[burst] += 8000 * np.sin(2 * np.pi * frequency * t[burst]) * np.hanning(burst.sum())
+    return signal
+
+
+@pytest.mark.parametrize('rate', [44100, 48000])
+def test_decimated_vad_rejects_high_frequency_clicks(rate):
+    rows = hops_of(click_train(rate), 256)
+    clicks = np.abs(rows).max(axis=1) > 1000
+    vad = SpectralVAD(rate, 256, max_hops=len(rows), decimation=3)
+    # Block sums let about 40% through; the background noise alone passes about 0.1% of decimated hops
+    assert vad.analyze(rows)[clicks].mean() < 0.02
+
+
+def test_decimated_vad_still_passes_voiced_sound():
+    rate = 48000
+    t = np.arange(rate) / rate
+    voiced = sum(3000 / k * np.sin(2 * np.pi * 150 * k * t) for k in range(1, 12))
+    rows = hops_of(voiced, 256)
+    vad = SpectralVAD(rate, 256, max_hops=len(rows), decimation=3)
+    assert vad.analyze(rows).all()
+
+
+def synthetic_session(rate, seconds=6.0, seed=1):
+    """Low noise with 0.4 s bursts of a loud tone every 1.5 s, as int16 frames."""
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * rate)
+    signal = rng.normal(0, 30, frames)
+    t = np.arange(frames) / rate
+    for start in np.arange(2.0, seconds - 0.5, 1.5):
+        burst = (t >= start) & (t < start + 0.4)
+        signal[burst] += 8000 * np.sin(2 * np.pi * 300 * t[burst])
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def replay(data, rate, chunk, hop, **settings):
+    # Calibrate over the same number of frames whatever the buffer size
+    detector = DetectionEngine(rate=rate, chunk=chunk, hop_size=hop, calibration_total=16384 // chunk)
+    detector.timeout_duration = 0.3
+    detector.attack_hops = 2
+    detector.hysteresis = 3.0
+    for name, value in settings.items():
+        setattr(detector, name, value)
+    detector.reset()
+    events = []
+    for start in range(0, len(data) - chunk + 1, chunk):
+        events.extend(detector.process(data[start:start + chunk]))
+    return [(event.kind, round(event.time * rate)) for event in events]
+
+
+@pytest.mark.parametrize('settings', [{}, {'vad_enabled': True}, {'noise_tracking': 'adaptive'}])
+def test_replay_events_do_not_depend_on_the_buffer_size(settings):
+    rate = 16000
+    data = synthetic_session(rate)
+    data = data[:len(data) // 4096 * 4096]  # every chunk size sees the same frames
+    expected = replay(data, rate, 256, 128, **settings)
+    assert [kind for kind, _ in expected] == ['press', 'release'] * 3
+    for chunk in (1024, 4096):
+        assert replay(data, rate, chunk, 128, **settings) == expected
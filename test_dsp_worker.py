@@ -0,0 +1,58 @@
+"""DSP worker failure tests for dsp_worker.py; run with `python -m pytest`."""
+import os
+
+import pytest
+
+import dsp_worker
+from dsp_worker import DSPWorkerClient
+
+
+def exit_immediately(conn, *args):
+    os._exit(3)
+
+
+def exit_after_starting(conn, *args):
+    conn.send(('started', None))
+    os._exit(0)
+
+
+def shared_memory_blocks():
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+def make_client():
+    return DSPWorkerClient(None, 0, 8, 1, 16000, 1024, 5, 100)
+
+
+def test_worker_that_exits_before_starting_raises_oserror(monkeypatch):
+    monkeypatch.setattr(dsp_worker, 'worker_main', exit_immediately)
+    before = shared_memory_blocks()
+    client = make_client()
+    with pytest.raises(OSError, match="exited with code 3"):
+        client.start()
+    assert client.process is None and client.conn is None
+    assert client.ring is None and client.history_shm is None
+    assert shared_memory_blocks() == before
+    client.stop()  # nothing left to stop
+
+
+@pytest.mark.parametrize('call', ['configure', 'noise_levels', 'get_snapshot'])
+def test_worker_that_dies_while_monitoring_is_shut_down(monkeypatch, call):
+    monkeypatch.setattr(dsp_worker, 'worker_main', exit_after_starting)
+    before = shared_memory_blocks()
+    client = make_client()
+    client.start()
+    client.process.join(timeout=10)
+    if call == 'configure':
+        client.configure(threshold_offset=12)
+    elif call == 'noise_levels':
+        assert client.noise_levels() == [None]
+    else:
+        client.get_snapshot()
+    assert client.process is None and client.ring is None and client.history_shm is None
+    assert shared_memory_blocks() == before
+    # Later timer ticks see a stopped engine instead of raising
+    client.configure(threshold_offset=12)
+    assert client.noise_levels() == [None]
+    assert client.get_snapshot()['state'] == 'idle'
+    client.stop()
@@ -0,0 +1,138 @@
+"""KeyInjector tests for key_injection.py, against the recording backend; run with `python -m pytest`."""
+import threading
+import time
+
+import pytest
+
+import key_injection
+from key_injection import KeyInjector, RecordingBackend, create_backend
+
+
+VK = 0x56
+
+
+class ThreadRecordingBackend(RecordingBackend):
+    """Also records which thread made each call."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def press(self, vk):
+        self.threads.append(threading.current_thread().name)
+        super().press(vk)
+
+    def release(self, vk):
+        self.threads.append(threading.current_thread().name)
+        super().release(vk)
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def keys(backend):
+    return [(vk, pressed) for vk, pressed, _ in backend.events]
+
+
+@pytest.fixture
+def start_injector():
+    injectors = []
+
+    def make(backend, debounce=0.02):
+        injector = KeyInjector(backend, debounce=debounce)
+        injector.start()
+        injectors.append(injector)
+        return injector
+    yield make
+    for injector in injectors:
+        injector.stop()
+
+
+def test_release_waits_for_the_debounce_window(start_injector):
+    backend = RecordingBackend()
+    injector = start_injector(backend, debounce=0.05)
+    injector.press(VK)
+    assert wait_for(lambda: len(backend.events) == 1)
+    released = time.perf_counter()
+    injector.release(VK)
+    assert wait_for(lambda: len(backend.events) == 2)
+    assert keys(backend) == [(VK, True), (VK, False)]
+    assert backend.events[1][2] - released >= 0.05
+
+
+def test_release_then_press_within_the_window_cancels_out(start_injector):
+    backend = RecordingBackend()
+    injector = start_injector(backend, debounce=0.2)
+    injector.press(VK)
+    assert wait_for(lambda: len(backend.events) == 1)
+    injector.release(VK)
+    injector.press(VK)
+    time.sleep(0.3)
+    assert keys(backend) == [(VK, True)]
+    assert VK in injector.pressed
+
+
+def test_intents_are_applied_in_order_on_the_injector_thread(start_injector):
+    backend = ThreadRecordingBackend()
+    injector = start_injector(backend, debounce=0)
+    for vk in range(0x41, 0x51):
+        injector.press(vk)
+        injector.release(vk)
+    assert wait_for(lambda: len(backend.events) == 32)
+    assert keys(backend) == [(vk, pressed) for vk in range(0x41, 0x51) for pressed in (True, False)]
+    assert set(backend.threads) == {'KeyInjector'}
+
+
+def test_stop_releases_held_keys():
+    backend = RecordingBackend()
+    injector = KeyInjector(backend)
+    injector.start()
+    injector.press(VK)
+    injector.press(VK + 1)
+    assert wait_for(lambda: len(backend.events) == 2)
+    injector.stop()
+    assert sorted(keys(backend)[2:]) == [(VK, False), (VK + 1, False)]
+    assert not injector.pressed
+
+
+def test_pending_release_is_applied_on_stop():
+    backend = RecordingBackend()
+    injector = KeyInjector(backend, debounce=10.0)
+    injector.start()
+    injector.press(VK)
+    assert wait_for(lambda: len(backend.events) == 1)
+    injector.release(VK)
+    time.sleep(0.05)
+    injector.stop()
+    assert keys(backend) == [(VK, True), (VK, False)]
+
+
+def test_held_keys_are_released_at_exit(monkeypatch):
+    registered = []
+    monkeypatch.setattr(key_injection.atexit, 'register', registered.append)
+    monkeypatch.setattr(key_injection.atexit, 'unregister', registered.remove)
+    backend = RecordingBackend()
+    injector = KeyInjector(backend)
+    injector.start()
+    injector.press(VK)
+    assert wait_for(lambda: len(backend.events) == 1)
+    assert registered == [injector.stop]
+    registered[0]()  # what the interpreter runs at exit
+    assert keys(backend) == [(VK, True), (VK, False)]
+    assert registered == []
+
+
+def test_unusable_backend_raises_oserror(monkeypatch):
+    def broken():
+        raise ImportError("No module named 'pynput'")
+    monkeypatch.setitem(key_injection.BACKENDS, 'pynput', broken)
+    with pytest.raises(OSError, match="pynput"):
+        create_backend('pynput')
+    with pytest.raises(OSError, match="unknown key backend"):
+        create_backend('nonexistent')
@@ -0,0 +1,88 @@
+"""Session log round-trip tests for session_log.py; run with `python -m pytest`."""
+import math
+import time
+
+import numpy as np
+
+from detection_engine import DetectionEngine
+from session_log import EVENT_CODES, KEY_SOURCE, STATE_CODES, SessionRecorder, open_log, select
+from test_detection_engine import synthetic_session
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+    return True
+
+
+def record_session(directory, rate=16000, chunk=1024, hop=256):
+    """Run a detector over a synthetic session into a SessionRecorder; return it and what was logged."""
+    recorder = SessionRecorder(directory, {'rate': rate}, block_records=64)  # several buffer swaps
+    recorder.start()
+    hops = []
+    keys = []
+
+    def hop_log(hop_time, level, threshold, state, event):
+        recorder.add(0, hop_time, level, threshold, state, event)
+        hops.append((hop_time, level, threshold, state, event))
+        # Let the writer keep up, so no record is dropped
+        assert wait_for(lambda: recorder.pending is None)
+
+    detector = DetectionEngine(rate, chunk, hop_size=hop, calibration_total=8)
+    detector.hop_log = hop_log
+    detector.reset()
+    data = synthetic_session(rate)
+    for start in range(0, len(data) - chunk + 1, chunk):
+        for event in detector.process(data[start:start + chunk]):
+            # Logged after the whole buffer, so key records are out of time order with the hops
+            recorder.add_key(event.time, event.kind == 'press')
+            keys.append((event.time, event.kind == 'press'))
+    recorder.stop()
+    return recorder, hops, keys
+
+
+def test_recorded_session_reads_back(tmp_path):
+    recorder, hops, keys = record_session(str(tmp_path))
+    assert recorder.dropped == 0
+    metadata, records = open_log(recorder.path)
+    assert metadata['rate'] == 16000
+
+    logged = records[records['source'] == 0]
+    assert len(logged) == len(hops)
+    np.testing.assert_array_equal(logged['time'], [h[0] for h in hops])
+    np.testing.assert_allclose(logged['level'], [h[1] for h in hops], atol=1e-4)
+    thresholds = [math.nan if h[2] is None else h[2] for h in hops]
+    np.testing.assert_allclose(logged['threshold'], thresholds, atol=1e-4)
+    assert logged['state'].tolist() == [STATE_CODES[h[3]] for h in hops]
+    assert logged['event'].tolist() == [EVENT_CODES[h[4]] for h in hops]
+    transitions = [h[4] for h in hops if h[4] is not None]
+    assert transitions == ['press', 'release'] * 3
+
+    key_records = records[records['source'] == KEY_SOURCE]
+    assert key_records['time'].tolist() == [k[0] for k in keys]
+    assert key_records['event'].tolist() == [EVENT_CODES['key_down' if pressed else 'key_up']
+                                             for _, pressed in keys]
+
+
+def test_select_with_unsorted_times(tmp_path):
+    recorder, _, _ = record_session(str(tmp_path))
+    _, records = open_log(recorder.path)
+    times = np.asarray(records['time'])
+    assert (np.diff(times) < 0).any()  # key records sit behind later hops
+    origin = times.min()
+    for start, end in ((None, None), (1.0, None), (None, 3.5), (1.9, 3.6)):
+        selected = select(records, start, end)
+        inside = np.ones(len(records), dtype=bool)
+        if start is not None:
+            inside &= times >= origin + start
+        if end is not None:
+            inside &= times < origin + end
+        assert len(selected) == inside.sum()
+        np.testing.assert_array_equal(selected['time'], times[inside])
+    # Every key event of the range is kept, wherever it sits in the file
+    keys = select(records, 1.9, 3.6)
+    assert (keys['source'] == KEY_SOURCE).sum() == ((records['source'] == KEY_SOURCE)
+                                                    & (times >= origin + 1.9) & (times < origin + 3.6)).sum() > 0
@@ -0,0 +1,426 @@
+"""Parameter sweep for Magic Push-to-Talk over recorded sessions.
+
+    python tune_ptt.py session1.wav session2.wav --offsets 5:20:1 --release 0:2000:100 --write
+
+replays 16-bit WAV recordings through the detection logic for every
+combination of threshold offset, release delay, manual threshold, attack
+and hysteresis, and ranks them by
+
+    false triggers  presses while nobody speaks, per minute
+    onset latency   time from the start of speech until the key is pressed
+    clipped speech  share of the speech the key wasn't held for
+    key-hold time   how long the key was held, in total and outside speech
+
+Speech is marked with an Audacity label track next to the WAV (session1.txt:
+one `start end [text]` line per utterance, in seconds). A session without
+labels is taken as a recording without speech, e.g. of typing or a fan, so
+every press in it counts as a false trigger.
+
+Levels, noise floors and spectral VAD decisions don't depend on the swept
+settings, so they are computed once per session; the gate is then stepped
+hop by hop for all configurations at once, as numpy arrays spread over a
+process pool. Fixed settings (hop size, noise window, VAD ...) come from
+--config, and --write stores the best configuration back into it.
+"""
+import argparse
+import configparser
+import math
+import os
+import sys
+import time
+import warnings
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from detection_engine import DetectionEngine, NoiseFloorTracker, RollingPercentile, read_wav
+
+
+CALIBRATION_BUFFERS = 100  # as in magic_ptt.py
+VAD_BATCH = 256  # hops per spectral VAD call while preparing a session
+
+
+class Session:
+    """Everything about one recording that the swept settings don't change, per hop."""
+
+    def __init__(self, path, levels, floor, calibrated, speech, vad, segments, hop, rate):
+        self.path = path
+        self.levels = levels  # dB per hop
+        self.floor = floor  # noise floor after each hop
+        self.calibrated = calibrated  # automatic threshold valid at this hop
+        self.speech = speech  # labeled speech in this hop
+        self.vad = vad  # spectral VAD says speech (all True without --vad)
+        self.segments = segments  # (first hop, last hop, start time) per labeled utterance
+        self.hop = hop
+        self.rate = rate
+
+    @property
+    def duration(self):
+        return len(self.levels) * self.hop / self.rate
+
+
+def read_labels(path):
+    """Return merged (start, end) seconds from an Audacity label file; [] if there is none."""
+    if not os.path.exists(path):
+        return []
+    intervals = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 2 or line.startswith('\\'):
+                continue  # blank lines and spectral selection rows
+            start, end = float(fields[0]), float(fields[1])
+            if end > start:
+                intervals.append((start, end))
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def prepare_session(path, settings):
+    data, rate = read_wav(path)
+    chunk = max(int(round(rate * settings['buffer_ms'] / 1000)), 64)
+    engine = DetectionEngine(rate, chunk, settings['noise_window'], CALIBRATION_BUFFERS,
+                             settings['noise_percentile'], settings['hop_size'] or None,
+                             analysis_rate=settings['analysis_rate'] or None)
+    hop = engine.HOP
+    hops = len(data) // hop
+    levels = np.empty(hops)
+    vad = np.ones(hops, dtype=bool)
+    for start in range(0, hops, VAD_BATCH):
+        stop = min(start + VAD_BATCH, hops)
+        levels[start:stop] = engine.meter.measure(data[start * hop:stop * hop])
+        if settings['spectral_vad']:
+            vad[start:stop] = engine.vad.analyze(engine.meter.rows)
+
+    speech = np.zeros(hops, dtype=bool)
+    segments = []
+    for start, end in read_labels(os.path.splitext(path)[0] + '.txt'):
+        first, last = int(start * rate // hop), min(int(math.ceil(end * rate / hop)), hops) - 1
+        if segments and first <= segments[-1][1]:
+            first, _, start = segments.pop()  # less than a hop apart: one utterance
+        if first <= last:
+            speech[first:last + 1] = True
+            segments.append((first, last, start))
+
+    # The same noise floor the engine keeps, read after every hop. The adaptive
+    # one depends on when the key is held; take that to be the labeled speech.
+    floor = np.empty(hops)
+    if settings['noise_floor'] == 'adaptive':
+        noise_floor = NoiseFloorTracker(hop / rate, rise_time=settings['noise_window'])
+        for i, (level, held) in enumerate(zip(levels.tolist(), speech.tolist())):
+            noise_floor.append(level, held)
+            floor[i] = noise_floor.value()
+    else:
+        noise_floor = RollingPercentile(settings['noise_window'] * rate / hop, settings['noise_percentile'])
+        for i, level in enumerate(levels.tolist()):
+            noise_floor.append(level)
+            floor[i] = noise_floor.value()
+    calibrated = np.arange(hops) >= math.ceil(engine.calibration_frames / hop) - 1
+    return Session(path, levels, floor, calibrated, speech, vad, segments, hop, rate)
+
+
+def parse_values(text, kind=float):
+    """'5:20:1' (inclusive range) or '1,2,3'."""
+    if ':' in text:
+        start, stop, step = (kind(part) for part in text.split(':'))
+        count = int(round((stop - start) / step)) + 1
+        return [kind(start + i * step) for i in range(max(count, 0))]
+    return [kind(part) for part in text.split(',') if part.strip()]
+
+
+def build_grid(args):
+    """Return a dict of equal-length arrays, one entry per configuration; manual is NaN for automatic."""
+    thresholds = [(offset, math.nan) for offset in args.offsets] + [(0, manual) for manual in args.manual]
+    grid = [(offset, manual, release, attack, hysteresis)
+            for offset, manual in thresholds
+            for release in args.release
+            for attack in args.attack
+            for hysteresis in args.hysteresis]
+    columns = np.array(grid, dtype=float).reshape(-1, 5)
+    return {
+        'offset': columns[:, 0],
+        'manual': columns[:, 1],
+        'release_ms': columns[:, 2],
+        'attack': np.maximum(columns[:, 3].astype(int), 1),
+        'hysteresis': columns[:, 4],
+    }
+
+
+def simulate(session, grid):
+    """Step the gate of every configuration through a session; return its metric sums.
+
+    Mirrors GateStateMachine.step() and DetectionEngine.process_level() with
+    the configurations along the array axis instead of looping over them.
+    """
+    count = len(grid['offset'])
+    automatic = np.isnan(grid['manual'])
+    base = np.where(automatic, grid['offset'], grid['manual'])
+    scale = automatic.astype(float)  # automatic thresholds follow the noise floor
+    hysteresis = grid['hysteresis']
+    attack = grid['attack']
+    hold_frames = np.rint(grid['release_ms'] / 1000 * session.rate).astype(np.int64)
+    hop = session.hop
+
+    is_open = np.zeros(count, dtype=bool)
+    loud = np.zeros(count, dtype=np.int64)
+    quiet = np.zeros(count, dtype=np.int64)
+    heard_speech = np.zeros(count, dtype=bool)  # the current press overlapped labeled speech
+    waiting = np.zeros(count, dtype=bool)  # speech started, key not pressed yet
+    held = np.zeros(count)
+    held_in_speech = np.zeros(count)
+    presses = np.zeros(count)
+    false_triggers = np.zeros(count)
+    onsets = np.full((len(session.segments), count), np.nan)
+    threshold = np.empty(count)
+    above_open = np.empty(count, dtype=bool)
+    above_close = np.empty(count, dtype=bool)
+
+    segment_starts = {first: j for j, (first, _, _) in enumerate(session.segments)}
+    segment = None
+    floor = session.floor.tolist()
+    calibrated = session.calibrated.tolist()
+    gated = session.vad.tolist()
+    speech = session.speech.tolist()
+    for i, level in enumerate(session.levels.tolist()):
+        if i in segment_starts:
+            segment = segment_starts[i]
+            waiting[:] = ~is_open
+            onsets[segment, is_open] = 0.0
+
+        np.multiply(scale, floor[i], out=threshold)
+        threshold += base
+        if gated[i]:
+            np.less(threshold, level, out=above_open)
+            threshold -= hysteresis
+            np.less(threshold, level, out=above_close)
+            if not calibrated[i]:
+                above_open &= ~automatic
+                above_close &= ~automatic
+        else:
+            above_open[:] = False
+            above_close[:] = False
+
+        # Open gates: stay open while above the close threshold, else count the release delay
+        quiet = np.where(is_open & ~above_close, quiet + hop, 0)
+        release = is_open & (quiet >= hold_frames) & ~above_close
+        # Closed gates: count loud hops until the attack is reached
+        loud = np.where(~is_open & above_open, loud + 1, 0)
+        press = loud >= attack
+        loud[press] = 0
+        quiet[release] = 0
+
+        false_triggers += release & ~heard_speech
+        is_open = (is_open & ~release) | press
+        presses += press
+        heard_speech[press] = False
+        if speech[i]:
+            heard_speech |= is_open
+            held_in_speech += is_open
+        held += is_open
+
+        if segment is not None:
+            pressed = waiting & is_open
+            onsets[segment, pressed] = (i + 1) * hop / session.rate - session.segments[segment][2]
+            waiting &= ~is_open
+            if i == session.segments[segment][1]:
+                segment = None
+    false_triggers += is_open & ~heard_speech  # still held at the end of the recording
+
+    seconds = hop / session.rate
+    return {
+        'presses': presses,
+        'false_triggers': false_triggers,
+        'held': held * seconds,
+        'held_in_speech': held_in_speech * seconds,
+        'onsets': onsets,
+    }
+
+
+SESSIONS = []
+
+
+def init_worker(sessions):
+    SESSIONS[:] = sessions
+
+
+def evaluate(grid):
+    """Metric sums over all sessions for one slice of the grid (runs in a pool worker)."""
+    totals = None
+    onsets = []
+    for session in SESSIONS:
+        result = simulate(session, grid)
+        onsets.append(result.pop('onsets'))
+        if totals is None:
+            totals = result
+        else:
+            for key, value in result.items():
+                totals[key] += value
+    totals['onsets'] = np.concatenate(onsets) if onsets else np.empty((0, len(grid['offset'])))
+    return totals
+
+
+def sweep(sessions, grid, jobs):
+    count = len(grid['offset'])
+    slices = np.array_split(np.arange(count), max(min(jobs * 4, count), 1))
+    parts = [{key: values[part] for key, values in grid.items()} for part in slices]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(sessions,)) as pool:
+            results = list(pool.map(evaluate, parts))
+    else:
+        init_worker(sessions)
+        results = [evaluate(part) for part in parts]
+    return {key: np.concatenate([result[key] for result in results], axis=-1) for key in results[0]}
+
+
+def score(sessions, results, false_weight, hold_weight):
+    """Add the summary metrics and a score (lower is better) to `results`."""
+    total = sum(session.duration for session in sessions)
+    speech = sum(session.speech.sum() * session.hop / session.rate for session in sessions)
+    silence = max(total - speech, 1e-9)
+    onsets = results['onsets']
+    detected = ~np.isnan(onsets)
+    results['false_per_min'] = results['false_triggers'] / max(total / 60, 1e-9)
+    results['missed'] = (~detected).sum(axis=0)
+    results['clipped_pct'] = (1 - results['held_in_speech'] / speech) * 100 if speech else np.zeros_like(
+        results['held'])
+    results['noise_hold_pct'] = (results['held'] - results['held_in_speech']) / silence * 100
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # configurations that never pressed
+        results['onset_ms'] = np.nanmedian(onsets, axis=0) * 1000 if len(onsets) else np.full(
+            len(results['held']), np.nan)
+    results['score'] = (results['clipped_pct'] + false_weight * results['false_per_min']
+                        + hold_weight * results['noise_hold_pct'])
+    return results
+
+
+def load_settings(path):
+    """Fixed settings from a magic_ptt_config.ini, with the app's defaults."""
+    settings = {'buffer_ms': 20, 'hop_size': 0, 'noise_window': 5.0, 'noise_percentile': 50.0,
+                'noise_floor': 'median', 'analysis_rate': 0, 'spectral_vad': False, 'attack_hops': 1,
+                'hysteresis': 3.0}
+    config = configparser.ConfigParser()
+    if path and os.path.exists(path):
+        config.read(path)
+    if 'Settings' not in config:
+        return settings
+    section = config['Settings']
+    for key, kind in (('buffer_ms', int), ('hop_size', int), ('noise_window', float), ('noise_percentile', float),
+                      ('analysis_rate', int), ('attack_hops', int), ('hysteresis', float)):
+        try:
+            settings[key] = kind(section.get(key, str(settings[key])))
+        except ValueError:
+            print(f"Invalid {key} value: {section.get(key)}. Using default.")
+    if section.get('noise_floor', 'median') in DetectionEngine.NOISE_TRACKING:
+        settings['noise_floor'] = section.get('noise_floor', 'median')
+    else:
+        print(f"Unknown noise_floor '{section.get('noise_floor')}' (use median or adaptive). Using default.")
+    try:
+        settings['spectral_vad'] = section.getboolean('spectral_vad', False)
+    except ValueError:
+        print(f"Invalid spectral_vad value: {section.get('spectral_vad')}. Using default.")
+    return settings
+
+
+def write_settings(path, grid, best):
+    """Store one configuration in the [Settings] section that MagicPTTApp.load_config() reads."""
+    config = configparser.ConfigParser()
+    if os.path.exists(path):
+        config.read(path)
+    if 'Settings' not in config:
+        config['Settings'] = {}
+    section = config['Settings']
+    manual = grid['manual'][best]
+    section['manual_threshold'] = str(not math.isnan(manual))
+    if math.isnan(manual):
+        section['threshold_offset'] = str(int(round(grid['offset'][best])))
+    else:
+        section['manual_threshold_value'] = str(int(round(manual)))
+    section['timeout_duration'] = str(int(round(grid['release_ms'][best])))
+    section['attack_hops'] = str(int(grid['attack'][best]))
+    section['hysteresis'] = f"{grid['hysteresis'][best]:g}"
+    with open(path, 'w') as configfile:
+        config.write(configfile)
+
+
+def describe(grid, i):
+    manual = grid['manual'][i]
+    threshold = f"offset {grid['offset'][i]:4.0f} dB" if math.isnan(manual) else f"manual {manual:4.0f} dB"
+    return (f"{threshold}  release {grid['release_ms'][i]:5.0f} ms  attack {grid['attack'][i]}  "
+            f"hysteresis {grid['hysteresis'][i]:3g} dB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep Magic PTT settings over recorded sessions.")
+    parser.add_argument('wav', nargs='+', help="16-bit PCM WAV recordings, with optional Audacity labels (.txt)")
+    parser.add_argument('--config', default='magic_ptt_config.ini',
+                        help="settings file for the fixed settings and --write (default: magic_ptt_config.ini)")
+    parser.add_argument('--offsets', default='5:20:1', help="threshold offsets in dB, start:stop:step or a,b,c "
+                                                           "(default: 5:20:1)")
+    parser.add_argument('--release', default='0:2000:100', help="release delays in ms (default: 0:2000:100)")
+    parser.add_argument('--manual', default='', help="manual thresholds in dB to try as well, e.g. --manual=-50:-30:5 (default: none)")
+    parser.add_argument('--attack', help="attack hops (default: attack_hops from --config)")
+    parser.add_argument('--hysteresis', help="hysteresis in dB (default: hysteresis from --config)")
+    parser.add_argument('--false-weight', type=float, default=5.0,
+                        help="score points per false trigger a minute (default: 5)")
+    parser.add_argument('--hold-weight', type=float, default=0.5,
+                        help="score points per %% of non-speech time the key is held (default: 0.5)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="worker processes (default: all CPUs)")
+    parser.add_argument('--top', type=int, default=10, help="configurations to list (default: 10)")
+    parser.add_argument('--write', action='store_true', help="store the best configuration in --config")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.config)
+    try:
+        args.offsets = parse_values(args.offsets)
+        args.release = parse_values(args.release)
+        args.manual = parse_values(args.manual)
+        args.attack = parse_values(args.attack, int) if args.attack else [settings['attack_hops']]
+        args.hysteresis = parse_values(args.hysteresis) if args.hysteresis else [settings['hysteresis']]
+    except ValueError as e:
+        parser.error(f"invalid range: {e}")
+
+    started = time.perf_counter()
+    sessions = []
+    for path in args.wav:
+        try:
+            sessions.append(prepare_session(path, settings))
+        except (OSError, EOFError, wave.Error, ValueError) as e:
+            print(f"Error reading {path}: {e}", file=sys.stderr)
+            return 1
+    prepared = time.perf_counter()
+
+    grid = build_grid(args)
+    count = len(grid['offset'])
+    if not count:
+        parser.error("the grid is empty")
+    results = score(sessions, sweep(sessions, grid, args.jobs), args.false_weight, args.hold_weight)
+    finished = time.perf_counter()
+
+    labeled = sum(len(session.segments) for session in sessions)
+    total = sum(session.duration for session in sessions)
+    print(f"{len(sessions)} sessions, {total:.1f} s, {labeled} labeled utterances; "
+          f"prepared in {(prepared - started) * 1000:.0f} ms, {count} configurations in "
+          f"{(finished - prepared) * 1000:.0f} ms on {args.jobs} processes")
+    print(f"{'':<68} {'score':>7} {'false/min':>9} {'onset ms':>8} {'missed':>6} {'clipped %':>9} "
+          f"{'held s':>7} {'noise %':>7}")
+    order = np.argsort(results['score'], kind='stable')
+    for i in order[:args.top]:
+        onset = results['onset_ms'][i]
+        print(f"{describe(grid, i):<68} {results['score'][i]:7.2f} {results['false_per_min'][i]:9.2f} "
+              f"{'-' if math.isnan(onset) else f'{onset:.0f}':>8} {results['missed'][i]:6d} "
+              f"{results['clipped_pct'][i]:9.1f} {results['held'][i]:7.1f} {results['noise_hold_pct'][i]:7.1f}")
+
+    if args.write:
+        write_settings(args.config, grid, order[0])
+        print(f"Best configuration written to {args.config}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())